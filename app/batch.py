@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+import logic
+from config import EXCLUSION_STORE_DIR, COLL_HISTORY_SAVE, COLL_HISTORY_DIR, SRC_CACHE_DIR
+from models.Collection import CmsColl, BankColl
+from models.CmsFileHelper import CmsFileHelper
+from models.CollectionHistory import CollectionHistory
+from models.ExclusionStore import ExclusionStore
+
+# same shape as App.get_all_criteria, used for keys missing in a manifest job
+DEF_CRITERIA = {
+    'size_min': None,
+    'size_max': None,
+    'extra_input': '',
+    'cat_id': None,
+    'cluster': None,
+    'price_min': '',
+    'price_max': '',
+    'sort_first': '',
+    'sort_next': '',
+    'ratio': None,
+    'interleave': None,
+    'max_per_seller': None,
+    'exclude_used': False,
+    'out_of_stock': False
+}
+
+
+def load_manifest(manifest_f_path: str):
+    if manifest_f_path.endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError('TOML manifests need Python 3.11+. Please use a JSON manifest.')
+        with open(manifest_f_path, 'rb') as manifest_f:
+            manifest = tomllib.load(manifest_f)
+    else:
+        with open(manifest_f_path) as manifest_f:
+            manifest = json.load(manifest_f)
+
+    jobs = manifest.get('jobs', [])
+    if len(jobs) == 0:
+        raise ValueError(f'No jobs found in manifest: {manifest_f_path}')
+
+    # relative paths in manifest are relative to the manifest itself
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_f_path))
+    for i, job in enumerate(jobs):
+        if job.get('end_date'):
+            try:
+                job['end_date'] = logic.validate_end_date(job['end_date'])
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid end_date of job {job.get('coll_id', i)}: {e}")
+        for key in ['source', 'output', 'full_output']:
+            if job.get(key):
+                job[key] = os.path.join(manifest_dir, job[key])
+        if job.get('criteria', {}).get('extra_input_file'):
+            job['criteria']['extra_input_file'] = os.path.join(manifest_dir, job['criteria']['extra_input_file'])
+
+    return jobs
+
+
+def get_job_criteria(job: dict):
+    criteria = dict(DEF_CRITERIA)
+    criteria.update(job.get('criteria', {}))
+
+    if criteria['size_max']:
+        criteria['size_max'] = logic.validate_size(criteria['size_max'])
+    if criteria['max_per_seller']:
+        criteria['max_per_seller'] = logic.validate_size(criteria['max_per_seller'])
+
+    # extra input can be pasted text, same as +Input, already split seller/product lists or a file with pairs
+    extra_input_f_path = criteria.pop('extra_input_file', None)
+    messages = []
+    if extra_input_f_path:
+        criteria['extra_input'] = logic.validate_extra_input_f(extra_input_f_path, messages=messages)
+        if criteria['extra_input'] is None:
+            raise ValueError(f"No seller and product id pairs found in: {extra_input_f_path}. {' '.join(messages)}")
+    elif isinstance(criteria['extra_input'], str) and criteria['extra_input'] != '':
+        criteria['extra_input'] = logic.validate_extra_input(criteria['extra_input'], messages=messages)
+        if criteria['extra_input'] is None:
+            raise ValueError(f"No seller and product id pairs found in extra_input. {' '.join(messages)}")
+
+    prices = logic.validate_price_points({'min': criteria['price_min'], 'max': criteria['price_max']})
+    criteria['price_min'], criteria['price_max'] = prices['min'], prices['max']
+
+    return criteria
+
+
+# with an end_date, product ids of the saved collection are registered in exclusion_store until that date. Upload
+# file written is recorded in history, if given.
+def save_job(job: dict, coll, exclusion_store: ExclusionStore = None, history: CollectionHistory = None):
+    messages = list(coll.get_messages())
+
+    if coll.get_df_size() == 0:
+        messages.append('Created collection is empty. Not saving file.')
+        return False, 0, messages
+
+    fh = CmsFileHelper(job.get('coll_id', ''))
+    fh.upload_f_path = job['output']
+    fh.history = history
+    if 'trace' in job:
+        fh.save_trace = bool(job['trace'])
+    # upload and full file are written together, from the same rows
+    if not fh.prepare_upload_and_full_f(coll, job.get('full_output') or None):
+        messages.extend(fh.messages)
+        messages.append('Failed to generate collection file(s).')
+        return False, 0, messages
+
+    if job.get('end_date') and exclusion_store is not None:
+        exclusion_store.register(coll.get_column('product_id').to_numpy(), job['end_date'])
+
+    return True, coll.get_df_size(), messages
+
+
+def run_job(job: dict, src_type: str, src_df, exclusion_store: ExclusionStore = None,
+            history: CollectionHistory = None):
+    coll_cls = CmsColl if src_type == 'cms' else BankColl
+    coll = coll_cls(src_df)
+    coll.set_exclusion_store(exclusion_store)
+    coll.process_by_criteria(get_job_criteria(job))
+    return save_job(job, coll, exclusion_store, history)
+
+
+# all jobs of a shared source are generated in one fan-out over the parsed source and saved on a thread pool, every
+# job to its own files. Jobs are generated at the same time, so they only exclude products registered before the run,
+# not each other's.
+def run_shared_jobs(jobs: list, src_type: str, src_df, max_workers: int = None,
+                    exclusion_store: ExclusionStore = None, history: CollectionHistory = None):
+    criteria_list = []
+    outcomes = [None] * len(jobs)
+    for i, job in enumerate(jobs):
+        try:
+            criteria_list.append(get_job_criteria(job))
+        except Exception as e:
+            criteria_list.append(None)
+            outcomes[i] = (False, 0, [f'Failure in collection generation process. {e}'])
+
+    valid_jobs = [i for i, criteria in enumerate(criteria_list) if criteria is not None]
+    coll_cls = CmsColl if src_type == 'cms' else BankColl
+    colls = coll_cls.process_many(src_df, [criteria_list[i] for i in valid_jobs], max_workers=max_workers,
+                                  exclusion_store=exclusion_store)
+
+    def save(i, coll):
+        try:
+            return save_job(jobs[i], coll, exclusion_store, history)
+        except Exception as e:
+            return False, 0, [f'Failure in collection generation process. {e}']
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for i, outcome in zip(valid_jobs, executor.map(save, valid_jobs, colls)):
+            outcomes[i] = outcome
+
+    return outcomes
+
+
+def run_batch(jobs: list, max_workers: int = None, exclusion_store: ExclusionStore = None,
+              history: CollectionHistory = None, cache_dir: str = SRC_CACHE_DIR):
+    src_jobs = {}
+    for i, job in enumerate(jobs):
+        src_jobs.setdefault(job.get('source'), []).append(i)
+
+    outcomes = [None] * len(jobs)
+    src_sizes = {}
+    results = []
+    totals = {
+        'collections': 0,
+        'failed': 0,
+        'src_rows': 0,
+        'rows': 0
+    }
+    start_t = perf_counter()
+
+    for src_f_path, job_ids in src_jobs.items():
+        # jobs sharing a source file parse it only once, a source used by a single job is streamed in chunks with
+        # the job's filters pushed down
+        is_src_shared = len(job_ids) > 1
+        # columns left untyped and cache failures are listed with messages of every job of the source
+        src_report = {'messages': []}
+        try:
+            if is_src_shared:
+                src_type, src_df = logic.validate_src(src_f_path, report=src_report, cache_dir=cache_dir)
+            else:
+                src_type, src_df = logic.validate_src(src_f_path, criteria=get_job_criteria(jobs[job_ids[0]]),
+                                                      report=src_report)
+        except Exception as e:
+            src_type, src_df = f'Failure in collection generation process. {e}', None
+
+        if src_df is None:
+            for i in job_ids:
+                outcomes[i] = (False, 0, [src_type])
+            continue
+
+        # rows of the whole source, also if a single job's filters were pushed down
+        src_sizes[src_f_path] = src_report['src_rows']
+        if is_src_shared:
+            for i, outcome in zip(job_ids, run_shared_jobs([jobs[i] for i in job_ids], src_type, src_df,
+                                                           max_workers, exclusion_store, history)):
+                outcomes[i] = outcome
+        else:
+            try:
+                outcomes[job_ids[0]] = run_job(jobs[job_ids[0]], src_type, src_df, exclusion_store,
+                                               history)
+            except Exception as e:
+                outcomes[job_ids[0]] = (False, 0, [f'Failure in collection generation process. {e}'])
+        for i in job_ids:
+            is_success, rows, messages = outcomes[i]
+            outcomes[i] = (is_success, rows, src_report['messages'] + messages)
+
+    for i, job in enumerate(jobs):
+        job_id = job.get('coll_id', i)
+        is_success, rows, messages = outcomes[i]
+
+        for message in messages:
+            print(f'Job {job_id}: {message}')
+
+        results.append((job_id, is_success))
+        if is_success:
+            totals['collections'] += 1
+            totals['src_rows'] += src_sizes[job.get('source')]
+            totals['rows'] += rows
+        else:
+            totals['failed'] += 1
+
+    totals['elapsed_s'] = perf_counter() - start_t
+    return results, totals
+
+
+def print_summary(totals: dict):
+    elapsed_t = max(totals['elapsed_s'], 1e-9)
+    print(f"Generated {totals['collections']} collection(s), {totals['failed']} failed, "
+          f"in {totals['elapsed_s']:.2f} s.")
+    print(f"Throughput: {totals['collections'] / elapsed_t:.2f} collections/s, "
+          f"{totals['src_rows'] / elapsed_t:.0f} source rows/s, {totals['rows'] / elapsed_t:.0f} output rows/s.")
+
+
+def main(argv: list = None):
+    arg_parser = argparse.ArgumentParser(description='Generate collections from a JSON or TOML job manifest.')
+    arg_parser.add_argument('manifest', help='path to .json or .toml manifest with a list of jobs')
+    arg_parser.add_argument('--workers', type=int, default=None,
+                            help='threads generating and saving collections of a shared source')
+    arg_parser.add_argument('--trace', action='store_true',
+                            help="save every collection's stage trace as JSON next to its upload file")
+    arg_parser.add_argument('--exclusions', default=EXCLUSION_STORE_DIR,
+                            help='directory of the store of products used by running collections')
+    arg_parser.add_argument('--cache', default=SRC_CACHE_DIR,
+                            help='directory of the cache of parsed sources shared by jobs')
+    arg_parser.add_argument('--history', nargs='?', const=COLL_HISTORY_DIR,
+                            default=COLL_HISTORY_DIR if COLL_HISTORY_SAVE else None,
+                            help='record upload files in the history in this directory, COLL_HISTORY_DIR if not given')
+    args = arg_parser.parse_args(argv)
+
+    try:
+        jobs = load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f'ERROR: {e}')
+        return 2
+
+    if args.trace:
+        for job in jobs:
+            job.setdefault('trace', True)
+
+    # store is only opened when a job excludes used products or registers its own
+    exclusion_store = None
+    if any(job.get('end_date') or job.get('criteria', {}).get('exclude_used') for job in jobs):
+        exclusion_store = ExclusionStore(args.exclusions)
+
+    history = None
+    if args.history:
+        history = CollectionHistory(args.history)
+
+    results, totals = run_batch(jobs, args.workers, exclusion_store, history, args.cache)
+    print_summary(totals)
+    return 0 if totals['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
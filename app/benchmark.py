@@ -0,0 +1,284 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+from time import perf_counter
+import numpy as np
+import pandas as pd
+import logic
+from models.Collection import CmsColl, BankColl
+from models.CmsFileHelper import CmsFileHelper
+from models.DummyDataGenerator import DummyDataGenerator
+from batch import DEF_CRITERIA
+
+DEF_SIZES = [10000, 100000, 1000000, 10000000]
+DEF_SEED = 1
+# extra input pasted with +Input, half of it products already in the source
+EXTRA_INPUT_SIZE = 1000
+# a stage regresses when it's slower than baseline by more than threshold and at least MIN_DELTA_S, so stages
+# taking milliseconds don't fail on noise
+DEF_THRESHOLD = 0.2
+MIN_DELTA_S = 0.01
+
+# same criteria for every size, so each stage keeps a similar share of rows as sources grow
+PIPELINE_CRITERIA = {
+    'cms': {
+        'price_min': 100,
+        'price_max': 800,
+        'sort_first': 'ado',
+        'sort_next': 'rating',
+        'ratio': {'local': 3, 'offshore': 2},
+        'out_of_stock': True
+    },
+    'bank': {
+        'cluster': 'Fashion',
+        'cat_id': [1, 2, 3, 4, 5, 6],
+        'price_min': 100,
+        'price_max': 800,
+        'sort_first': 'ado',
+        'sort_next': 'discount',
+        'ratio': {'local': 3, 'offshore': 2}
+    }
+}
+
+
+def get_src_f_path(src_dir: str, src_type: str, size: int, seed: int):
+    return os.path.join(src_dir, f'{src_type}_{size}_{seed}_bench.csv')
+
+
+# generated sources are kept in src_dir and reused by later runs with the same type, size and seed
+def prepare_src(src_dir: str, src_type: str, size: int, seed: int):
+    src_f_path = get_src_f_path(src_dir, src_type, size, seed)
+    if not os.path.exists(src_f_path):
+        DummyDataGenerator(src_type, size, seed).save(src_f_path)
+    return src_f_path
+
+
+def get_extra_input(src_df: pd.DataFrame, coll_cls, seed: int):
+    columns = coll_cls(src_df.iloc[:0]).columns
+    rng = np.random.default_rng(seed)
+    in_src = rng.choice(len(src_df), min(EXTRA_INPUT_SIZE // 2, len(src_df)), replace=False)
+    # new product ids are above the generator's id range
+    new_product_ids = 100000000 + np.arange(EXTRA_INPUT_SIZE - len(in_src))
+    return {
+        'seller_id': np.concatenate([src_df[columns['seller_id']].to_numpy()[in_src],
+                                     rng.integers(100000, 999999, len(new_product_ids))]).tolist(),
+        'product_id': np.concatenate([src_df[columns['product_id']].to_numpy()[in_src], new_product_ids]).tolist()
+    }
+
+
+def get_pipeline_criteria(src_type: str, extra_input: dict):
+    criteria = dict(DEF_CRITERIA)
+    criteria.update(PIPELINE_CRITERIA[src_type])
+    criteria['extra_input'] = extra_input
+    return criteria
+
+
+# best wall time of repeat runs of stage, every run on what setup returns. Setup isn't timed.
+def time_stage(stage, setup, repeat: int):
+    best_t = None
+    for _ in range(repeat):
+        args = setup()
+        start_t = perf_counter()
+        stage(*args)
+        elapsed_t = perf_counter() - start_t
+        best_t = elapsed_t if best_t is None else min(best_t, elapsed_t)
+    return best_t
+
+
+# peak resident set size of this process in bytes, None where resource isn't available (Windows)
+def get_peak_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def run_case(src_f_path: str, src_type: str, size: int, seed: int, repeat: int):
+    out_dir = tempfile.mkdtemp()
+    coll_cls = CmsColl if src_type == 'cms' else BankColl
+    stages = {}
+
+    stages['validate_src'] = time_stage(lambda: logic.validate_src(src_f_path, use_cache=False), tuple, repeat)
+    src_type, src_df = logic.validate_src(src_f_path, use_cache=False)
+    extra_input = get_extra_input(src_df, coll_cls, seed)
+    criteria = get_pipeline_criteria(src_type, extra_input)
+
+    def new_coll():
+        coll = coll_cls(src_df)
+        # stages on their own work on all rows, not only on the ones that fit a collection
+        coll.size_max = size + EXTRA_INPUT_SIZE
+        return coll,
+
+    # filters one by one, then all of them evaluated together as process_by_criteria does
+    price_filter = lambda coll: coll.filter_by_single_price_points(criteria['price_min'], criteria['price_max'])
+    if src_type == 'cms':
+        stages['remove_out_of_stock'] = time_stage(lambda coll: coll.remove_out_of_stock(), new_coll, repeat)
+    else:
+        stages['filter_by_cluster'] = time_stage(lambda coll: coll.filter_by_cluster(criteria['cluster']),
+                                                 new_coll, repeat)
+        stages['filter_by_cat_allocation'] = time_stage(lambda coll: coll.filter_by_cat_allocation(criteria['cat_id']),
+                                                        new_coll, repeat)
+    stages['filter_by_single_price_points'] = time_stage(price_filter, new_coll, repeat)
+    stages['filter_by_criteria'] = time_stage(lambda coll: coll.filter_by_criteria(criteria), new_coll, repeat)
+
+    stages['sort_by'] = time_stage(lambda coll: coll.sort_by(criteria['sort_first']), new_coll, repeat)
+    stages['shuffle'] = time_stage(lambda coll: coll.shuffle(criteria['ratio']), new_coll, repeat)
+
+    def new_coll_with_extra_input():
+        coll, = new_coll()
+        coll.set_extra_input(extra_input)
+        return coll,
+
+    stages['concat_extra_input'] = time_stage(lambda coll: coll.concat_extra_input(), new_coll_with_extra_input,
+                                              repeat)
+
+    # upload file of all source rows
+    seller_product_ids = new_coll()[0].export_for_upload()
+    fh = CmsFileHelper('bench')
+    fh.paranoid_check = False
+    fh.upload_f_path = os.path.join(out_dir, 'upload_bench.csv')
+    stages['prepare_upload_f'] = time_stage(
+        lambda: fh.prepare_upload_f(seller_product_ids=seller_product_ids), tuple, repeat)
+
+    # end to end, same as Create with full file: parse, generate, write upload and full file
+    def pipeline():
+        pipeline_type, pipeline_df = logic.validate_src(src_f_path, use_cache=False)
+        coll = coll_cls(pipeline_df)
+        coll.process_by_criteria(get_pipeline_criteria(pipeline_type, extra_input))
+        pipeline_fh = CmsFileHelper('bench')
+        pipeline_fh.upload_f_path = os.path.join(out_dir, 'pipeline_upload.csv')
+        pipeline_fh.prepare_upload_and_full_f(coll, os.path.join(out_dir, 'pipeline_full.csv'))
+
+    stages['pipeline'] = time_stage(pipeline, tuple, repeat)
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+    return {
+        'src_type': src_type,
+        'size': size,
+        'seed': seed,
+        'repeat': repeat,
+        'stages': stages,
+        'peak_rss_bytes': get_peak_rss()
+    }
+
+
+# every case runs in a fresh process, so its peak RSS is its own and memory of bigger sources isn't kept around.
+# Sources are generated before that, chunk by chunk.
+def run_benchmark(src_types: list, sizes: list, src_dir: str, seed: int = DEF_SEED, repeat: int = 1):
+    cases = []
+    mp_context = multiprocessing.get_context('spawn')
+    for size in sizes:
+        for src_type in src_types:
+            src_f_path = prepare_src(src_dir, src_type, size, seed)
+            with mp_context.Pool(1) as pool:
+                case = pool.apply(run_case, (src_f_path, src_type, size, seed, repeat))
+            print_case(case)
+            cases.append(case)
+
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'cases': cases
+    }
+
+
+def print_case(case: dict):
+    peak_rss = case['peak_rss_bytes']
+    peak_rss = 'n/a' if peak_rss is None else f'{peak_rss / 1024 ** 2:.0f} MB'
+    print(f"{case['src_type']} {case['size']} rows, peak RSS {peak_rss}:")
+    for stage, elapsed_t in case['stages'].items():
+        print(f'  {stage:<32}{elapsed_t:10.4f} s')
+
+
+# stages slower than in baseline by more than threshold, as (src_type, size, stage, baseline s, current s).
+# Cases and stages missing from either of the results are skipped.
+def get_regressions(baseline: dict, current: dict, threshold: float = DEF_THRESHOLD, min_delta_s: float = MIN_DELTA_S):
+    baseline_cases = {(case['src_type'], case['size']): case for case in baseline['cases']}
+    regressions = []
+    for case in current['cases']:
+        baseline_case = baseline_cases.get((case['src_type'], case['size']))
+        if baseline_case is None:
+            continue
+        for stage, elapsed_t in case['stages'].items():
+            baseline_t = baseline_case['stages'].get(stage)
+            if baseline_t is None:
+                continue
+            if elapsed_t > baseline_t * (1 + threshold) and elapsed_t - baseline_t >= min_delta_s:
+                regressions.append((case['src_type'], case['size'], stage, baseline_t, elapsed_t))
+    return regressions
+
+
+def load_results(results_f_path: str):
+    with open(results_f_path) as results_f:
+        return json.load(results_f)
+
+
+def save_results(results: dict, results_f_path: str):
+    with open(results_f_path, 'w') as results_f:
+        json.dump(results, results_f, indent=2)
+
+
+def compare(baseline_f_path: str, current_f_path: str, threshold: float):
+    regressions = get_regressions(load_results(baseline_f_path), load_results(current_f_path), threshold)
+    for src_type, size, stage, baseline_t, elapsed_t in regressions:
+        print(f'REGRESSION: {src_type} {size} rows, {stage}: {baseline_t:.4f} s -> {elapsed_t:.4f} s '
+              f'(+{(elapsed_t / baseline_t - 1) * 100:.0f}%)')
+    if regressions:
+        return 1
+    print(f'No stage regressed by more than {threshold * 100:.0f}%.')
+    return 0
+
+
+# e.g. python benchmark.py run bench.json --sizes 10000 100000
+#      python benchmark.py compare baseline.json bench.json --threshold 0.2
+def main(argv: list = None):
+    arg_parser = argparse.ArgumentParser(description='Time every collection generation stage on generated sources.')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run the benchmark and save results as JSON')
+    run_parser.add_argument('output', help='path of the results .json')
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=DEF_SIZES, help='source sizes in rows')
+    run_parser.add_argument('--types', nargs='+', choices=['cms', 'bank'], default=['cms', 'bank'])
+    run_parser.add_argument('--seed', type=int, default=DEF_SEED)
+    run_parser.add_argument('--repeat', type=int, default=1, help='runs of every stage, the best one is kept')
+    run_parser.add_argument('--src-dir', default=None,
+                            help='directory keeping generated sources between runs, a temp one by default')
+
+    compare_parser = subparsers.add_parser('compare', help='fail when a stage regressed against a baseline')
+    compare_parser.add_argument('baseline', help='results .json to compare against')
+    compare_parser.add_argument('current', help='new results .json')
+    compare_parser.add_argument('--threshold', type=float, default=DEF_THRESHOLD,
+                                help='allowed slowdown of a stage, 0.2 is 20%%')
+    args = arg_parser.parse_args(argv)
+
+    if args.command == 'compare':
+        try:
+            return compare(args.baseline, args.current, args.threshold)
+        except (OSError, ValueError, KeyError) as e:
+            print(f'ERROR: {e}')
+            return 2
+
+    if args.src_dir is None:
+        with tempfile.TemporaryDirectory() as src_dir:
+            results = run_benchmark(args.types, args.sizes, src_dir, args.seed, args.repeat)
+    else:
+        os.makedirs(args.src_dir, exist_ok=True)
+        results = run_benchmark(args.types, args.sizes, args.src_dir, args.seed, args.repeat)
+    save_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,18 +8,24 @@
 # furnished to do so, subject to the following conditions:
 # The above copyright notice and this permission notice shall be included in all
 # copies or substantial portions of the Software.
+import os
 import textwrap
 import tkinter
+from concurrent.futures import CancelledError
 import customtkinter
 import pandas as pd
 import logic
+from worker import Worker
 from models.Collection import CmsColl, BankColl
 from models.CmsFileHelper import CmsFileHelper
+from models.RowsMemo import RowsMemo
+from models.ExclusionStore import ExclusionStore
+from models.CollectionHistory import CollectionHistory
 import ctypes
 from tkinter import messagebox, filedialog, simpledialog
 from config import PROJECT_DIR
 from configparser import ConfigParser
-from config import DEF_F_EXTENSION
+from config import DEF_F_EXTENSION, ROWS_MEMO_MAX_BYTES, EXCLUSION_STORE_DIR, COLL_HISTORY_SAVE, COLL_HISTORY_DIR
 
 app_id = 'dberinger.apps.collectionsgenerator.version'  # arbitrary string
 ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(app_id)
@@ -30,6 +36,8 @@ customtkinter.set_default_color_theme(fr"{PROJECT_DIR}\app\assets\custom_theme.j
 class App(customtkinter.CTk):
     WIDTH = 550
     HEIGHT = 450
+    # matching products are counted once typing pauses for that long
+    PREVIEW_DELAY_MS = 200
 
     def __init__(self):
         super().__init__()
@@ -40,6 +48,16 @@ class App(customtkinter.CTk):
         self.extra_input = ''
         self.settings_f_path = fr'{PROJECT_DIR}\app\settings.ini'
         self.parser = ConfigParser()
+        # parsing, generation and saving run on the worker, UI is only updated from its callbacks
+        self.worker = Worker(self)
+        # pending update of matching products count, see schedule_preview
+        self.preview_job = None
+        # products of running collections, shared by every source loaded
+        self.exclusion_store = ExclusionStore(EXCLUSION_STORE_DIR)
+        # upload files saved, recorded for lookups of collections a product was in
+        self.history = CollectionHistory(COLL_HISTORY_DIR) if COLL_HISTORY_SAVE else None
+        # end date the collection being created is registered with, once saved
+        self.coll_end_date = None
 
         # ******************************* USER INTERFACE *******************************
 
@@ -120,12 +138,31 @@ class App(customtkinter.CTk):
                                                             fg_color=None)
         self.full_file_checkbox.grid(row=8, column=0, columnspan=2, pady=10, padx=20)
 
+        self.cancel_btn = customtkinter.CTkButton(master=self.frame_left,
+                                                  text="Cancel",
+                                                  width=80,
+                                                  border_width=1,
+                                                  fg_color=None,
+                                                  command=self.cancel_work)
+        self.cancel_btn.grid(row=9, column=0, columnspan=2, pady=(10, 0), padx=20)
+
+        self.status_lbl = customtkinter.CTkLabel(master=self.frame_left,
+                                                 text="",
+                                                 font=("Roboto Medium", -11))
+        self.status_lbl.grid(row=10, column=0, columnspan=2, pady=(0, 10), padx=10)
+
         # MIDDLE RIGHT
 
         # configure grid layout (3x7)
         self.frame_right.columnconfigure((0, 1), weight=2)
         self.frame_right.columnconfigure(2, weight=1)
 
+        # matching products of current filters
+        self.matches_lbl = customtkinter.CTkLabel(master=self.frame_right,
+                                                  text="",
+                                                  font=("Roboto Medium", -11))
+        self.matches_lbl.grid(row=0, column=0, columnspan=2, sticky="we", padx=15, pady=10)
+
         # category ids
         self.cat_ids = customtkinter.CTkEntry(master=self.frame_right,
                                               width=100,
@@ -133,7 +170,8 @@ class App(customtkinter.CTk):
         self.cat_ids.grid(row=1, column=0, columnspan=2, pady=(0, 10), padx=20, sticky="we")
 
         # clusters
-        self.clusters_cmb_box = customtkinter.CTkComboBox(master=self.frame_right, values=[], state="readonly")
+        self.clusters_cmb_box = customtkinter.CTkComboBox(master=self.frame_right, values=[], state="readonly",
+                                                          command=self.schedule_preview)
 
         self.clusters_cmb_box.grid(row=2, column=0, columnspan=2, pady=10, padx=20, sticky="we")
 
@@ -173,7 +211,8 @@ class App(customtkinter.CTk):
                                                            text="DEL out of stock?",
                                                            variable=self.sold_out_checkbox_val,
                                                            border_width=1,
-                                                           fg_color=None)
+                                                           fg_color=None,
+                                                           command=self.schedule_preview)
         self.sold_out_checkbox.grid(row=7, column=0, columnspan=2, sticky="nwe", padx=15, pady=(15, 0))
 
         # RIGHT RIGHT
@@ -200,6 +239,12 @@ class App(customtkinter.CTk):
                                                      offvalue=0)
         self.rating_switch.grid(row=2, column=2, pady=10, padx=20, sticky="we")
 
+        # top rows of every seller kept, in sort order
+        self.max_per_seller = customtkinter.CTkEntry(master=self.frame_right,
+                                                     width=100,
+                                                     placeholder_text="Max per seller")
+        self.max_per_seller.grid(row=3, column=2, pady=10, padx=20, sticky="we")
+
         # clear options
         self.clear_options_btn = customtkinter.CTkButton(master=self.frame_right,
                                                          width=30,
@@ -209,6 +254,22 @@ class App(customtkinter.CTk):
                                                          command=self.clear_options)
         self.clear_options_btn.grid(row=4, column=2, pady=0, padx=20)
 
+        # saved collection's products are registered as used until its end date
+        self.end_date = customtkinter.CTkEntry(master=self.frame_right,
+                                               width=100,
+                                               placeholder_text="Ends YYYY-MM-DD")
+        self.end_date.grid(row=5, column=2, pady=10, padx=20, sticky="we")
+
+        # products of running collections
+        self.exclude_used_checkbox_val = customtkinter.IntVar()
+        self.exclude_used_checkbox = customtkinter.CTkCheckBox(master=self.frame_right,
+                                                               width=40,
+                                                               text="Exclude used?",
+                                                               variable=self.exclude_used_checkbox_val,
+                                                               border_width=1,
+                                                               fg_color=None)
+        self.exclude_used_checkbox.grid(row=6, column=2, padx=20, sticky="we")
+
         # theme options
         self.theme_optionmenu = customtkinter.CTkOptionMenu(master=self.frame_right,
                                                             values=["Light", "Dark", "System"],
@@ -229,11 +290,14 @@ class App(customtkinter.CTk):
 
         self.set_theme(self.get_setting('theme'))
         self.clr_extra_input_btn.configure(state=tkinter.DISABLED)
+        self.cancel_btn.configure(state=tkinter.DISABLED)
         self.cat_ids.configure(state=tkinter.DISABLED)
         self.clusters_cmb_box.set("Clusters")
         self.clusters_cmb_box.configure(state="readonly")
         self.ratio_local.insert(0, 3)
         self.ratio_offshore.insert(0, 2)
+        for entry in [self.cat_ids, self.pp_min, self.pp_max]:
+            entry.bind('<KeyRelease>', self.schedule_preview)
         # set default or last user preferred state for toggles and checkboxes
         for key in self.settings_mapping:
             # but skip theme
@@ -259,6 +323,7 @@ class App(customtkinter.CTk):
         customtkinter.set_appearance_mode(new_theme)
 
     def on_closing(self, event=0):
+        self.worker.cancel()
         self.set_setting(bool(self.full_file_checkbox_val.get()), 'include_full_file')
         self.set_setting(bool(self.sold_out_checkbox_val.get()), 'del_out_of_stock')
         self.set_setting(bool(self.ado_var.get()), 'ado_switch_on')
@@ -277,6 +342,10 @@ class App(customtkinter.CTk):
     def clear_options(self):
         self.max_coll_size.delete(0, 'end')
         self.set_placeholder(self.max_coll_size, 'Max size')
+        self.max_per_seller.delete(0, 'end')
+        self.set_placeholder(self.max_per_seller, 'Max per seller')
+        self.end_date.delete(0, 'end')
+        self.set_placeholder(self.end_date, 'Ends YYYY-MM-DD')
         self.cat_ids.delete(0, 'end')
         self.set_placeholder(self.cat_ids, 'Category IDs')
         self.pp_min.delete(0, 'end')
@@ -289,6 +358,34 @@ class App(customtkinter.CTk):
         self.ratio_offshore.delete(0, 'end')
         self.ratio_local.insert(0, 3)
         self.ratio_offshore.insert(0, 2)
+        self.schedule_preview()
+
+    # ******************************* WORKER *******************************
+
+    # task runs on the worker thread with progress and cancel event, callbacks run on the main thread
+    def start_work(self, task, on_done, on_error=None, on_cancel=None):
+        if not self.worker.submit(task, on_done, self.show_progress, on_error, on_cancel):
+            return False
+        self.select_src_btn.configure(state=tkinter.DISABLED)
+        self.generate_btn.configure(state=tkinter.DISABLED)
+        self.cancel_btn.configure(state=tkinter.NORMAL)
+        return True
+
+    def end_work(self, status: str = ''):
+        self.select_src_btn.configure(state=tkinter.NORMAL)
+        self.generate_btn.configure(state=tkinter.NORMAL)
+        self.cancel_btn.configure(state=tkinter.DISABLED)
+        self.status_lbl.configure(text=status)
+
+    def cancel_work(self):
+        self.worker.cancel()
+        self.status_lbl.configure(text='Cancelling...')
+
+    def show_progress(self, event: dict):
+        if event['stage'] == 'parsing':
+            self.status_lbl.configure(text=f"Rows parsed: {event['rows']}")
+        else:
+            self.status_lbl.configure(text=f"{event['stage'].capitalize()}, rows: {event['rows']}")
 
     # ******************************* SOURCE *******************************
 
@@ -315,8 +412,39 @@ class App(customtkinter.CTk):
 
     def select_src(self):
         src_file_path = filedialog.askopenfilename(filetypes=DEF_F_EXTENSION, defaultextension=DEF_F_EXTENSION)
-        src_type, ori_df = logic.validate_src(src_file_path)
+        self.start_work(lambda progress, cancel_event: self.load_src(src_file_path, progress, cancel_event),
+                        lambda result: self.on_src_loaded(src_file_path, *result),
+                        on_error=lambda e: self.on_src_loaded(src_file_path, 'Error while selecting/opening source '
+                                                                             'file.', None, None),
+                        on_cancel=lambda: self.end_work('Source loading cancelled.'))
 
+    # runs on the worker. Source already loaded stays in use until the new one is loaded.
+    @staticmethod
+    def load_src(src_file_path: str, progress, cancel_event):
+        src_report = {}
+        src_type, ori_df = logic.validate_src(src_file_path, progress=progress, cancel_event=cancel_event,
+                                              report=src_report)
+        if src_type != 'cms' and src_type != 'bank':
+            return src_type, None, None
+
+        # working collection is a view over the original source, so there's only one copy of the source in memory
+        coll_cls = CmsColl if src_type == 'cms' else BankColl
+        working_coll = coll_cls(ori_df, view=True)
+        # postings for cluster, category, seller_type and price, reused by every Create on this source
+        progress({'stage': 'indexing', 'rows': len(ori_df)})
+        working_coll.build_index()
+        # clusters, categories and price range for validating criteria, cached with the source
+        working_coll.set_profile(logic.get_src_profile(src_file_path, src_type, ori_df,
+                                                       messages=src_report['messages']))
+        # filter postings, sort orders and stage results of every Create on this source
+        working_coll.set_memo(RowsMemo(ROWS_MEMO_MAX_BYTES))
+        # counts of matching products shown while criteria are typed in
+        working_coll.build_match_counter()
+
+        return src_type, coll_cls(ori_df), working_coll, src_report
+
+    def on_src_loaded(self, src_file_path: str, src_type: str, original_src, working_coll, src_report: dict = None):
+        self.end_work()
         if src_type == 'cms' or src_type == 'bank':
             self.src_type = src_type
         else:
@@ -325,17 +453,15 @@ class App(customtkinter.CTk):
             self.src_lbl.configure(text='')
             self.original_src = None
             self.working_coll = None
+            self.update_preview()
             return
 
-        if self.src_type == 'cms':
-            self.original_src = CmsColl(ori_df)
-            self.working_coll = CmsColl(ori_df.copy(deep=True))
-
-        elif self.src_type == 'bank':
-            self.original_src = BankColl(ori_df)
-            self.working_coll = BankColl(ori_df.copy(deep=True))
+        self.original_src = original_src
+        self.working_coll = working_coll
+        self.working_coll.set_exclusion_store(self.exclusion_store)
 
-            clusters = logic.validate_clusters(self.working_coll.get_column_values('cluster'))
+        if self.src_type == 'bank':
+            clusters = logic.validate_clusters(list(self.working_coll.profile.get_values('cluster')))
             if clusters is not None:
                 self.clusters_cmb_box.configure(state="normal")
                 self.clusters_cmb_box.configure(values=clusters)
@@ -344,28 +470,43 @@ class App(customtkinter.CTk):
 
         self.toggle_options_for_src_type()
 
-        total_products = len(self.working_coll.get_column_values('product_id'))
+        total_products = self.working_coll.get_df_size()
         self.update_src_total(total_products)
         src_lbl_text = textwrap.fill(src_file_path.split("/")[-1], width=27)
         self.src_lbl.configure(text=src_lbl_text)
         self.src_lbl.configure(fg_color=("white", "gray38"))
+        status_text = textwrap.fill(self.working_coll.profile.get_summary(), width=40)
+        if src_report is not None:
+            status_text = f"{status_text}\n{textwrap.fill(logic.get_typing_summary(src_report), width=40)}"
+        self.status_lbl.configure(text=status_text)
+        self.update_preview()
+        if src_report is not None and src_report['messages']:
+            messagebox.showinfo('Messages', '\n'.join(src_report['messages']))
 
     def reset_collection(self):
-        self.working_coll.set_df(self.original_src.get_df().copy(deep=True))
+        self.working_coll.set_progress(None)
+        self.working_coll.reset()
 
     # ******************************* EXTRA INPUT *******************************
 
     def extra_input_handler(self):
         self.extra_input = tkinter.simpledialog.askstring(title="+Input",
                                                           prompt="Paste seller and product ids in 2 columns x "
-                                                                 "rows format,\n without headers:")
+                                                                 "rows format,\n without headers, or a path to a "
+                                                                 ".csv/.txt file with them:")
 
-        self.extra_input = logic.validate_extra_input(self.extra_input)
+        # a single line naming an existing file is read as a file of pairs
+        messages = []
+        if self.extra_input is not None and os.path.isfile(self.extra_input.strip()):
+            self.extra_input = logic.validate_extra_input_f(self.extra_input.strip(), messages=messages)
+        else:
+            self.extra_input = logic.validate_extra_input(self.extra_input, messages=messages)
 
         if self.extra_input is None:
             self.clear_extra_input()
             tkinter.messagebox.showerror('Error', "Couldn't process pasted input. Please make sure to paste 2 columns "
-                                                  "per x rows, as in spreadsheet, without headers.")
+                                                  "per x rows, as in spreadsheet, without headers.\n\n" +
+                                         '\n'.join(messages))
             return
 
         total_extra_input = len(self.extra_input['product_id'])
@@ -391,11 +532,31 @@ class App(customtkinter.CTk):
             messagebox.showerror('Collection size error', 'Please input a natural number, eg. 10000.')
             return None
 
+    def get_max_per_seller(self):
+        max_per_seller = self.max_per_seller.get()
+        try:
+            if len(max_per_seller) != 0:
+                max_per_seller = logic.validate_size(max_per_seller)
+                if max_per_seller <= 0:
+                    raise ValueError
+                return max_per_seller
+            else:
+                return None
+        except ValueError:
+            messagebox.showerror('Max per seller error', 'Please input a natural number, eg. 10.')
+            return None
+
+    # raises ValueError for anything but an empty entry or a date that hasn't passed yet
+    def get_end_date(self):
+        end_date = self.end_date.get()
+        if len(end_date.strip()) == 0:
+            return None
+        return logic.validate_end_date(end_date)
+
     def get_cat_ids(self):
         cat_ids = self.cat_ids.get()
         try:
-            src_cat_ids = self.working_coll.get_column_values('cat_id')
-            return logic.validate_cat_ids(cat_ids, src_cat_ids)
+            return logic.validate_cat_ids(cat_ids, self.working_coll.profile.get_values('cat_id'))
         except:
             return None
 
@@ -406,7 +567,8 @@ class App(customtkinter.CTk):
         else:
             return cluster
 
-    def get_price_points(self):
+    # with show_errors off, invalid prices are only ignored, e.g. while they're still being typed in
+    def get_price_points(self, show_errors: bool = True):
         price_points = {
             'min': self.pp_min.get(),
             'max': self.pp_max.get()
@@ -422,6 +584,9 @@ class App(customtkinter.CTk):
                     else:
                         price_points[key] = price
                 except:
+                    if not show_errors:
+                        price_points[key] = ''
+                        continue
                     messagebox.showerror('Price points error', 'Please make sure price points are positive numbers.\n'
                                                                'Floating points number should be typed in with a dot.')
                     price_points[key] = ''
@@ -456,6 +621,34 @@ class App(customtkinter.CTk):
 
         return sort
 
+    # ******************************* MATCHES PREVIEW *******************************
+
+    # every change of filters restarts the delay, so only the last one of fast typing is counted
+    def schedule_preview(self, *args):
+        if self.preview_job is not None:
+            self.after_cancel(self.preview_job)
+        self.preview_job = self.after(App.PREVIEW_DELAY_MS, self.update_preview)
+
+    # counted from precomputed sorted prices and group counts of the source, so it takes microseconds and can run
+    # on the main thread, even while the worker is busy with the same source
+    def update_preview(self):
+        self.preview_job = None
+        if not isinstance(self.working_coll, (CmsColl, BankColl)) or self.working_coll.match_counter is None:
+            self.matches_lbl.configure(text='')
+            return
+
+        prices = self.get_price_points(show_errors=False)
+        criteria = {
+            'cluster': self.get_cluster(),
+            'cat_id': self.get_cat_ids(),
+            'price_min': prices['min'],
+            'price_max': prices['max'],
+            'out_of_stock': bool(self.sold_out_checkbox_val.get())
+        }
+        counts = self.working_coll.count_matches(criteria)
+        self.matches_lbl.configure(text=f"Matching products: {counts['total']} "
+                                        f"(Local: {counts['local']}, Offshore: {counts['offshore']})")
+
     # ******************************* GENERATING COLLECTION *******************************
 
     def get_all_criteria(self):
@@ -475,6 +668,10 @@ class App(customtkinter.CTk):
         criteria['sort_first'] = sort['sort_first']
         criteria['sort_next'] = sort['sort_next']
         criteria['ratio'] = self.get_ratio()
+        # interleave by other columns than seller_type is only set in batch manifests
+        criteria['interleave'] = None
+        criteria['max_per_seller'] = self.get_max_per_seller()
+        criteria['exclude_used'] = bool(self.exclude_used_checkbox_val.get())
         criteria['out_of_stock'] = bool(self.sold_out_checkbox_val.get())
         return criteria
 
@@ -482,13 +679,32 @@ class App(customtkinter.CTk):
         if not isinstance(self.working_coll, (CmsColl, BankColl)):
             messagebox.showerror('Error', 'Please select a data source first.')
             return
+        try:
+            self.coll_end_date = self.get_end_date()
+        except ValueError:
+            messagebox.showerror('End date error', 'Please input a date that has not passed yet, eg. 2030-12-31.')
+            return
         try:
             criteria = self.get_all_criteria()
-            self.working_coll.process_by_criteria(criteria)
+        except:
+            messagebox.showerror('Error', 'Failure in collection generation process.')
+            return
+
+        self.start_work(lambda progress, cancel_event: self.process_collection(criteria, progress, cancel_event),
+                        self.on_coll_processed, on_error=self.on_coll_failed, on_cancel=self.on_coll_cancelled)
+
+    # runs on the worker
+    def process_collection(self, criteria: dict, progress, cancel_event):
+        self.working_coll.set_progress(progress, cancel_event)
+        self.working_coll.process_by_criteria(criteria)
+
+    def on_coll_processed(self, result=None):
+        self.end_work()
+        try:
             if len(self.working_coll.messages) > 0:
                 messages_str = '\n'.join(self.working_coll.messages)
                 messagebox.showinfo('Messages', messages_str)
-            if len(self.working_coll.get_column_values('product_id')) == 0:
+            if self.working_coll.get_df_size() == 0:
                 messagebox.showinfo('Collection empty',
                                     'Created collection is empty. Please consider changing criteria.\nNot saving file.')
                 self.reset_collection()
@@ -500,30 +716,55 @@ class App(customtkinter.CTk):
                 messagebox.showerror('Error', 'Please select a directory and a filename to save the generated collection.')
                 self.reset_collection()
                 return
-            fh = CmsFileHelper('')
-            # adjust to use in app
-            fh.upload_f_path = user_save_path
-            prep_result = fh.prepare_upload_f(seller_product_ids=self.working_coll.export_for_upload())
-            if not prep_result:
-                messagebox.showerror('Error', 'Failed to generate collection upload file.')
-                self.reset_collection()
-                return
+
+            full_save_path = None
             if bool(self.full_file_checkbox_val.get()):
                 f_name = user_save_path.split("/")[-1]
                 save_path = user_save_path.split(f_name)[0]
                 full_save_path = f'{save_path}full_{f_name}'
-                full_prep_result = fh.prepare_custom_full_f(self.working_coll, full_save_path)
-                if not full_prep_result:
-                    messagebox.showerror('Error', 'Failed to generate full collection file.')
-                    self.reset_collection()
-                    return
-            messagebox.showinfo('Success', 'File(s) generated!')
-            self.reset_collection()
+
+            self.start_work(lambda progress, cancel_event: self.save_collection(user_save_path, full_save_path,
+                                                                                progress, cancel_event),
+                            self.on_coll_saved, on_error=self.on_coll_failed, on_cancel=self.on_coll_cancelled)
         except:
-            messagebox.showerror('Error', 'Failure in collection generation process.')
-            self.reset_collection()
-            return
+            self.on_coll_failed()
+
+    # runs on the worker, returns error message or None
+    def save_collection(self, user_save_path: str, full_save_path: str, progress, cancel_event):
+        progress({'stage': 'saving', 'rows': self.working_coll.get_df_size()})
+        fh = CmsFileHelper('')
+        # adjust to use in app
+        fh.upload_f_path = user_save_path
+        fh.history = self.history
+        # last point to cancel, once files are written, exclusions and history are registered too
+        if cancel_event.is_set():
+            raise CancelledError()
+        # full file, if included, is written at the same time as the upload file
+        prep_result = fh.prepare_upload_and_full_f(self.working_coll, full_save_path)
+        if not prep_result:
+            if full_save_path is not None:
+                return 'Failed to generate collection upload and full files.'
+            return 'Failed to generate collection upload file.'
+        if self.coll_end_date is not None:
+            self.exclusion_store.register(self.working_coll.get_column('product_id').to_numpy(), self.coll_end_date)
+        return None
+
+    def on_coll_saved(self, error_msg: str = None):
+        self.end_work()
+        if error_msg is not None:
+            messagebox.showerror('Error', error_msg)
+        else:
+            messagebox.showinfo('Success', 'File(s) generated!')
+        self.reset_collection()
+
+    def on_coll_failed(self, e: Exception = None):
+        self.end_work()
+        messagebox.showerror('Error', 'Failure in collection generation process.')
+        self.reset_collection()
 
+    def on_coll_cancelled(self):
+        self.end_work('Collection creation cancelled.')
+        self.reset_collection()
 
 if __name__ == "__main__":
     app = App()
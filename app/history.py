@@ -0,0 +1,38 @@
+import argparse
+import sys
+from config import COLL_HISTORY_DIR
+from models.CollectionHistory import CollectionHistory
+
+
+def print_lookup(history: CollectionHistory, ids: list, by: str):
+    found_df = history.lookup(ids, by)
+    if len(found_df) == 0:
+        print(f'No collections found for {by}: {ids}.')
+        return
+
+    for found_id, id_df in found_df.groupby(by, sort=False):
+        print(f'{by} {found_id}: {len(id_df)} collection(s)')
+        for row in id_df.itertuples():
+            print(f'  {row.created}  {row.coll_id or "-"}  (#{row.coll_no})')
+
+
+def main(argv: list = None):
+    arg_parser = argparse.ArgumentParser(description='Look up collections generated with given products or sellers.')
+    arg_parser.add_argument('by', choices=['product', 'seller'])
+    arg_parser.add_argument('ids', nargs='+', help='product or seller ids')
+    arg_parser.add_argument('--history', default=COLL_HISTORY_DIR,
+                            help='directory of the history of generated upload files')
+    args = arg_parser.parse_args(argv)
+
+    try:
+        history = CollectionHistory(args.history)
+    except (OSError, ValueError) as e:
+        print(f'ERROR: {e}')
+        return 2
+
+    print_lookup(history, args.ids, f'{args.by}_id')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
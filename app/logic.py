@@ -1,57 +1,480 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import CancelledError
+from datetime import date
+from time import time
+import numpy as np
 import pandas as pd
 from models.Collection import CmsColl, BankColl
-from config import DEF_F_EXTENSION, CMS_COLL_COLUMNS, BANK_COLL_COLUMNS, COLL_MAX_SIZE
+from models.SourceProfile import SourceProfile
+from config import DEF_F_EXTENSION, CMS_COLL_COLUMNS, BANK_COLL_COLUMNS, CMS_COLL_SCHEMA, BANK_COLL_SCHEMA, \
+    COLL_MAX_SIZE, SRC_CHUNK_SIZE, \
+    SRC_CACHE_ON, SRC_CACHE_DIR, SRC_CACHE_MAX_BYTES, SRC_CACHE_SAMPLE_SIZE
 
 
-def validate_src(source_f_path: str):
+def get_src_type(columns: list):
+    if columns == CMS_COLL_COLUMNS:
+        return 'cms'
+    elif columns == BANK_COLL_COLUMNS:
+        return 'bank'
+    return None
+
+
+# reads just the first line of the file, so invalid sources are rejected without parsing the body
+def sniff_src_header(source_f_path: str):
+    with open(source_f_path, newline='') as src_f:
+        return next(csv.reader(src_f), [])
+
+
+# cheap row filters from the criteria, applied to every chunk before it's kept. Same conditions as in
+# process_by_criteria, so the Collection filters re-run on the result give the same rows. Only filters that keep
+# every row the Collection checks cluster and categories against are pushed down, price is left to the Collection,
+# so it reports clusters and categories outside the price band the same as with the whole source loaded.
+def filter_src_chunk(chunk: pd.DataFrame, src_type: str, criteria: dict, found: dict):
+    mask = pd.Series(True, index=chunk.index)
+
+    if src_type == 'cms' and criteria.get('out_of_stock'):
+        mask &= chunk['Stock'] != 0
+
+    if src_type == 'bank' and criteria.get('cluster'):
+        mask &= chunk['cluster'] == criteria['cluster']
+        found['cluster'] = found['cluster'] or bool(mask.any())
+
+    if src_type == 'bank' and criteria.get('cat_id'):
+        cat_ids = [int(str(val).strip()) for val in criteria['cat_id'] if str(val).strip().isnumeric()]
+        mask &= chunk['category_id'].isin(cat_ids)
+        found['cat_id'] = found['cat_id'] or bool(mask.any())
+
+    # rows of extra input products are kept too, so extra input can be enriched from them. Collection filters drop
+    # them again from the rows.
+    if isinstance(criteria.get('extra_input'), dict):
+        product_col = 'Product ID' if src_type == 'cms' else 'product_id'
+        mask |= chunk[product_col].isin(np.asarray(criteria['extra_input']['product_id']))
+
+    return chunk[mask]
+
+
+# chunks of the source, with rows parsed so far reported to progress after every chunk. Reading stops with
+# CancelledError between chunks, once cancel_event is set.
+def read_src_chunks(source_f_path: str, chunk_size: int = SRC_CHUNK_SIZE, progress=None, cancel_event=None):
+    rows_parsed = 0
+    for chunk in pd.read_csv(source_f_path, chunksize=chunk_size):
+        if cancel_event is not None and cancel_event.is_set():
+            raise CancelledError()
+        rows_parsed += len(chunk)
+        if progress is not None:
+            progress({'stage': 'parsing', 'rows': rows_parsed})
+        yield chunk
+
+
+# report, if given, gets the count of rows in the source as src_rows, before any filter
+def stream_src(source_f_path: str, src_type: str, criteria: dict, chunk_size: int = SRC_CHUNK_SIZE, progress=None,
+               cancel_event=None, report: dict = None):
+    found = {
+        'cluster': False,
+        'cat_id': False
+    }
+    src_rows = 0
+    chunks = []
+    for chunk in read_src_chunks(source_f_path, chunk_size, progress, cancel_event):
+        src_rows += len(chunk)
+        chunks.append(filter_src_chunk(chunk, src_type, criteria, found))
+    df = pd.concat(chunks) if chunks else pd.DataFrame(columns=sniff_src_header(source_f_path))
+
+    # cluster or categories not present in source are ignored by the Collection filters, instead of leaving
+    # an empty collection, so those have to be read again without that filter
+    if criteria.get('cluster') and not found['cluster']:
+        return stream_src(source_f_path, src_type, dict(criteria, cluster=None), chunk_size, progress, cancel_event,
+                          report)
+    if criteria.get('cat_id') and not found['cat_id']:
+        return stream_src(source_f_path, src_type, dict(criteria, cat_id=None), chunk_size, progress, cancel_event,
+                          report)
+
+    if report is not None:
+        report['src_rows'] = src_rows
+    return df
+
+
+def add_message(messages: list, message: str):
+    if messages is not None:
+        messages.append(message)
+
+
+# cache key is made of the file path, size, mtime and a hash of its first and last MiB, so it's cheap to compute
+# even for multi-hundred-MB sources, while still catching files rewritten within the same second
+def get_src_cache_key(source_f_path: str):
+    f_stat = os.stat(source_f_path)
+    content_hash = hashlib.blake2b(digest_size=16)
+    with open(source_f_path, 'rb') as src_f:
+        content_hash.update(src_f.read(SRC_CACHE_SAMPLE_SIZE))
+        if f_stat.st_size > SRC_CACHE_SAMPLE_SIZE:
+            src_f.seek(-SRC_CACHE_SAMPLE_SIZE, os.SEEK_END)
+            content_hash.update(src_f.read(SRC_CACHE_SAMPLE_SIZE))
+
+    key = f'{os.path.abspath(source_f_path)}|{f_stat.st_size}|{f_stat.st_mtime_ns}|{content_hash.hexdigest()}'
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def read_src_cache_index(cache_dir: str):
+    try:
+        with open(os.path.join(cache_dir, 'index.json')) as index_f:
+            return json.load(index_f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_src_cache_index(cache_dir: str, index: dict):
+    index_f_path = os.path.join(cache_dir, 'index.json')
+    with open(f'{index_f_path}.tmp', 'w') as index_f:
+        json.dump(index, index_f)
+    os.replace(f'{index_f_path}.tmp', index_f_path)
+
+
+# only plain numpy arrays are stored, so cache files never need pickle to load. Categorical columns are stored as
+# their codes and categories.
+def get_cache_column_arrays(column: pd.Series):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        if pd.api.types.infer_dtype(column.cat.categories, skipna=False) != 'string':
+            return None
+        return {
+            'npy': column.cat.codes.to_numpy(),
+            'categories.npy': column.cat.categories.to_numpy().astype(str)
+        }
+    if pd.api.types.is_numeric_dtype(column) or pd.api.types.is_bool_dtype(column):
+        return {'npy': column.to_numpy()}
+    if pd.api.types.infer_dtype(column, skipna=False) == 'string':
+        return {'npy': column.to_numpy().astype(str)}
+    return None
+
+
+def load_cache_column(entry_dir: str, i: int, dtype: str):
+    values = np.load(os.path.join(entry_dir, f'{i}.npy'), allow_pickle=False)
+    if dtype == 'category':
+        categories = np.load(os.path.join(entry_dir, f'{i}.categories.npy'), allow_pickle=False)
+        return pd.Series(pd.Categorical.from_codes(values, categories=categories))
+    return pd.Series(values).astype(dtype)
+
+
+# cache failures are only reported in messages, if given, the source is parsed from the file instead
+def load_cached_src(source_f_path: str, cache_dir: str = SRC_CACHE_DIR, messages: list = None):
+    try:
+        key = get_src_cache_key(source_f_path)
+        index = read_src_cache_index(cache_dir)
+        if key not in index:
+            return None
+
+        entry_dir = os.path.join(cache_dir, key)
+        with open(os.path.join(entry_dir, 'meta.json')) as meta_f:
+            meta = json.load(meta_f)
+
+        df = pd.DataFrame({
+            col: load_cache_column(entry_dir, i, dtype)
+            for i, (col, dtype) in enumerate(zip(meta['columns'], meta['dtypes']))
+        })
+
+        index[key]['last_used'] = time()
+        write_src_cache_index(cache_dir, index)
+        return meta['src_type'], df
+    except Exception as e:
+        add_message(messages, f'Source cache read failed. {e}')
+        return None
+
+
+# least recently used sources are evicted first, until all of them fit within max_bytes
+def evict_src_cache(cache_dir: str, index: dict, max_bytes: int):
+    total_bytes = sum(entry['bytes'] for entry in index.values())
+    for key in sorted(index, key=lambda k: index[k]['last_used']):
+        if total_bytes <= max_bytes:
+            break
+        shutil.rmtree(os.path.join(cache_dir, key), ignore_errors=True)
+        total_bytes -= index.pop(key)['bytes']
+
+
+def store_cached_src(source_f_path: str, src_type: str, df: pd.DataFrame, cache_dir: str = SRC_CACHE_DIR,
+                     max_bytes: int = SRC_CACHE_MAX_BYTES, messages: list = None):
+    try:
+        arrays = [get_cache_column_arrays(df[col]) for col in df.columns]
+        if any(col_arrays is None for col_arrays in arrays):
+            return False
+        entry_bytes = sum(arr.nbytes for col_arrays in arrays for arr in col_arrays.values())
+        if entry_bytes > max_bytes:
+            return False
+
+        key = get_src_cache_key(source_f_path)
+        entry_dir = os.path.join(cache_dir, key)
+        tmp_dir = f'{entry_dir}.tmp'
+        os.makedirs(tmp_dir, exist_ok=True)
+        for i, col_arrays in enumerate(arrays):
+            for suffix, arr in col_arrays.items():
+                np.save(os.path.join(tmp_dir, f'{i}.{suffix}'), arr, allow_pickle=False)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as meta_f:
+            json.dump({
+                'src_type': src_type,
+                'src_f_path': os.path.abspath(source_f_path),
+                'columns': list(df.columns),
+                'dtypes': [str(dtype) for dtype in df.dtypes]
+            }, meta_f)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+
+        index = read_src_cache_index(cache_dir)
+        index[key] = {
+            'bytes': entry_bytes,
+            'last_used': time()
+        }
+        evict_src_cache(cache_dir, index, max_bytes)
+        write_src_cache_index(cache_dir, index)
+        return True
+    except Exception as e:
+        add_message(messages, f'Source cache write failed. {e}')
+        return False
+
+
+# profile of a loaded source, read from its cache entry if it has one, otherwise computed and added to the entry
+def get_src_profile(source_f_path: str, src_type: str, df: pd.DataFrame, use_cache: bool = SRC_CACHE_ON,
+                    cache_dir: str = SRC_CACHE_DIR, messages: list = None):
+    profile_f_path = None
+    if use_cache:
+        try:
+            key = get_src_cache_key(source_f_path)
+            if key in read_src_cache_index(cache_dir):
+                profile_f_path = os.path.join(cache_dir, key, 'profile.json')
+                with open(profile_f_path) as profile_f:
+                    return SourceProfile.from_dict(json.load(profile_f))
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    coll_cls = CmsColl if src_type == 'cms' else BankColl
+    profile = SourceProfile.from_df(df, coll_cls(df.iloc[:0]).columns)
+
+    if profile_f_path is not None:
+        try:
+            with open(f'{profile_f_path}.tmp', 'w') as profile_f:
+                json.dump(profile.to_dict(), profile_f)
+            os.replace(f'{profile_f_path}.tmp', profile_f_path)
+        except OSError as e:
+            add_message(messages, f'Source profile cache write failed. {e}')
+
+    return profile
+
+
+def coerce_column(column: pd.Series, kind: str):
+    if kind == 'int':
+        values = pd.to_numeric(column)
+        # missing values can't be stored in int columns, those stay as floats
+        if values.isna().any():
+            return values
+        if len(values) == 0 or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max):
+            return values.astype(np.int32)
+        return values.astype(np.int64)
+    elif kind == 'price':
+        return CmsColl.to_numeric_prices(column).astype(np.float64)
+    elif kind == 'metric':
+        values = pd.to_numeric(column)
+        # whole number metrics, like ratings, are kept as ints so they're written back the same way
+        if pd.api.types.is_integer_dtype(values):
+            return coerce_column(values, 'int')
+        return values.astype(np.float32)
+    elif kind == 'label':
+        return column.astype('category')
+    elif kind == 'flag':
+        if pd.api.types.is_bool_dtype(column):
+            return column
+        values = column.astype(str).str.strip().str.lower().map({'true': True, 'false': False, '1': True, '0': False})
+        if values.isna().any():
+            raise ValueError(f'Not a True/False value in {column.name}.')
+        return values.astype(bool)
+    return column
+
+
+# every column typed once at load, as set in the source type's schema, so filters and sorts downstream work on plain
+# numeric arrays. Columns that can't be typed are left as read and listed in the report.
+def coerce_src(df: pd.DataFrame, src_type: str):
+    schema = CMS_COLL_SCHEMA if src_type == 'cms' else BANK_COLL_SCHEMA
+    report = {
+        'bytes_before': int(df.memory_usage(deep=True).sum()),
+        'bytes_after': None,
+        'failed': []
+    }
+
+    typed_columns = {}
+    for col in df.columns:
+        try:
+            typed_columns[col] = coerce_column(df[col], schema.get(col))
+        except (ValueError, TypeError):
+            typed_columns[col] = df[col]
+            report['failed'].append(col)
+
+    df = pd.DataFrame(typed_columns, index=df.index)
+    report['bytes_after'] = int(df.memory_usage(deep=True).sum())
+    return df, report
+
+
+# memory saved by typing, as reported by coerce_src
+def get_typing_summary(report: dict):
+    return (f"Source typed, memory: {report['bytes_before'] / 1024 ** 2:.1f} MB -> "
+            f"{report['bytes_after'] / 1024 ** 2:.1f} MB.")
+
+
+# with criteria, the body is read in chunks and only rows passing the cheap filters are kept, so memory follows
+# the selected rows, not the source size. Without criteria the whole source is loaded, from the source cache if
+# it was parsed before. Report, if given, is updated with the typing report of coerce_src, messages of columns
+# left untyped and of cache failures, and the count of rows in the source as src_rows, also if filtered while read.
+def validate_src(source_f_path: str, criteria: dict = None, chunk_size: int = SRC_CHUNK_SIZE,
+                 use_cache: bool = SRC_CACHE_ON, progress=None, cancel_event=None, report: dict = None,
+                 cache_dir: str = SRC_CACHE_DIR):
+    messages = []
+    if report is not None:
+        report['messages'] = messages
+
     try:
-        df = pd.read_csv(source_f_path, low_memory=False)
+        src_type = get_src_type(sniff_src_header(source_f_path))
     except Exception as e:
         msg = "Error while selecting/opening source file."
         return msg, None
 
-    df_columns = list(df.columns)
-    if df_columns == CMS_COLL_COLUMNS:
-        return 'cms', df
-    elif df_columns == BANK_COLL_COLUMNS:
-        return 'bank', df
-    else:
+    if src_type is None:
         msg = f'Invalid source column headers. Please try:\n' \
               f'For CMS: {CMS_COLL_COLUMNS}.\n\n' \
               f'For Products Bank: {BANK_COLL_COLUMNS}\n'
         return msg, None
 
-
-def validate_extra_input(extra_input: str):
-    valid_input = {
-        'seller_id': [],
-        'product_id': []
-    }
     try:
-        user_input = extra_input.split('\n')
+        cached_src = None
+        if criteria is None and use_cache:
+            cached_src = load_cached_src(source_f_path, cache_dir, messages=messages)
 
-        for i, pair in enumerate(user_input):
-            pair = pair.split('\t')
-            try:
-                if len(pair[0]) == 0 or len(pair[1]) == 0:
-                    continue
-            except IndexError:
-                continue
-            if pair[0].isnumeric() and pair[1].isnumeric():
-                if len(pair[0]) > len(pair[1]):
-                    valid_input['product_id'].append(int(pair[0].strip()))
-                    valid_input['seller_id'].append(int(pair[1].strip()))
-                elif len(pair[0]) < len(pair[1]):
-                    valid_input['product_id'].append(int(pair[1].strip()))
-                    valid_input['seller_id'].append(int(pair[0].strip()))
-
-        if len(valid_input['product_id']) > 0:
-            return valid_input
+        if cached_src is not None:
+            src_type, df = cached_src
+        elif criteria is None and progress is None and cancel_event is None:
+            df = pd.read_csv(source_f_path, low_memory=False)
+        elif criteria is None:
+            # read in chunks only to report progress and allow cancelling, types are fixed by coerce_src anyway
+            chunks = list(read_src_chunks(source_f_path, chunk_size, progress, cancel_event))
+            df = pd.concat(chunks) if chunks else pd.DataFrame(columns=sniff_src_header(source_f_path))
         else:
-            return None
-    except:
+            df = stream_src(source_f_path, src_type, criteria, chunk_size, progress, cancel_event, report)
+    except CancelledError:
+        raise
+    except Exception as e:
+        msg = "Error while selecting/opening source file."
+        return msg, None
+
+    if report is not None and criteria is None:
+        report['src_rows'] = len(df)
+
+    # typing is a no-op for sources already typed in cache
+    df, typing_report = coerce_src(df, src_type)
+    if typing_report['failed']:
+        messages.append(f"Columns left untyped: {typing_report['failed']}.")
+    if report is not None:
+        report.update(typing_report)
+
+    if criteria is None and use_cache and cached_src is None:
+        store_cached_src(source_f_path, src_type, df, cache_dir, messages=messages)
+
+    return src_type, df
+
+
+# values of digit-only fields [starts, starts + lengths) of a byte array, -1 for fields empty, with anything but
+# digits 0-9 or above int64 max. Leading zeros don't count, so ids of any length are read as long as their value
+# fits. non_digits is the running count of non-digit bytes, with a leading 0.
+def parse_int_fields(data: np.ndarray, non_digits: np.ndarray, starts: np.ndarray, lengths: np.ndarray):
+    ends = starts + lengths
+    is_valid = (lengths > 0) & (non_digits[ends] == non_digits[starts])
+    first_digits = starts.copy()
+    # only fields starting with 0 are searched for their first other digit
+    is_padded = is_valid & (lengths > 1) & (np.append(data, np.uint8(0))[starts] == ord('0'))
+    if is_padded.any():
+        non_zeros = np.append(np.flatnonzero(data != ord('0')), len(data))
+        first_digits[is_padded] = np.minimum(non_zeros[np.searchsorted(non_zeros, starts[is_padded])],
+                                             ends[is_padded])
+    digits = ends - first_digits
+    is_valid &= digits <= 19
+    first_digits, digits = first_digits[is_valid], digits[is_valid]
+
+    # up to 18 digits always fit int64, fields of 19 are rare enough to be read one by one and checked against max
+    is_long = digits == 19
+    short_digits = np.where(is_long, 0, digits)
+    field_values = np.zeros(len(first_digits), dtype=np.int64)
+    for i in range(int(short_digits.max(initial=0))):
+        has_digit = short_digits > i
+        digit_pos = np.where(has_digit, first_digits + i, 0)
+        field_values = np.where(has_digit, field_values * 10 + data[digit_pos] - ord('0'), field_values)
+    for i in np.flatnonzero(is_long):
+        value = int(data[first_digits[i]:first_digits[i] + 19].tobytes())
+        field_values[i] = value if value <= np.iinfo(np.int64).max else -1
+
+    values = np.full(len(is_valid), -1, dtype=np.int64)
+    values[is_valid] = field_values
+    return values
+
+
+# pairs of seller and product ids, one pair per line, as pasted from 2 spreadsheet columns. In any order, the longer
+# id is the product id. Lines without 2 ids of different lengths are skipped, like headers or empty lines, and so are
+# fields after the second one. Lines may end with \r\n. The whole text is parsed as one byte array, without a Python
+# object per line, so pasting or reading 100k+ pairs takes milliseconds. Messages, if given, get why nothing was
+# read, if no line had a pair.
+def validate_extra_input(extra_input: str, sep: str = '\t', messages: list = None):
+    try:
+        data = np.frombuffer(extra_input.encode(), dtype=np.uint8)
+    except (AttributeError, UnicodeEncodeError):
+        add_message(messages, 'No extra input text given.')
         return None
 
+    line_ends = np.concatenate([np.flatnonzero(data == ord('\n')), [len(data)]])
+    line_starts = np.concatenate([[0], line_ends[:-1] + 1])
+    lines_count = np.count_nonzero(line_ends > line_starts)
+    # \r of \r\n ends is left out of the last field
+    is_cr = np.append(data == ord('\r'), False)
+    has_cr = (line_ends > line_starts) & is_cr[line_ends - 1]
+    line_ends = line_ends - has_cr
+
+    # first field ends at the first separator of the line, second one at the next separator or at the line end
+    seps = np.concatenate([np.flatnonzero(data == ord(sep)), [len(data)]])
+    first_sep = seps[np.searchsorted(seps, line_starts)]
+    has_pair = first_sep < line_ends
+    second_end = np.minimum(seps[np.minimum(np.searchsorted(seps, first_sep) + 1, len(seps) - 1)], line_ends)
+
+    line_starts, first_sep, second_end = line_starts[has_pair], first_sep[has_pair], second_end[has_pair]
+    first_len = first_sep - line_starts
+    second_len = second_end - first_sep - 1
+    non_digits = np.concatenate([[0], np.cumsum((data < ord('0')) | (data > ord('9')), dtype=np.int32)])
+    first = parse_int_fields(data, non_digits, line_starts, first_len)
+    second = parse_int_fields(data, non_digits, first_sep + 1, second_len)
+
+    is_valid = (first >= 0) & (second >= 0) & (first_len != second_len)
+    if not is_valid.any():
+        sep_name = 'tab' if sep == '\t' else f"'{sep}'"
+        add_message(messages, f'None of {lines_count} line(s) has a seller and a product id of different lengths, '
+                              f'separated by {sep_name}, with digits only and up to {np.iinfo(np.int64).max}.')
+        return None
+
+    is_first_product = (first_len > second_len)[is_valid]
+    first, second = first[is_valid], second[is_valid]
+    return {
+        'seller_id': np.where(is_first_product, second, first),
+        'product_id': np.where(is_first_product, first, second)
+    }
+
+
+# pairs from a .csv (comma separated) or any other, tab separated, text file. Same rules as for pasted pairs, so a
+# header line is just skipped.
+def validate_extra_input_f(extra_input_f_path: str, messages: list = None):
+    try:
+        with open(extra_input_f_path) as extra_input_f:
+            extra_input = extra_input_f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        add_message(messages, f'Failed to read extra input file: {e}')
+        return None
+
+    first_line = extra_input.split('\n', 1)[0]
+    sep = '\t' if '\t' in first_line or not extra_input_f_path.endswith('.csv') else ','
+    return validate_extra_input(extra_input, sep, messages)
+
 
 def validate_size(user_size: str, max_size: int = COLL_MAX_SIZE):
     user_size = int(user_size)
@@ -61,7 +484,17 @@ def validate_size(user_size: str, max_size: int = COLL_MAX_SIZE):
         return max_size
 
 
-def validate_cat_ids(user_cats: str, cats_in_src: list):
+# end date of a collection as YYYY-MM-DD, ValueError if it's not a date or already in the past
+def validate_end_date(end_date):
+    if isinstance(end_date, str):
+        end_date = date.fromisoformat(end_date.strip())
+    if end_date < date.today():
+        raise ValueError(f'End date {end_date} is in the past.')
+    return end_date
+
+
+# cats_in_src is a set, or SourceProfile values, of category ids in the source
+def validate_cat_ids(user_cats: str, cats_in_src):
     valid_cat_ids = []
     try:
         user_cats = list(set(user_cats.split('\n')))
@@ -0,0 +1,71 @@
+import queue
+import threading
+from concurrent.futures import CancelledError
+
+
+# Runs one task at a time on a background thread, so parsing, generation and saving never block the Tk main loop.
+# A task is called with a progress function and the cancel event, and stops by raising CancelledError. Progress
+# events, the result, an error or the cancellation are queued by the worker thread and handed over to callbacks on the
+# main thread, polled with after().
+class Worker:
+    POLL_MS = 100
+
+    def __init__(self, root):
+        self.root = root
+        self.is_running = False
+        self.cancel_event = threading.Event()
+
+    # busy from submit until callback of the task's outcome is called, so that callback can already submit a next task
+    def is_busy(self):
+        return self.is_running
+
+    def submit(self, task, on_done, on_progress=None, on_error=None, on_cancel=None):
+        if self.is_busy():
+            return False
+
+        events = queue.Queue()
+        self.is_running = True
+        self.cancel_event = threading.Event()
+        threading.Thread(target=self.run, args=(task, events, self.cancel_event), daemon=True).start()
+        self.root.after(self.POLL_MS, self.poll, events, on_done, on_progress, on_error, on_cancel)
+        return True
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @staticmethod
+    def run(task, events: queue.Queue, cancel_event: threading.Event):
+        try:
+            # a task that finished did its work, also if cancel was clicked meanwhile, so only raising cancels it
+            result = task(lambda event: events.put(('progress', event)), cancel_event)
+            events.put(('done', result))
+        except CancelledError:
+            events.put(('cancelled', None))
+        except Exception as e:
+            events.put(('error', e))
+
+    def poll(self, events: queue.Queue, on_done, on_progress, on_error, on_cancel):
+        # only the latest progress event is shown, older ones are already out of date
+        last_progress = None
+        while True:
+            try:
+                kind, value = events.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == 'progress':
+                last_progress = value
+                continue
+
+            self.is_running = False
+            if kind == 'done':
+                on_done(value)
+            elif kind == 'error' and on_error is not None:
+                on_error(value)
+            elif kind == 'cancelled' and on_cancel is not None:
+                on_cancel()
+            return
+
+        if last_progress is not None and on_progress is not None:
+            on_progress(last_progress)
+        self.root.after(self.POLL_MS, self.poll, events, on_done, on_progress, on_error, on_cancel)
@@ -1,12 +1,42 @@
+import os
+
 PROJECT_DIR = r'C:\Users\Dan\PycharmProjects\CollectionsGenerator'
+# directory of this file, for data written by the app itself on any machine
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 DEF_F_EXTENSION = [("csv file(*.csv)", "*.csv")]
 COLL_MAX_SIZE = 5000
+SRC_CHUNK_SIZE = 100000
 CMS_UPLOAD_F_HEADERS = ['sellerid', 'productid', 'stock']
 EXPORT_F_PARTIAL = f'collection_*_filtered_items*.csv'
 DOWNLOAD_WAIT_T = 60
 UPLOAD_WAIT_T = 60
+# read upload files back after writing and validate them again, on top of validation before the write
+UPLOAD_PARANOID_CHECK = False
+# gzip upload and full files, .gz is added to their names
+EXPORT_GZIP = False
+# stage trace of every collection is saved as upload_<id>_trace.json next to its upload file, with bytes allocated by
+# every stage if COLL_TRACE_ALLOC (slows generation down, tracemalloc is kept on once started)
+COLL_TRACE_SAVE = False
+COLL_TRACE_ALLOC = False
+# filter and sort results kept per loaded source, reused by Create when only e.g. size or ratio changed
+ROWS_MEMO_MAX_BYTES = 256 * 1024 ** 2
 ITEMS_FAILED_LIMIT = 10
 DOWNLOADS_DIR = r'C:\Users\Dan\Downloads'
 UPLOADS_DIR = fr'{PROJECT_DIR}\demo\uploads'
+# product ids of running collections, registered with their end date and excluded from new ones on request
+EXCLUSION_STORE_DIR = os.path.join(ROOT_DIR, 'exclusions')
+# every upload file generated, recorded with its seller and product ids to look up collections a product was in.
+# Off by default, batch records with --history
+COLL_HISTORY_SAVE = False
+COLL_HISTORY_DIR = os.path.join(ROOT_DIR, 'history')
+SRC_CACHE_ON = True
+SRC_CACHE_DIR = os.path.join(ROOT_DIR, 'cache')
+SRC_CACHE_MAX_BYTES = 2 * 1024 ** 3
+SRC_CACHE_SAMPLE_SIZE = 1024 ** 2
 CMS_COLL_COLUMNS = ['Seller ID', 'Product ID', 'Price', 'Old Price', 'ADO', 'Stock', 'Rating', 'Offshore Seller']
 BANK_COLL_COLUMNS = ['seller_id', 'product_id', 'price', 'ado', 'discount', 'category_id', 'cluster', 'rating', 'seller_type']
+# how every source column is typed at load: int - int32 or int64 if needed, price - float64 also from numbers
+# with thousands separators, metric - float32 or int if whole numbers, label - categorical, flag - bool
+CMS_COLL_SCHEMA = dict(zip(CMS_COLL_COLUMNS, ['int', 'int', 'price', 'price', 'metric', 'int', 'metric', 'flag']))
+BANK_COLL_SCHEMA = dict(zip(BANK_COLL_COLUMNS, ['int', 'int', 'price', 'metric', 'metric', 'int', 'label', 'metric',
+                                                'label']))
@@ -1,10 +1,13 @@
+import asyncio
+import json
 import os
-from glob import glob
-from time import sleep
 from datetime import datetime
 from typing import Union
+import numpy as np
 import pandas as pd
 from models.Collection import CmsColl, BankColl
+from models.DownloadWatcher import DownloadWatcher
+from models.ExportWriter import ExportWriter
 import config
 
 
@@ -22,6 +25,14 @@ class CmsFileHelper:
         self.upload_f_dir = config.UPLOADS_DIR
         self.upload_headers = ['sellerid', 'productid', 'stock']
         self.upload_f_count = None
+        self.full_f_path = None
+        self.compress_export = config.EXPORT_GZIP
+        self.upload_report = None
+        self.paranoid_check = config.UPLOAD_PARANOID_CHECK
+        self.save_trace = config.COLL_TRACE_SAVE
+        self.trace_f_path = None
+        # every upload file written is recorded in history, if set
+        self.history = None
         self.messages = []
         self.totals = {
             'ori': '',
@@ -49,44 +60,54 @@ class CmsFileHelper:
         if download_directory is None:
             download_directory = self.download_dir
 
-        try:
-            os.chdir(download_directory)
-        except:
-            self.add_message('Incorrect download directory')
+        if not self.get_expected_files([self], click_time, wait_t_s, download_directory, [f_name_partial]):
+            return False
+        return self.cms_ori_export_f
+
+    # waits for exports of many collections at once, all under one deadline. Returns True only if all of them were
+    # found, file helpers of exports not found get a message.
+    @staticmethod
+    def get_expected_files(file_helpers: list, click_time: datetime, wait_t_s: int = None,
+                           download_directory: str = None, f_name_partials: list = None):
+        if wait_t_s is None:
+            wait_t_s = config.DOWNLOAD_WAIT_T
+
+        if download_directory is None:
+            download_directory = config.DOWNLOADS_DIR
+
+        if not os.path.isdir(download_directory):
+            for fh in file_helpers:
+                fh.add_message('Incorrect download directory')
             return False
 
-        # flist = glob(f_name) #- this returns list of files matching f_name
-        # max(flist, key=os.path.getctime) #- this returns the latest file in the list
-        elapsed_time = 0
-        # basically while no file found created after the click time datetime
+        if f_name_partials is None:
+            f_name_partials = [fh.cms_export_f_name_partial for fh in file_helpers]
+
+        patterns = dict(enumerate(f_name_partials))
+        print(f"Waiting {wait_t_s} seconds for download...")
         try:
-            while datetime.fromtimestamp(
-                    os.path.getctime(max(glob(f_name_partial), key=os.path.getctime, default=0))) < click_time:
-                print(F"Waiting {wait_t_s - elapsed_time} seconds for download...")
-                sleep(5)
-                elapsed_time += 5
-                if elapsed_time >= wait_t_s:
-                    return False
-            latest_export = max(glob(f_name_partial), key=os.path.getctime, default=0)
-            if datetime.fromtimestamp(os.path.getctime(latest_export)) > click_time:
-                print(latest_export)
-                self.cms_ori_export_f = latest_export
-                self.cms_ori_export_f_path = fr'{download_directory}\{latest_export}'
-                return latest_export
+            found = asyncio.run(DownloadWatcher(download_directory).wait_for(patterns, click_time, wait_t_s))
         except Exception as e:
-            self.add_message(f'Exception occurred while waiting for file download.\n{e}')
+            for fh in file_helpers:
+                fh.add_message(f'Exception occurred while waiting for file download.\n{e}')
             print(e)
             return False
 
-    # upload file can be prepared from a dataframe's seller and product id lists or from a collection cms export file
-    def prepare_upload_f(self, backup: bool = False, output_f_dir: str = None, seller_product_ids: dict = None, src_f_path: str = None):
-        if output_f_dir is None:
-            if self.upload_f_dir:
-                output_f_dir = self.upload_f_dir
-            else:
-                self.add_message('Incorrect file upload output directory.')
-                return False
+        for i, fh in enumerate(file_helpers):
+            if found[i] is None:
+                fh.add_message(f'No file {patterns[i]} downloaded within {wait_t_s} seconds.')
+                continue
+            print(found[i])
+            fh.cms_ori_export_f = found[i]
+            fh.cms_ori_export_f_path = os.path.join(download_directory, found[i])
+
+        return None not in found.values()
 
+    # upload file can be prepared from a dataframe's seller and product id lists or from a collection cms export file
+    # ids are validated in memory before anything is written. With paranoid check, the written file is also read back
+    # and validated again.
+    def prepare_upload_f(self, backup: bool = False, output_f_dir: str = None, seller_product_ids: dict = None,
+                         src_f_path: str = None, paranoid: bool = None):
         if seller_product_ids is None and src_f_path is None:
             self.add_message("Can't prepare upload file. No source.")
             return False
@@ -94,17 +115,52 @@ class CmsFileHelper:
         if seller_product_ids is None:
             try:
                 df = pd.read_csv(src_f_path, usecols=['Seller ID', 'Product ID'])
-                df.rename(columns={'Seller ID': 'sellerid', 'Product ID': 'productid'}, inplace=True, errors="raise")
-                df['stock'] = ""
+                seller_product_ids = {
+                    'seller_id': df['Seller ID'].to_numpy(),
+                    'product_id': df['Product ID'].to_numpy()
+                }
             except:
                 self.add_message(f"ERROR: can't read file: {src_f_path}")
                 return False
-        elif src_f_path is None:
-            df = pd.DataFrame(columns=self.upload_headers)
-            df['sellerid'] = seller_product_ids['seller_id']
-            df['productid'] = seller_product_ids['product_id']
+
+        return self.write_upload_f(seller_product_ids, backup=backup, output_f_dir=output_f_dir, paranoid=paranoid)
+
+    # upload file and full file of a collection written at the same time, both from the same selected rows
+    def prepare_upload_and_full_f(self, collection: Union[CmsColl, BankColl], full_f_path: str = None,
+                                  backup: bool = False, output_f_dir: str = None, paranoid: bool = None):
+        seller_product_ids = {
+            'seller_id': collection.get_column('seller_id').to_numpy(),
+            'product_id': collection.get_column('product_id').to_numpy()
+        }
+        return self.write_upload_f(seller_product_ids, collection, full_f_path, backup, output_f_dir, paranoid)
+
+    def get_export_f_path(self, f_path: str):
+        if self.compress_export and not f_path.endswith('.gz'):
+            return f'{f_path}.gz'
+        return f_path
+
+    def write_upload_f(self, seller_product_ids: dict, collection: Union[CmsColl, BankColl] = None,
+                       full_f_path: str = None, backup: bool = False, output_f_dir: str = None, paranoid: bool = None):
+        if paranoid is None:
+            paranoid = self.paranoid_check
+
+        if output_f_dir is None:
+            if self.upload_f_dir:
+                output_f_dir = self.upload_f_dir
+            else:
+                self.add_message('Incorrect file upload output directory.')
+                return False
 
         try:
+            seller_ids = np.asarray(seller_product_ids['seller_id'])
+            product_ids = np.asarray(seller_product_ids['product_id'])
+            self.upload_report = self.validate_upload_ids(seller_ids, product_ids)
+            self.upload_f_count = self.upload_report['count']
+            if not self.upload_report['is_valid']:
+                self.add_message('Upload file not generated, invalid seller/product ids.')
+                self.add_message(self.get_upload_report_messages(self.upload_report))
+                return False
+
             if backup:
                 f_name = f'backup_{self.upload_f_name}'
             else:
@@ -112,7 +168,24 @@ class CmsFileHelper:
 
             if self.upload_f_path is None:
                 self.upload_f_path = fr'{output_f_dir}\{f_name}'
-            df[['sellerid', 'productid', 'stock']].to_csv(self.upload_f_path, index=False)
+            self.upload_f_path = self.get_export_f_path(self.upload_f_path)
+
+            writer = ExportWriter(self.compress_export)
+            if full_f_path is None:
+                writer.write_upload(self.upload_f_path, seller_ids, product_ids)
+            else:
+                self.full_f_path = self.get_export_f_path(full_f_path)
+                writer.write_upload_and_full(self.upload_f_path, seller_ids, product_ids, self.full_f_path,
+                                             collection.iter_df_blocks(writer.BLOCK_ROWS))
+
+            if self.save_trace and collection is not None:
+                self.write_trace_f(collection)
+            if self.history is not None:
+                self.record_history(seller_ids, product_ids)
+
+            if not paranoid:
+                return True
+
             is_valid, product_count = self.is_upload_f_valid(self.upload_f_path)
             self.upload_f_count = product_count
 
@@ -126,6 +199,34 @@ class CmsFileHelper:
             print(str(e))
             return False
 
+    # trace of the collection's generation next to its upload file, e.g. upload_123_trace.json. A trace that can't be
+    # written doesn't fail the upload file.
+    def write_trace_f(self, collection: Union[CmsColl, BankColl]):
+        f_path = self.upload_f_path
+        for extension in ['.gz', '.csv']:
+            if f_path.endswith(extension):
+                f_path = f_path[:-len(extension)]
+        self.trace_f_path = f'{f_path}_trace.json'
+
+        trace = collection.get_trace().to_dict()
+        trace['coll_id'] = self.coll_id
+        trace['rows'] = collection.get_total_size()
+        trace['messages'] = list(collection.get_messages())
+        try:
+            with ExportWriter().open_atomic(self.trace_f_path) as f:
+                f.write(json.dumps(trace, indent=2).encode())
+        except OSError as e:
+            self.add_message(f'Trace file not saved: {self.trace_f_path}')
+            print(e)
+
+    # upload file that can't be recorded in history doesn't fail either
+    def record_history(self, seller_ids: np.ndarray, product_ids: np.ndarray):
+        try:
+            self.history.record(self.coll_id, seller_ids, product_ids, upload_f_path=self.upload_f_path)
+        except (OSError, ValueError) as e:
+            self.add_message('Upload file not recorded in collection history.')
+            print(e)
+
     def prepare_full_f(self, collection: Union[CmsColl, BankColl], output_f_dir: str = None):
         try:
             if output_f_dir is None:
@@ -137,9 +238,9 @@ class CmsFileHelper:
 
                 f_name = f'{self.coll_id}_full.csv'
                 if self.upload_f_path is None:
-                    self.upload_f_path = fr'{output_f_dir}\{f_name}'
-                df = collection.get_df()
-                df[df.columns.tolist()].to_csv(self.upload_f_path, index=False)
+                    self.upload_f_path = self.get_export_f_path(fr'{output_f_dir}\{f_name}')
+                writer = ExportWriter(self.compress_export)
+                writer.write_full(self.upload_f_path, collection.iter_df_blocks(writer.BLOCK_ROWS))
 
         except Exception as e:
             self.add_message('Full file not generated')
@@ -147,51 +248,102 @@ class CmsFileHelper:
 
     def prepare_custom_full_f(self, collection: Union[CmsColl, BankColl], output_full_path: str):
         try:
-            df = collection.get_df()
-            df[df.columns.tolist()].to_csv(output_full_path, index=False)
+            self.full_f_path = self.get_export_f_path(output_full_path)
+            writer = ExportWriter(self.compress_export)
+            writer.write_full(self.full_f_path, collection.iter_df_blocks(writer.BLOCK_ROWS))
             return True
         except Exception as e:
             self.add_message('Full file not generated')
             return False
 
 
+    # positions of missing values and of values that don't end up as integers in a csv file
     @staticmethod
-    def are_all_values_instance_of(val_type, column):
-        try:
-            return all(isinstance(x, val_type) for x in column)
-        except:
-            print("ERROR: couldn't check instance type of all values in column.")
-            return False
+    def get_invalid_id_rows(ids: np.ndarray):
+        if ids.dtype.kind in 'iu':
+            return np.array([], dtype=np.intp), np.array([], dtype=np.intp)
+
+        null_mask = pd.isna(ids)
+        if ids.dtype.kind == 'f' or ids.dtype.kind == 'b':
+            # floats are written with a decimal point, bools as True/False
+            not_int_mask = ~null_mask
+        else:
+            not_int_mask = ~null_mask & ~pd.Series(ids).astype(str).str.fullmatch(r'-?\d+').to_numpy(dtype=bool)
+        return np.flatnonzero(null_mask), np.flatnonzero(not_int_mask)
+
+    # upload ids checked before writing: both columns non-empty and of equal length, every value an integer and every
+    # seller id lower than product id of its row. Offending rows are listed by position.
+    @staticmethod
+    def validate_upload_ids(seller_ids, product_ids):
+        seller_ids = np.asarray(seller_ids)
+        product_ids = np.asarray(product_ids)
+        report = {
+            'is_valid': False,
+            'count': int(np.count_nonzero(~pd.isna(product_ids))),
+            'is_empty': len(seller_ids) == 0 or len(product_ids) == 0,
+            'is_length_mismatch': len(seller_ids) != len(product_ids),
+            'null_rows': {},
+            'not_int_rows': {},
+            'order_rows': []
+        }
+
+        ids = {}
+        for key, col_ids in [('sellerid', seller_ids), ('productid', product_ids)]:
+            null_rows, not_int_rows = CmsFileHelper.get_invalid_id_rows(col_ids)
+            report['null_rows'][key] = null_rows.tolist()
+            report['not_int_rows'][key] = not_int_rows.tolist()
+            ids[key] = col_ids
+
+        if report['is_empty'] or report['is_length_mismatch']:
+            return report
+
+        # order is only compared for rows where both ids are valid
+        valid_mask = np.ones(len(seller_ids), dtype=bool)
+        for key in ids:
+            valid_mask[report['null_rows'][key]] = False
+            valid_mask[report['not_int_rows'][key]] = False
+        valid_rows = np.flatnonzero(valid_mask)
+        seller_nums = pd.to_numeric(pd.Series(ids['sellerid'][valid_rows])).to_numpy()
+        product_nums = pd.to_numeric(pd.Series(ids['productid'][valid_rows])).to_numpy()
+        report['order_rows'] = valid_rows[~(seller_nums < product_nums)].tolist()
+
+        report['is_valid'] = (not any(report['null_rows'].values()) and not any(report['not_int_rows'].values())
+                              and len(report['order_rows']) == 0)
+        return report
+
+    @staticmethod
+    def get_upload_report_messages(report: dict, max_rows: int = 10):
+        messages = []
+        if report['is_empty']:
+            messages.append('No seller/product ids.')
+        if report['is_length_mismatch']:
+            messages.append('Seller and product ids are of different length.')
+        for key in ['sellerid', 'productid']:
+            if report['null_rows'][key]:
+                messages.append(f"Missing {key} in rows: {report['null_rows'][key][:max_rows]}.")
+            if report['not_int_rows'][key]:
+                messages.append(f"Not an integer {key} in rows: {report['not_int_rows'][key][:max_rows]}.")
+        if report['order_rows']:
+            messages.append(f"Seller id not lower than product id in rows: {report['order_rows'][:max_rows]}.")
+        return messages
 
     def is_upload_f_valid(self, f_path):
         try:
             df = pd.read_csv(f_path)
         except:
             print(f"ERROR: can't read file: {f_path}")
-            return False
+            return False, 0
         # check headers
-        try:
-            headers = list(df.columns)
-            if headers != self.upload_headers:
-                print("ERROR: incorrect headers.")
-                return False
-        except:
+        if list(df.columns) != self.upload_headers:
             print("ERROR: incorrect headers.")
+            return False, 0
 
-        # check if first two columns are equal length and values are numbers
-        if not (df['sellerid'].count() == df['productid'].count() != 0):
-            return False, df['productid'].count()
-
-        if not (self.are_all_values_instance_of(int, df["sellerid"]) and (self.are_all_values_instance_of(int,
-                                                                                                        df["productid"]))):
-            return False, df['productid'].count()
-
-        # check if seller id is shorter than product id.
-        if not (all([(i < j) for i, j in zip(df['sellerid'], df['productid'])])):
-            return False, df['productid'].count()
+        report = self.validate_upload_ids(df['sellerid'].to_numpy(), df['productid'].to_numpy())
+        for message in self.get_upload_report_messages(report):
+            print(f'ERROR: {message}')
 
         # check if last column is empty. Stock column is actually never filled
         if not df['stock'].count() == 0:
-            return False, df['productid'].count()
+            return False, report['count']
 
-        return True, df['productid'].count()
+        return report['is_valid'], report['count']
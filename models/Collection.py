@@ -1,26 +1,298 @@
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import date
 from typing import Union
-from config import COLL_MAX_SIZE, CMS_COLL_COLUMNS, BANK_COLL_COLUMNS
+from config import COLL_MAX_SIZE, CMS_COLL_COLUMNS, BANK_COLL_COLUMNS, COLL_TRACE_ALLOC
+from models.ExclusionStore import ExclusionStore
+from models.FilterPlanner import FilterPlanner
+from models.MatchCounter import MatchCounter
+from models.RowsMemo import RowsMemo
+from models.SourceIndex import SourceIndex
+from models.SourceProfile import SourceProfile
+from models.StageTrace import StageTrace
+import numpy as np
 import pandas as pd
 
 
 class Collection:
-    def __init__(self, df):
-        self.df = df
+    # with view=True the given df is kept as an immutable base and filtering, sorting and shuffling only move an
+    # array of row positions over it. Rows are gathered when the df is requested, e.g. at export.
+    def __init__(self, df, view: bool = False):
+        self._df = None
+        # source the collection was created from, extra input is enriched from it
+        self.src_df = df
+        self.base_df = None
+        self.positions = None
+        self.head_df = None
+        self.index = None
+        self.memo = None
+        self.profile = None
+        self.match_counter = None
+        self.exclusion_store = None
+        if view:
+            self.base_df = df
+        else:
+            self._df = df
         self.extra_input = None
         self.is_extra_input_merged = False
         self.size_max = COLL_MAX_SIZE
         self.columns = {}
         self.local_to_offshore = {}
         self.messages = []
+        self.progress = None
+        self.cancel_event = None
+        self.trace = StageTrace(COLL_TRACE_ALLOC)
+
+    @property
+    def df(self):
+        return self.get_df()
+
+    @df.setter
+    def df(self, new_df):
+        self.set_df(new_df)
+
+    def is_view(self):
+        return self.base_df is not None
+
+    def get_positions(self):
+        if self.positions is None:
+            return np.arange(len(self.base_df))
+        return self.positions
 
     def get_df(self):
-        return self.df
+        if not self.is_view():
+            return self._df
+
+        df = self.base_df if self.positions is None else self.base_df.iloc[self.positions]
+        if self.head_df is not None:
+            df = pd.concat([self.head_df, df])
+        return df
 
+    # setting a df directly leaves view mode
     def set_df(self, new_df):
-        self.df = new_df
+        self._df = new_df
+        self.base_df = None
+        self.positions = None
+        self.head_df = None
+        self.index = None
+        self.memo = None
+        self.profile = None
+        self.match_counter = None
+
+    # one collection per criteria dict, all viewing the same df. Index and memo are built once and shared, so filter
+    # postings and sorted orders the criteria have in common are only computed once. Collections are generated on a
+    # thread pool and returned in order of criteria.
+    @classmethod
+    def process_many(cls, df, criteria_list: list, index: SourceIndex = None, memo: RowsMemo = None,
+                     max_workers: int = None, exclusion_store: ExclusionStore = None):
+        colls = [cls(df, view=True) for _ in criteria_list]
+        if len(colls) == 0:
+            return colls
+
+        if index is None:
+            index = colls[0].build_index()
+        if memo is None:
+            memo = RowsMemo()
+        for coll in colls:
+            coll.set_index(index)
+            coll.set_memo(memo)
+            coll.set_exclusion_store(exclusion_store)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(lambda coll, criteria: coll.process_by_criteria(criteria), colls, criteria_list))
+
+        return colls
+
+    # index of the base of a view, built once per source and reusable by every view of it
+    def build_index(self):
+        values = {key: self.base_df[self.columns[key]] for key in SourceIndex.INDEXED_KEYS if key in self.columns}
+        self.set_index(SourceIndex(values, self.to_numeric_prices(self.base_df[self.columns['price']])))
+        return self.index
+
+    def set_index(self, index: SourceIndex):
+        self.index = index
+
+    # memo of the base of a view, same as the index shared by every view of it
+    def set_memo(self, memo: RowsMemo):
+        self.memo = memo
+
+    # products of running collections, left out with the exclude_used criterion
+    def set_exclusion_store(self, exclusion_store: ExclusionStore):
+        self.exclusion_store = exclusion_store
+
+    # products used by running collections as a FilterPlanner predicate. Postings of all rows are shared per version
+    # of the store and day, as ids registered since or expired by then change them.
+    def add_exclusion_predicate(self, planner: FilterPlanner, criteria: dict):
+        if not criteria.get('exclude_used'):
+            return
+        if self.exclusion_store is None:
+            self.add_message('No exclusion store set, used products not excluded.')
+            return
+
+        unused_predicate = lambda rows: ~self.exclusion_store.contains(
+            self.get_column_at('product_id', rows).to_numpy())
+        planner.add('exclude_used', unused_predicate,
+                    self.get_shared_postings(self.get_exclusion_key(criteria), unused_predicate))
+
+    def get_exclusion_key(self, criteria: dict):
+        if not criteria.get('exclude_used') or self.exclusion_store is None:
+            return None
+        return 'exclude_used', self.exclusion_store.get_version(), date.today().isoformat()
+
+    # profile of the source the collection was created from, see SourceProfile
+    def build_profile(self):
+        self.set_profile(SourceProfile.from_df(self.src_df, self.columns))
+        return self.profile
+
+    def set_profile(self, profile: SourceProfile):
+        self.profile = profile
+
+    # counts of source rows matching criteria filters, see MatchCounter and count_matches
+    def build_match_counter(self):
+        values = {key: self.src_df[self.columns[key]] for key in ['cluster', 'cat_id', 'seller_type']
+                  if key in self.columns}
+        if 'stock' in self.columns:
+            values['in_stock'] = self.src_df[self.columns['stock']] != 0
+        self.set_match_counter(MatchCounter(values, self.to_numeric_prices(self.src_df[self.columns['price']])))
+        return self.match_counter
+
+    def set_match_counter(self, match_counter: MatchCounter):
+        self.match_counter = match_counter
+
+    # source rows filter_by_criteria would leave, as total and Local and Offshore ones, without filtering. Cluster and
+    # categories not present in source are ignored the same way.
+    def count_matches(self, criteria: dict):
+        values = {}
+        if criteria['cluster'] and self.match_counter.has_rows({'cluster': [criteria['cluster']]}):
+            values['cluster'] = [criteria['cluster']]
+        if criteria['cat_id'] and self.match_counter.has_key('cat_id'):
+            cat_ids = [int(val) for val in (str(val).strip() for val in criteria['cat_id']) if val.isnumeric()]
+            valid_cats = [val for val in cat_ids if self.match_counter.has_rows(dict(values, cat_id=[val]))]
+            if valid_cats:
+                values['cat_id'] = valid_cats
+        if criteria['out_of_stock'] and self.match_counter.has_key('in_stock'):
+            values['in_stock'] = [True]
+
+        low, high = None, None
+        if criteria['price_min'] or criteria['price_max']:
+            low, high = self.get_price_band(criteria['price_min'], criteria['price_max'])[:2]
+
+        counts = self.match_counter.count(values, low, high)
+        return {
+            'total': sum(counts.values()),
+            'local': counts.get(self.local_to_offshore['local'], 0),
+            'offshore': counts.get(self.local_to_offshore['offshore'], 0)
+        }
+
+    # profile values are only values of current rows while those are still all rows of the source
+    def is_profile_usable(self, key: str):
+        if self.profile is None or not self.profile.has_key(key):
+            return False
+        return self.is_base_aligned() if self.is_view() else self._df is self.src_df
+
+    def is_index_usable(self):
+        return self.index is not None and self.is_view() and self.head_df is None
+
+    # rows of a view are still all rows of its base
+    def is_base_aligned(self):
+        return self.is_view() and self.head_df is None and self.positions is None
+
+    # with the index, filters can start from postings only while rows are still all rows of the base
+    def is_index_aligned(self):
+        return self.index is not None and self.is_base_aligned()
+
+    # postings of a FilterPlanner predicate over all rows of the base, computed once and kept in the memo. Without
+    # postings from the index, the predicate itself is evaluated on all rows.
+    def get_shared_postings(self, key: tuple, predicate, postings=None):
+        if self.memo is None or not self.is_base_aligned():
+            return postings
+        if postings is None:
+            postings = lambda: np.flatnonzero(predicate(np.arange(len(self.base_df))))
+        return lambda: self.memo.get(key, postings)
+
+    # rank of every base row in a stable descending sort of all base rows by sort keys
+    def get_base_ranks(self, sort_keys: list):
+        keys_df = pd.DataFrame({key: self.base_df[self.columns[key]].to_numpy() for key in sort_keys})
+        order = keys_df.sort_values(by=sort_keys, ascending=False, kind='stable').index.to_numpy()
+        ranks = np.empty(len(order), dtype=np.intp)
+        ranks[order] = np.arange(len(order))
+        return ranks
+
+    # keeps current rows whose base positions are in ascending base_rows
+    def keep_base_rows(self, base_rows):
+        if self.positions is None:
+            self.positions = base_rows
+        else:
+            self.keep(SourceIndex.contains(self.positions, base_rows))
+
+    # ascending positions within current rows having given value
+    def get_value_rows(self, column_key, value):
+        if self.is_index_usable() and self.index.has_key(column_key):
+            base_rows = self.index.get_rows(column_key, [value])
+            if self.positions is None:
+                return base_rows
+            return np.flatnonzero(SourceIndex.contains(self.positions, base_rows))
+        return np.flatnonzero((self.get_column(column_key) == value).to_numpy())
+
+    # view collections drop back to all rows of their base without copying anything
+    def reset(self):
+        if not self.is_view():
+            return
+        self.positions = None
+        self.head_df = None
+        self.extra_input = None
+        self.is_extra_input_merged = False
+        self.size_max = COLL_MAX_SIZE
+        self.trace = StageTrace(COLL_TRACE_ALLOC)
+
+    def get_column(self, column_key):
+        col_name = self.columns[column_key]
+        if not self.is_view():
+            return self._df[col_name]
+
+        column = self.base_df[col_name]
+        if self.positions is not None:
+            column = column.iloc[self.positions]
+        if self.head_df is not None:
+            column = pd.concat([self.head_df[col_name], column])
+        return column
+
+    # values of a column at given positions within current rows, without extra input head rows
+    def get_column_at(self, column_key, rows):
+        col_name = self.columns[column_key]
+        if not self.is_view():
+            return self._df[col_name].iloc[rows]
+        return self.base_df[col_name].iloc[self.get_positions()[rows]]
 
     def get_column_values(self, column_key):
-        return list(self.df[self.columns[column_key]].values)
+        return list(self.get_column(column_key).values)
+
+    def get_columns_df(self, col_names: list):
+        if not self.is_view():
+            return self._df[col_names]
+        if self.positions is None:
+            return self.base_df[col_names]
+        return self.base_df[col_names].iloc[self.positions]
+
+    # rows are positions within current rows of the collection
+    def take(self, rows):
+        if self.is_view():
+            self.positions = self.get_positions()[rows]
+        else:
+            self._df = self._df.iloc[rows]
+
+    def keep(self, mask):
+        self.take(np.flatnonzero(np.asarray(mask, dtype=bool)))
+
+    def truncate(self, size: int):
+        if not self.is_view():
+            self._df = self._df[:size]
+            return
+
+        if self.head_df is not None:
+            self.head_df = self.head_df[:size]
+            size -= len(self.head_df)
+        self.positions = self.get_positions()[:size]
 
     def get_extra_input_size(self):
         if self.extra_input is None:
@@ -29,7 +301,13 @@ class Collection:
             return len(self.extra_input)
 
     def get_df_size(self):
-        return len(self.df)
+        if not self.is_view():
+            return len(self._df)
+
+        head_size = 0 if self.head_df is None else len(self.head_df)
+        if self.positions is None:
+            return head_size + len(self.base_df)
+        return head_size + len(self.positions)
 
     def get_total_size(self):
         if self.is_extra_input_merged:
@@ -46,142 +324,438 @@ class Collection:
         elif isinstance(message, str):
             self.messages.append(message)
 
-    def shuffle(self, ratio: dict, inplace=True):
-        df = self.get_df()
-
-        # if one of ratio values is 0, skip shuffling and return df filtered by non-zero value
+    # progress gets current stage of process_by_criteria and rows still in the collection. Processing stops with
+    # CancelledError at the next stage, once cancel_event is set.
+    def set_progress(self, progress, cancel_event=None):
+        self.progress = progress
+        self.cancel_event = cancel_event
+
+    def report_stage(self, stage: str):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise CancelledError()
+        if self.progress is not None:
+            self.progress({'stage': stage, 'rows': self.get_total_size()})
+
+    # trace of the last process_by_criteria, see StageTrace
+    def get_trace(self):
+        return self.trace
+
+    def trace_stage(self, stage: str):
+        return self.trace.stage(stage, self.get_total_size(), self.get_total_size)
+
+    def set_traced_extra_input(self, extra_input_seller_product: dict):
+        with self.trace.stage('extra_input', len(extra_input_seller_product['product_id']),
+                              self.get_extra_input_size):
+            self.set_extra_input(extra_input_seller_product)
+
+    # slot positions of a weighted interleave of groups, one array per group. Slots are filled in blocks, every block
+    # taking as many rows of each group as its weight, groups in given order, and a group that runs out just lets the
+    # others continue. Row k of a group is keyed by its block, the group and k within the block, so slots are ranks of
+    # those keys. Keys of every group are already ascending, so the stable sort only merges them. Only rows that can
+    # land within the first size_max slots are keyed. Weights must be positive.
+    @staticmethod
+    def get_interleave_slots(group_lens: list, weights: list, size_max: int = None):
+        total = sum(group_lens)
+        if size_max is None or size_max > total:
+            size_max = total
+
+        block_size = sum(weights)
+        group_offsets = np.cumsum([0] + list(weights[:-1]))
+        keys = []
+        for group_len, weight, group_offset in zip(group_lens, weights, group_offsets):
+            group_c = np.arange(min(group_len, size_max), dtype=np.int64)
+            keys.append((group_c // weight) * block_size + group_offset + group_c % weight)
+
+        slots = np.empty(sum(len(group_keys) for group_keys in keys), dtype=np.intp)
+        slots[np.argsort(np.concatenate(keys), kind='stable')] = np.arange(len(slots))
+        group_slots = np.split(slots, np.cumsum([len(group_keys) for group_keys in keys])[:-1])
+
+        return [slots[slots < size_max] for slots in group_slots]
+
+    # ascending positions of rows of every value, in order of values. Without the index, rows of all values are found
+    # in a single pass over the column.
+    def get_groups_rows(self, column_key, values: list):
+        if self.is_index_usable() and self.index.has_key(column_key):
+            return [self.get_value_rows(column_key, value) for value in values]
+
+        codes = pd.Index(values).get_indexer(self.get_column(column_key))
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+        return [order[bounds[i]:bounds[i + 1]] for i in range(len(values))]
+
+    # rows of every group interleaved by weights, with sort keys applied within every group. Each group only gets as
+    # many top rows sorted as it has slots within size_max.
+    def interleave_rows(self, groups_rows: list, weights: list, size_max: int = None, sort_keys: list = None):
+        if sort_keys is None:
+            sort_keys = []
+
+        groups_slots = self.get_interleave_slots([len(rows) for rows in groups_rows], weights, size_max)
+
+        interleaved_rows = np.empty(sum(len(slots) for slots in groups_slots), dtype=np.intp)
+        for rows, slots in zip(groups_rows, groups_slots):
+            interleaved_rows[slots] = self.get_top_rows(sort_keys, len(slots), rows)
+
+        return interleaved_rows
+
+    # rows interleaved by values of a column, weights map values to their weights in order of the interleave, e.g.
+    # {'Electronics': 2, 'FMCG': 1, 'Fashion': 1} for cluster. Rows of values without a weight aren't kept.
+    def get_interleaved_rows(self, column_key, weights: dict, size_max: int = None, sort_keys: list = None):
+        weights = {value: weight for value, weight in weights.items() if weight > 0}
+        groups_rows = self.get_groups_rows(column_key, list(weights))
+
+        missing_values = [value for value, rows in zip(weights, groups_rows) if len(rows) == 0]
+        if len(missing_values) > 0:
+            self.add_message(f'Interleave values not found: {missing_values}.')
+
+        return self.interleave_rows(groups_rows, list(weights.values()), size_max, sort_keys)
+
+    # first k rows out of given rows, in descending order of sort keys, same as a full stable sort would give them.
+    # With a numeric first key only rows not below its k-th largest value are sorted, instead of all of them.
+    def get_top_rows(self, sort_keys: list, k: int, rows):
+        if len(sort_keys) == 0:
+            return rows[:k]
+        if k is not None and k <= 0:
+            return rows[:0]
+
+        # with a memo, rows in base order are ordered by ranks of the base, sorted once for all views of it
+        if self.memo is not None and self.is_view() and self.head_df is None:
+            base_rows = self.get_positions()[rows]
+            if np.all(base_rows[1:] > base_rows[:-1]):
+                ranks = self.memo.get(('order', *sort_keys), lambda: self.get_base_ranks(sort_keys))[base_rows]
+                if k is not None and k < len(rows):
+                    top = np.argpartition(ranks, k - 1)[:k]
+                    return rows[top[np.argsort(ranks[top])]]
+                return rows[np.argsort(ranks)]
+
+        keys_df = pd.DataFrame({key: self.get_column_at(key, rows).to_numpy() for key in sort_keys})
+
+        if k is not None and k < len(rows) and pd.api.types.is_numeric_dtype(keys_df[sort_keys[0]]):
+            # NaN is sorted last, so it's treated as the lowest value
+            first_key = keys_df[sort_keys[0]].to_numpy(dtype=float, na_value=np.nan)
+            first_key = np.where(np.isnan(first_key), -np.inf, first_key)
+            kth_largest = np.partition(first_key, len(first_key) - k)[len(first_key) - k]
+            keys_df = keys_df.iloc[np.flatnonzero(first_key >= kth_largest)]
+
+        order = keys_df.sort_values(by=sort_keys, ascending=False, kind='stable').index.to_numpy()
+        return rows[order[:k]]
+
+    # with sort keys, every seller_type group only gets as many top rows sorted as it has slots within size_max
+    def get_shuffled_rows(self, ratio: dict, size_max: int = None, sort_keys: list = None):
+        if sort_keys is None:
+            sort_keys = []
+
+        local_rows, offshore_rows = self.get_groups_rows('seller_type', [self.local_to_offshore['local'],
+                                                                          self.local_to_offshore['offshore']])
+
+        # if one of ratio values is 0, skip shuffling and return rows of non-zero value
         if ratio['local'] == 0:
-            final_df = df.loc[df[self.columns['seller_type']] == self.local_to_offshore['offshore']]
-            if inplace:
-                self.set_df(final_df)
-                return
-            else:
-                return final_df
+            return self.get_top_rows(sort_keys, size_max, offshore_rows)
 
         if ratio['offshore'] == 0:
-            final_df = df.loc[df[self.columns['seller_type']] == self.local_to_offshore['local']]
-            if inplace:
-                self.set_df(final_df)
-                return
-            else:
-                return final_df
-
-        local_list = df.loc[df[self.columns['seller_type']] == self.local_to_offshore['local']].values.tolist()
-        offshore_list = df.loc[
-            df[self.columns['seller_type']] == self.local_to_offshore['offshore']].values.tolist()
-
-        local_len = len(local_list)
-        offshore_len = len(offshore_list)
+            return self.get_top_rows(sort_keys, size_max, local_rows)
 
         # if ratio has both non-zero values, but the df itself only has offshore or local products, so no point
         # shuffling
-        if local_len == 0 or offshore_len == 0:
+        if len(local_rows) == 0 or len(offshore_rows) == 0:
             self.add_message('Local or Offshore only products. Not shuffling.')
-            if inplace:
-                return
-            else:
-                return df
-
-        local_index_list = []
-        offshore_index_list = []
-
-        local_c = 0
-        offshore_c = 0
-        i = 0
-        loop_reps = local_len + offshore_len
-
-        while i < loop_reps:
-            # LOCAL
-            if local_c < local_len:
-                for _ in range(ratio['local']):
-                    if local_c < local_len:
-                        local_index_list.append(i)
-                        i += 1
-                        local_c += 1
-            # OFFSHORE
-            if offshore_c < offshore_len:
-                for _ in range(ratio['offshore']):
-                    if offshore_c < offshore_len:
-                        offshore_index_list.append(i)
-                        i += 1
-                        offshore_c += 1
-
-        shuffled_list = [None] * loop_reps
-
-        for index, row in zip(local_index_list, local_list):
-            shuffled_list[index] = row
-
-        for index, row in zip(offshore_index_list, offshore_list):
-            shuffled_list[index] = row
-
-        final_df = pd.DataFrame(shuffled_list, columns=list(df.columns))
+            return self.get_top_rows(sort_keys, size_max, np.arange(self.get_df_size()))
 
-        if inplace:
-            self.set_df(final_df)
-        else:
-            return final_df
+        # Local:Offshore is an interleave of two seller_type groups
+        return self.interleave_rows([local_rows, offshore_rows], [ratio['local'], ratio['offshore']], size_max,
+                                    sort_keys)
 
-    def filter_by_single_price_points(self, min_price, max_price, inplace=True):
-        new_df = None
-        # fix for numbers with commas like 1,500,232
-        try:
-            self.df[self.columns['price']] = self.df[self.columns['price']].str.replace(',', '').astype(float)
-        except Exception as e:
-            if str(e) != 'Can only use .str accessor with string values!':
-                print(e)
+    def shuffle(self, ratio: dict, inplace=True, size_max: int = None):
+        shuffled_rows = self.get_shuffled_rows(ratio, size_max)
 
-        # converting all prices to numeric values
-        self.df[self.columns['price']] = pd.to_numeric(self.df[self.columns['price']])
+        if inplace:
+            self.take(shuffled_rows)
+        else:
+            return self.get_df().iloc[shuffled_rows]
+
+    # keeps at most max_per_seller rows of every seller, the top ones in order of sort keys, or in current order without
+    # them. Rank of a row within its seller is a cumcount over that order, grouped by hashed seller codes, so it stays
+    # linear in rows. Only rows of sellers over the cap are ranked, the rest is kept as is, in current order.
+    def cap_per_seller(self, max_per_seller: int, sort_keys: list = None):
+        seller_codes = pd.factorize(self.get_column('seller_id'))[0]
+        is_over = np.bincount(seller_codes + 1)[seller_codes + 1] > max_per_seller
+        if not is_over.any():
+            return
 
+        order = np.flatnonzero(is_over)
+        if sort_keys:
+            order = self.get_top_rows(sort_keys, None, order)
+        seller_codes = seller_codes[order]
+        seller_ranks = pd.Series(seller_codes).groupby(seller_codes, sort=False).cumcount().to_numpy()
+
+        is_over[order[seller_ranks < max_per_seller]] = False
+        self.keep(~is_over)
+
+    # fix for numbers with commas like 1,500,232 and converting all prices to numeric values
+    @staticmethod
+    def to_numeric_prices(prices: pd.Series):
+        if not pd.api.types.is_numeric_dtype(prices):
+            prices = prices.astype(str).str.replace(',', '')
+        return pd.to_numeric(prices)
+
+    # returns boolean mask of prices within min/max, with min and max auto-reversed in case they're mixed up
+    @staticmethod
+    def get_price_mask(prices: pd.Series, min_price, max_price):
+        low, high, min_price, max_price = Collection.get_price_band(min_price, max_price)
+        mask = pd.Series(True, index=prices.index)
+        if low is not None:
+            mask &= prices >= low
+        if high is not None:
+            mask &= prices <= high
+
+        return mask, min_price, max_price
+
+    # inclusive low and high price of min/max criteria, None for no bound
+    @staticmethod
+    def get_price_band(min_price, max_price):
         if min_price and max_price == '':
-            new_df = self.df[(self.df[self.columns['price']] >= min_price)]
+            return min_price, None, min_price, max_price
         elif min_price == '' and max_price:
-            new_df = self.df[(self.df[self.columns['price']] <= max_price)]
+            return None, max_price, min_price, max_price
         elif min_price == max_price == '':
-            new_df = self.df.copy(deep=True)
+            return None, None, min_price, max_price
         elif min_price == max_price != '':
-            new_df = self.df[(self.df[self.columns['price']] == min_price)]
+            return min_price, min_price, min_price, max_price
         else:
-            # auto-reverse in case min and max mixed up
             if min_price > max_price:
                 min_price, max_price = max_price, min_price
-            new_df = self.df[(self.df[self.columns['price']] >= min_price) & (self.df[self.columns['price']]
-                                                                              <= max_price)]
+            return min_price, max_price, min_price, max_price
 
-        if len(new_df) == 0:
+    def filter_by_single_price_points(self, min_price, max_price, inplace=True):
+        prices = self.get_column('price')
+        # base of a view is never modified, so converted prices are only kept for a plain df
+        if not pd.api.types.is_numeric_dtype(prices):
+            prices = self.to_numeric_prices(prices)
+            if not self.is_view():
+                self._df[self.columns['price']] = prices
+
+        mask, min_price, max_price = self.get_price_mask(prices, min_price, max_price)
+        mask = mask.to_numpy()
+
+        if not mask.any():
             self.add_message(f"No values for price points min: {min_price}, max: {max_price}.")
 
         if inplace:
-            self.set_df(new_df)
+            self.keep(mask)
         else:
-            return new_df
+            return self.get_df()[mask]
+
+    # price band as a predicate for FilterPlanner. Returns min and max the way they end up being used, for messages.
+    def add_price_predicate(self, planner: FilterPlanner, min_price, max_price):
+        # same as in filter_by_single_price_points, a plain df keeps its converted prices. Sources typed at load
+        # already have numeric prices.
+        if not self.is_view() and not pd.api.types.is_numeric_dtype(self._df[self.columns['price']]):
+            self._df[self.columns['price']] = self.to_numeric_prices(self._df[self.columns['price']])
+
+        low, high, min_price, max_price = self.get_price_band(min_price, max_price)
+
+        def price_predicate(rows):
+            prices = self.to_numeric_prices(self.get_column_at('price', rows))
+            return self.get_price_mask(prices, min_price, max_price)[0].to_numpy()
+
+        price_postings = None
+        if self.is_index_aligned():
+            price_postings = lambda: self.index.get_price_rows(low, high)
+
+        planner.add('price', price_predicate,
+                    self.get_shared_postings(('price', low, high), price_predicate, price_postings))
+        return min_price, max_price
+
+    # postings of a value filter, when the index can be used for it
+    def get_value_postings(self, column_key, values: list):
+        if self.is_index_aligned() and self.index.has_key(column_key):
+            return lambda: self.index.get_rows(column_key, values)
+        return None
 
     def set_extra_input(self, extra_input_seller_product: dict):
-        extra_df_columns = [self.columns['seller_id'], self.columns['product_id']]
-        extra_df = pd.DataFrame(columns=extra_df_columns)
-        extra_df[self.columns['seller_id']] = extra_input_seller_product['seller_id']
-        extra_df[self.columns['product_id']] = extra_input_seller_product['product_id']
-        # remove duplicates in extra in extra input
-        extra_df.drop_duplicates(subset=self.columns['product_id'], keep='first', inplace=True)
-        self.extra_input = extra_df
+        seller_ids = np.asarray(extra_input_seller_product['seller_id'])
+        product_ids = np.asarray(extra_input_seller_product['product_id'])
+        # remove duplicates in extra input, first pair of a product is kept
+        is_first = ~pd.Series(product_ids).duplicated().to_numpy()
+        self.extra_input = pd.DataFrame({
+            self.columns['seller_id']: seller_ids[is_first],
+            self.columns['product_id']: product_ids[is_first]
+        })
+
+    # position in extra input of every one of product_ids, -1 for products not in it. Extra input product ids are
+    # unique, so they're looked up in a hash table built once, instead of isin over a list.
+    def get_extra_input_positions(self, product_ids):
+        return pd.Index(self.extra_input[self.columns['product_id']]).get_indexer(np.asarray(product_ids))
 
     def concat_extra_input(self):
         if self.extra_input is None or self.get_extra_input_size() == 0:
             return
-        # remove duplicates from main df by product_id column
-        extra_df_products = self.extra_input[self.columns['product_id']].tolist()
-        self.set_df(self.df[~self.df[self.columns['product_id']].isin(extra_df_products)])
-        self.set_df(pd.concat([self.extra_input, self.df]))
+        # one pass over the source finds extra input products in it, for removing them from the rows and for
+        # enriching extra input with their source columns
+        src_df = self.base_df if self.is_view() else self.src_df
+        src_positions = self.get_extra_input_positions(src_df[self.columns['product_id']])
+        if self.is_view():
+            in_extra_input = src_positions[self.get_positions()] >= 0
+        else:
+            in_extra_input = self.get_extra_input_positions(self._df[self.columns['product_id']]) >= 0
+        self.keep(~in_extra_input)
+
+        extra_df = self.get_enriched_extra_input(src_df, src_positions)
+        # a view keeps extra input as head rows in front of its positions
+        if self.is_view():
+            self.head_df = extra_df
+        else:
+            self._df = pd.concat([extra_df, self._df])
         self.is_extra_input_merged = True
 
+    # extra input with all source columns, taken from the source row of the same product, if there's one. Columns
+    # keep their source dtypes, integer and bool ones become nullable for products not in the source.
+    def get_enriched_extra_input(self, src_df: pd.DataFrame, src_positions: np.ndarray):
+        src_rows = np.full(self.get_extra_input_size(), -1, dtype=np.intp)
+        # first source row of every product, assigned in reverse so earlier rows win
+        matched = np.flatnonzero(src_positions >= 0)[::-1]
+        src_rows[src_positions[matched]] = matched
+        is_complete = bool((src_rows >= 0).all())
+
+        id_columns = {self.columns['seller_id'], self.columns['product_id']}
+        extra_columns = {}
+        for col_name in src_df.columns:
+            column = src_df[col_name]
+            if col_name in id_columns:
+                extra_columns[col_name] = self.to_src_ids(self.extra_input[col_name].to_numpy(), column.dtype)
+                continue
+            values = column.array
+            if not is_complete and isinstance(column.dtype, np.dtype) and column.dtype.kind in 'iub':
+                values = pd.array(column.to_numpy())
+            extra_columns[col_name] = values.take(src_rows, allow_fill=True)
+
+        return pd.DataFrame(extra_columns, columns=src_df.columns)
+
+    # extra input ids in dtype of the source ids, when they fit in it
+    @staticmethod
+    def to_src_ids(ids: np.ndarray, src_dtype):
+        if not isinstance(src_dtype, np.dtype) or src_dtype.kind not in 'iu' or ids.dtype.kind not in 'iu':
+            return ids
+        src_ids = ids.astype(src_dtype)
+        return src_ids if np.array_equal(src_ids, ids) else ids
+
+    def get_sorted_rows(self, col_names: list, ascending):
+        keys_df = self.get_columns_df(col_names).reset_index(drop=True)
+        return keys_df.sort_values(by=col_names, ascending=ascending, kind='stable').index.to_numpy()
+
     def sort_by(self, column_key: str, asc_order: bool = False):
         col_name = self.columns[column_key]
         try:
-            self.df.sort_values(by=[col_name], ascending=asc_order, inplace=True)
+            self.take(self.get_sorted_rows([col_name], asc_order))
         except KeyError:
             self.add_message(f'Failed to sort by {col_name}.')
             return
 
+    @staticmethod
+    def get_sort_keys(criteria: dict):
+        return [key for key in [criteria['sort_first'], criteria['sort_next']] if key]
+
+    # interleave criterion as column key and weights, e.g. {'by': 'cluster', 'weights': {'Electronics': 2, ...}}.
+    # Weights can also be given as [value, weight] pairs, which keep category ids ints in JSON, or as numeric strings.
+    @staticmethod
+    def get_interleave(criteria: dict):
+        interleave = criteria.get('interleave')
+        if not interleave:
+            return None
+        column_key = interleave['by']
+        weights = {}
+        for value, weight in dict(interleave['weights']).items():
+            if column_key == 'cat_id' and str(value).strip().isnumeric():
+                value = int(str(value).strip())
+            weights[value] = int(weight)
+        return column_key, weights
+
+    # rows of the df that can still end up in the collection. Extra input takes some of size_max, but df rows with
+    # the same product id are dropped from the df before that, so those are added on top.
+    def get_rows_cap(self, criteria: dict):
+        if not criteria['extra_input'] or self.get_extra_input_size() == 0:
+            return self.size_max
+        return self.size_max + int((self.get_extra_input_positions(self.get_column('product_id')) >= 0).sum())
+
+    # criteria the filters depend on. Filters always start from all rows of the base, so rows they leave only depend
+    # on these and on the base, which the memo belongs to.
+    def get_filters_key(self, criteria: dict):
+        if self.memo is None or not self.is_base_aligned():
+            return None
+        return ('filters', bool(criteria['out_of_stock']), criteria['cluster'], tuple(criteria['cat_id'] or ()),
+                criteria['price_min'], criteria['price_max'], self.get_exclusion_key(criteria))
+
+    # order starts from rows left by the filters, so its key is the filters key plus criteria the order depends on
+    def get_order_key(self, criteria: dict, filters_key: tuple):
+        if filters_key is None:
+            return None
+        ratio = (criteria['ratio']['local'], criteria['ratio']['offshore']) if criteria['ratio'] else None
+        interleave = self.get_interleave(criteria)
+        if interleave is not None:
+            interleave = (interleave[0], tuple(interleave[1].items()))
+        return (*filters_key, 'order', tuple(self.get_sort_keys(criteria)), ratio, interleave,
+                criteria.get('max_per_seller'), self.get_rows_cap(criteria))
+
+    # a stage moving rows of a view, with positions and messages it leaves kept in the memo under key. Running the
+    # same stage with the same key again, e.g. on Create with only size or ratio changed, only restores them.
+    def run_memo_stage(self, name: str, key: tuple, stage):
+        if key is None:
+            stage()
+            return
+
+        is_computed = False
+
+        def compute():
+            nonlocal is_computed
+            is_computed = True
+            messages_count = len(self.messages)
+            stage()
+            return self.positions, tuple(self.messages[messages_count:])
+
+        memo_key = ('stage', *key)
+        with self.trace_stage(f'{name}_memo') if memo_key in self.memo else nullcontext():
+            positions, messages = self.memo.get(memo_key, compute)
+            if not is_computed:
+                self.positions = positions
+                self.add_message(list(messages))
+
+    # sorting and shuffling together, as top rows selection when only rows_cap of them can be kept anyway. Interleave,
+    # when given, is used instead of ratio. Sellers are capped first, so the ratio and size_max only see rows left.
+    def order_by_criteria(self, criteria: dict):
+        sort_keys = self.get_sort_keys(criteria)
+        rows_cap = self.get_rows_cap(criteria)
+
+        if criteria.get('max_per_seller'):
+            with self.trace_stage('max_per_seller'):
+                self.cap_per_seller(criteria['max_per_seller'], sort_keys)
+
+        interleave = self.get_interleave(criteria)
+        if interleave is not None and interleave[0] not in self.columns:
+            self.add_message(f'Failed to interleave by {interleave[0]}.')
+            interleave = None
+
+        if interleave is not None:
+            with self.trace_stage('interleave'):
+                self.take(self.get_interleaved_rows(*interleave, rows_cap, sort_keys))
+        elif criteria['ratio']:
+            with self.trace_stage('shuffle'):
+                self.take(self.get_shuffled_rows(criteria['ratio'], rows_cap, sort_keys))
+        elif sort_keys:
+            with self.trace_stage('sort'):
+                self.take(self.get_top_rows(sort_keys, rows_cap, np.arange(self.get_df_size())))
+
+    # rows of the collection as DataFrames of up to block_size rows, gathered one block at a time
+    def iter_df_blocks(self, block_size: int):
+        if not self.is_view():
+            for start in range(0, max(len(self._df), 1), block_size):
+                yield self._df.iloc[start:start + block_size]
+            return
+
+        if self.head_df is not None and len(self.head_df) > 0:
+            yield self.head_df
+        positions = self.get_positions()
+        for start in range(0, max(len(positions), 1), block_size):
+            yield self.base_df.iloc[positions[start:start + block_size]]
+
     def export_for_upload(self):
         return {
             'seller_id': self.get_column_values('seller_id'),
@@ -190,8 +764,8 @@ class Collection:
 
 
 class CmsColl(Collection):
-    def __init__(self, df):
-        super().__init__(df)
+    def __init__(self, df, view: bool = False):
+        super().__init__(df, view)
         # validate headers
         if list(df.columns) != CMS_COLL_COLUMNS:
             raise ValueError(f'\nInvalid Dataframe headers. Should be:\n{CMS_COLL_COLUMNS}')
@@ -213,42 +787,55 @@ class CmsColl(Collection):
 
     def remove_out_of_stock(self):
         try:
-            self.df = self.df[self.df['Stock'] != 0]
+            self.keep(self.get_columns_df(['Stock'])['Stock'].to_numpy() != 0)
         except KeyError:
             self.add_message('Failed to find Stock column.')
             return
 
+    # all row filters of the criteria evaluated as one mask and applied with a single take
+    def filter_by_criteria(self, criteria: dict):
+        planner = FilterPlanner(self.get_df_size(), self.trace)
+        self.add_exclusion_predicate(planner, criteria)
+
+        if criteria['out_of_stock']:
+            in_stock_predicate = lambda rows: self.get_column_at('stock', rows).to_numpy() != 0
+            planner.add('out_of_stock', in_stock_predicate,
+                        self.get_shared_postings(('out_of_stock',), in_stock_predicate))
+
+        if criteria['price_min'] or criteria['price_max']:
+            min_price, max_price = self.add_price_predicate(planner, criteria['price_min'], criteria['price_max'])
+
+        if len(planner.predicates) == 0:
+            return
+
+        rows = planner.evaluate()
+
+        if planner.has('price') and len(rows) == 0:
+            self.add_message(f"No values for price points min: {min_price}, max: {max_price}.")
+
+        self.take(rows)
+
     def process_by_criteria(self, criteria: dict):
+        self.trace = StageTrace(COLL_TRACE_ALLOC)
         try:
             if criteria['size_max']:
                 self.size_max = criteria['size_max']
 
             if criteria['extra_input']:
-                self.set_extra_input(criteria['extra_input'])
-
-            if criteria['out_of_stock']:
-                self.remove_out_of_stock()
+                self.set_traced_extra_input(criteria['extra_input'])
 
-            if criteria['price_min'] or criteria['price_max']:
-                self.filter_by_single_price_points(criteria['price_min'], criteria['price_max'])
+            self.report_stage('filtering')
+            filters_key = self.get_filters_key(criteria)
+            self.run_memo_stage('filters', filters_key, lambda: self.filter_by_criteria(criteria))
 
-            sort_first_val = criteria['sort_first']
-            sort_next_val = criteria['sort_next']
-
-            if sort_first_val and sort_next_val:
-                sort_first_val = self.columns[sort_first_val]
-                sort_next_val = self.columns[sort_next_val]
-                self.df = self.df.sort_values([sort_first_val, sort_next_val], ascending=[False, False])
-            elif sort_first_val:
-                self.sort_by(sort_first_val)
-            elif sort_next_val:
-                self.sort_by(sort_next_val)
-
-            if criteria['ratio']:
-                self.shuffle(criteria['ratio'])
+            self.report_stage('sorting')
+            self.run_memo_stage('order', self.get_order_key(criteria, filters_key),
+                                lambda: self.order_by_criteria(criteria))
 
             if criteria['extra_input']:
-                self.concat_extra_input()
+                self.report_stage('extra input')
+                with self.trace_stage('concat_extra_input'):
+                    self.concat_extra_input()
 
             if criteria['size_min']:
                 if self.get_total_size() < criteria['size_min']:
@@ -256,16 +843,23 @@ class CmsColl(Collection):
                                      f"{self.get_total_size()}.")
 
             if self.get_total_size() > self.size_max:
-                self.df = self.df[:self.size_max]
+                with self.trace_stage('truncate'):
+                    self.truncate(self.size_max)
+
+            self.report_stage('done')
 
+        except CancelledError:
+            raise
         except Exception as e:
             self.add_message('Failure in Collection creation')
             print(e)
 
+        return self.trace
+
 
 class BankColl(Collection):
-    def __init__(self, df):
-        super().__init__(df)
+    def __init__(self, df, view: bool = False):
+        super().__init__(df, view)
         # validate headers
         if list(df.columns) != BANK_COLL_COLUMNS:
             raise ValueError(f'\nInvalid Dataframe headers. Should be:\n{BANK_COLL_COLUMNS}')
@@ -287,8 +881,12 @@ class BankColl(Collection):
         }
 
     def get_clusters(self):
+        if self.is_profile_usable('cluster'):
+            return list(self.profile.get_values('cluster'))
+        if self.is_index_aligned():
+            return self.index.get_values('cluster')
         try:
-            return list(self.df[self.columns['cluster']].unique())
+            return list(self.get_column('cluster').unique())
         except KeyError:
             self.add_message('Cluster column not found.')
             return []
@@ -299,65 +897,141 @@ class BankColl(Collection):
             # not returning empty df, because global ids or l3s might give sth still
             return
 
-        self.df = self.df.loc[self.df[self.columns['cluster']] == cluster]
+        if self.is_index_usable():
+            self.keep_base_rows(self.index.get_rows('cluster', [cluster]))
+        else:
+            self.keep((self.get_column('cluster') == cluster).to_numpy())
+
+    @staticmethod
+    def split_cat_ids(cat_ids: list, cats_in_src: set):
+        valid_cats = []
+        invalid_cats = []
+
+        for val in cat_ids:
+            val = str(val).strip()
+            if val.isnumeric() and int(val) in cats_in_src:
+                if val not in valid_cats:
+                    valid_cats.append(int(val))
+            else:
+                invalid_cats.append(val)
+
+        return valid_cats, invalid_cats
 
     def filter_by_cat_allocation(self, cat_ids: list):
         if cat_ids:
-            valid_cats = []
-            invalid_cats = []
-            bank_cat_ids = self.get_column_values('cat_id')
-
-            for val in cat_ids:
-                val = str(val).strip()
-                if val.isnumeric() and int(val) in bank_cat_ids:
-                    if val not in valid_cats:
-                        valid_cats.append(int(val))
-                else:
-                    invalid_cats.append(val)
+            if self.is_profile_usable('cat_id'):
+                cats_in_src = self.profile.get_values('cat_id')
+            elif self.is_index_aligned():
+                cats_in_src = set(self.index.get_values('cat_id'))
+            else:
+                cats_in_src = set(self.get_column('cat_id').unique())
+            valid_cats, invalid_cats = self.split_cat_ids(cat_ids, cats_in_src)
 
             if len(invalid_cats) > 0:
                 self.add_message(f'Invalid categories: {invalid_cats}.')
 
-            if len(valid_cats) != 0:
-                self.df = self.df.loc[self.df[self.columns['cat_id']].isin(valid_cats)]
+            if len(valid_cats) != 0 and self.is_index_usable():
+                self.keep_base_rows(self.index.get_rows('cat_id', valid_cats))
+            elif len(valid_cats) != 0:
+                self.keep(self.get_column('cat_id').isin(valid_cats).to_numpy())
             else:
                 self.add_message(f'None of the selected categories are valid.')
                 return
 
+    # categories present among rows of the cluster (or all rows, if there's no cluster filter). Categories seen
+    # in filtered rows are present for sure, only the remaining ones are looked up in the source.
+    def get_cats_in_cluster(self, cat_ids: list, cluster: str, filtered_rows):
+        cats_in_src = set(self.get_column_at('cat_id', filtered_rows).unique())
+        missing_cats = [val for val in cat_ids if val not in cats_in_src]
+        if missing_cats and cluster is None and self.is_profile_usable('cat_id'):
+            cats_in_src.update(val for val in missing_cats if self.profile.has_value('cat_id', val))
+        elif missing_cats and self.is_index_aligned():
+            cluster_rows = None if cluster is None else self.index.get_rows('cluster', [cluster])
+            for val in missing_cats:
+                cat_rows = self.index.get_rows('cat_id', [val])
+                if len(cat_rows) > 0 and (cluster_rows is None or SourceIndex.contains(cat_rows, cluster_rows).any()):
+                    cats_in_src.add(val)
+        elif missing_cats:
+            cat_col = self.get_column('cat_id')
+            mask = cat_col.isin(missing_cats).to_numpy()
+            if cluster is not None:
+                mask = mask & (self.get_column('cluster') == cluster).to_numpy()
+            cats_in_src.update(cat_col[mask].unique())
+        return cats_in_src
+
+    # all row filters of the criteria evaluated as one mask and applied with a single take. Cluster and categories
+    # not present in source are ignored, same as in filter_by_cluster and filter_by_cat_allocation, which is only
+    # checked once the result is known.
+    def filter_by_criteria(self, criteria: dict):
+        planner = FilterPlanner(self.get_df_size(), self.trace)
+        self.add_exclusion_predicate(planner, criteria)
+        cluster = criteria['cluster']
+        cat_ids = []
+
+        if cluster:
+            cluster_predicate = lambda rows: (self.get_column_at('cluster', rows) == cluster).to_numpy()
+            planner.add('cluster', cluster_predicate,
+                        self.get_shared_postings(('cluster', cluster), cluster_predicate,
+                                                 self.get_value_postings('cluster', [cluster])))
+
+        if criteria['cat_id']:
+            cat_ids = [int(val) for val in (str(val).strip() for val in criteria['cat_id']) if val.isnumeric()]
+            cat_predicate = lambda rows: self.get_column_at('cat_id', rows).isin(cat_ids).to_numpy()
+            planner.add('cat_id', cat_predicate,
+                        self.get_shared_postings(('cat_id', *sorted(set(cat_ids))), cat_predicate,
+                                                 self.get_value_postings('cat_id', cat_ids)))
+
+        if criteria['price_min'] or criteria['price_max']:
+            min_price, max_price = self.add_price_predicate(planner, criteria['price_min'], criteria['price_max'])
+
+        if len(planner.predicates) == 0:
+            return
+
+        rows = planner.evaluate()
+
+        if planner.has('cluster') and len(rows) == 0 and cluster not in self.get_clusters():
+            self.add_message(f"Cluster: {cluster} not found in source")
+            planner.remove('cluster')
+            rows = planner.evaluate()
+
+        if planner.has('cat_id'):
+            cats_in_src = self.get_cats_in_cluster(cat_ids, cluster if planner.has('cluster') else None, rows)
+            valid_cats, invalid_cats = self.split_cat_ids(criteria['cat_id'], cats_in_src)
+
+            if len(invalid_cats) > 0:
+                self.add_message(f'Invalid categories: {invalid_cats}.')
+
+            if len(valid_cats) == 0:
+                self.add_message(f'None of the selected categories are valid.')
+                planner.remove('cat_id')
+                rows = planner.evaluate()
+
+        if planner.has('price') and len(rows) == 0:
+            self.add_message(f"No values for price points min: {min_price}, max: {max_price}.")
+
+        self.take(rows)
+
     def process_by_criteria(self, criteria: dict):
+        self.trace = StageTrace(COLL_TRACE_ALLOC)
         try:
             if criteria['size_max']:
                 self.size_max = criteria['size_max']
 
             if criteria['extra_input']:
-                self.set_extra_input(criteria['extra_input'])
-
-            if criteria['cluster']:
-                self.filter_by_cluster(criteria['cluster'])
-
-            if criteria['cat_id']:
-                self.filter_by_cat_allocation(criteria['cat_id'])
+                self.set_traced_extra_input(criteria['extra_input'])
 
-            if criteria['price_min'] or criteria['price_max']:
-                self.filter_by_single_price_points(criteria['price_min'], criteria['price_max'])
+            self.report_stage('filtering')
+            filters_key = self.get_filters_key(criteria)
+            self.run_memo_stage('filters', filters_key, lambda: self.filter_by_criteria(criteria))
 
-            sort_first_val = criteria['sort_first']
-            sort_next_val = criteria['sort_next']
-
-            if sort_first_val and sort_next_val:
-                sort_first_val = self.columns[sort_first_val]
-                sort_next_val = self.columns[sort_next_val]
-                self.df = self.df.sort_values([sort_first_val, sort_next_val], ascending=[False, False])
-            elif sort_first_val:
-                self.sort_by(sort_first_val)
-            elif sort_next_val:
-                self.sort_by(sort_next_val)
-
-            if criteria['ratio']:
-                self.shuffle(criteria['ratio'])
+            self.report_stage('sorting')
+            self.run_memo_stage('order', self.get_order_key(criteria, filters_key),
+                                lambda: self.order_by_criteria(criteria))
 
             if criteria['extra_input']:
-                self.concat_extra_input()
+                self.report_stage('extra input')
+                with self.trace_stage('concat_extra_input'):
+                    self.concat_extra_input()
 
             if criteria['size_min']:
                 if self.get_total_size() < criteria['size_min']:
@@ -365,11 +1039,16 @@ class BankColl(Collection):
                                      f"{self.get_total_size()}.")
 
             if self.get_total_size() > self.size_max:
-                self.df = self.df[:self.size_max]
+                with self.trace_stage('truncate'):
+                    self.truncate(self.size_max)
+
+            self.report_stage('done')
 
+        except CancelledError:
+            raise
         except Exception as e:
             self.add_message('Failure in Collection creation')
             print(e)
 
+        return self.trace
 
-cms = BankColl(pd.read_csv(r'C:\Users\Dan\PycharmProjects\CollectionsGenerator\demo\bank_100_dummy_data.csv'))
@@ -0,0 +1,263 @@
+import glob
+import json
+import os
+from datetime import datetime
+from threading import Lock
+import numpy as np
+import pandas as pd
+from models.ExclusionStore import ExclusionStore
+
+
+# Every generated upload file, kept on disk to look up which collections a product or a seller was in and when.
+# Seller and product ids of each recorded collection are sorted, deduplicated and delta-encoded: the first id and
+# gaps between neighbours in the narrowest unsigned type that fits the largest gap, compressed in one .npz per
+# collection. Recorded collections are listed in collections.jsonl, a line each in order recorded, number being the
+# position. Recording a collection only writes its .npz and appends its line, so it takes the same time however long
+# the history is.
+# Lookups go through an inverted index of every id key: a sorted int64 array of ids with an int32 array of numbers of
+# collections they were recorded in next to it, (id, collection number) pairs in ascending order. Index arrays are
+# memory-mapped .npy files, so looking up an id is a binary search touching a few pages, O(log m) for m pairs, also
+# across a year of history. Collections recorded since the index was last merged are kept decoded in memory as
+# sorted segments and searched one by one. Segments are merged into the index once there are MERGE_MAX_SEGMENTS of
+# them, or once they hold 1/MERGE_RATIO of the pairs of the index. The index grows by that share every merge, so all
+# merges write O(m) bytes over the life of the history, instead of O(m) every record. A merged index is saved under a
+# new version, same as ExclusionStore does.
+# history.json holds the count of collections recorded and merged, switched atomically after every write, so readers
+# in other processes pick up new collections on their next lookup. Recording is safe from several threads, but only
+# one process should record at a time.
+class CollectionHistory:
+    META_F_NAME = 'history.json'
+    LIST_F_NAME = 'collections.jsonl'
+    COLLS_DIR_NAME = 'collections'
+    ID_KEYS = ['product_id', 'seller_id']
+    DELTA_DTYPES = [np.uint8, np.uint16, np.uint32, np.uint64]
+    MERGE_MAX_SEGMENTS = 64
+    MERGE_RATIO = 8
+
+    def __init__(self, history_dir: str):
+        self.history_dir = history_dir
+        # everything a lookup reads is swapped together, so it never sees collections without their ids:
+        # meta, recorded collections, their ids and created times as arrays, index arrays and segments of collections
+        # not merged yet, by id key as [(collection number, sorted ids), ...]
+        self.state = (self.get_empty_meta(), [], np.array([], dtype=object), np.array([], dtype='datetime64[s]'),
+                      {key: (np.array([], dtype=np.int64), np.array([], dtype=np.int32)) for key in self.ID_KEYS},
+                      {key: [] for key in self.ID_KEYS})
+        self.lock = Lock()
+        self.load()
+
+    @staticmethod
+    def get_empty_meta():
+        return {'version': 0, 'count': 0, 'merged': 0, 'list_bytes': 0}
+
+    def get_index_f_paths(self, key: str, version: int):
+        return (os.path.join(self.history_dir, f'{key}_ids_{version}.npy'),
+                os.path.join(self.history_dir, f'{key}_colls_{version}.npy'))
+
+    def get_coll_f_path(self, coll_no: int):
+        return os.path.join(self.history_dir, self.COLLS_DIR_NAME, f'coll_{coll_no}.npz')
+
+    def read_meta(self):
+        try:
+            with open(os.path.join(self.history_dir, self.META_F_NAME)) as meta_f:
+                meta = json.load(meta_f)
+            return {key: int(meta[key]) for key in self.get_empty_meta()}
+        except (OSError, ValueError, KeyError):
+            return self.get_empty_meta()
+
+    def write_meta(self, meta: dict):
+        meta_f_path = os.path.join(self.history_dir, self.META_F_NAME)
+        with open(f'{meta_f_path}.tmp', 'w') as meta_f:
+            json.dump(meta, meta_f)
+        os.replace(f'{meta_f_path}.tmp', meta_f_path)
+
+    # picks up collections recorded and indexes merged since last loaded
+    def load(self):
+        with self.lock:
+            meta = self.read_meta()
+            if meta != self.state[0]:
+                self.set_state(meta)
+
+    # only collections recorded since the last state are read, the index is mapped again only if it was merged
+    def set_state(self, meta: dict):
+        old_meta, collections, _, _, indexes, segments = self.state
+        if meta['count'] < old_meta['count'] or meta['version'] < old_meta['version']:
+            old_meta, collections, segments = self.get_empty_meta(), [], {key: [] for key in self.ID_KEYS}
+
+        if meta['version'] != old_meta['version']:
+            indexes = {}
+            for key in self.ID_KEYS:
+                ids_f_path, colls_f_path = self.get_index_f_paths(key, meta['version'])
+                indexes[key] = (np.load(ids_f_path, mmap_mode='r', allow_pickle=False),
+                                np.load(colls_f_path, mmap_mode='r', allow_pickle=False))
+
+        if meta['list_bytes'] > old_meta['list_bytes']:
+            with open(os.path.join(self.history_dir, self.LIST_F_NAME), 'rb') as list_f:
+                list_f.seek(old_meta['list_bytes'])
+                lines = list_f.read(meta['list_bytes'] - old_meta['list_bytes']).decode().splitlines()
+            collections = collections + [json.loads(line) for line in lines]
+
+        new_segments = {key: [(coll_no, ids) for coll_no, ids in segments[key] if coll_no >= meta['merged']]
+                        for key in self.ID_KEYS}
+        for coll_no in range(max(old_meta['count'], meta['merged']), meta['count']):
+            for key, ids in self.read_coll_ids(coll_no).items():
+                new_segments[key].append((coll_no, ids))
+
+        coll_ids = np.array([coll['coll_id'] for coll in collections], dtype=object)
+        created = np.array([coll['created'] for coll in collections], dtype='datetime64[s]')
+        self.state = (meta, collections, coll_ids, created, indexes, new_segments)
+
+    def get_version(self):
+        self.load()
+        return self.state[0]['version']
+
+    def get_collections_count(self):
+        self.load()
+        return self.state[0]['count']
+
+    # sorted unique ids, ids that aren't integers are left out
+    @staticmethod
+    def to_unique_ids(ids):
+        ids = np.sort(ExclusionStore.to_int_ids(ids))
+        return ids[np.append(ids[1:] != ids[:-1], True) & (ids >= 0)]
+
+    @staticmethod
+    def encode_ids(ids: np.ndarray):
+        deltas = np.diff(ids)
+        for dtype in CollectionHistory.DELTA_DTYPES:
+            if len(deltas) == 0 or deltas.max() <= np.iinfo(dtype).max:
+                return ids[:1], deltas.astype(dtype)
+
+    @staticmethod
+    def decode_ids(first_id: np.ndarray, deltas: np.ndarray):
+        return np.cumsum(np.concatenate([first_id, deltas.astype(np.int64)]))
+
+    def read_coll_ids(self, coll_no: int):
+        with np.load(self.get_coll_f_path(coll_no), allow_pickle=False) as arrays:
+            return {key: self.decode_ids(arrays[f'{key}_first'], arrays[f'{key}_deltas']) for key in self.ID_KEYS}
+
+    # records an upload file of a collection, created now if not given. Every upload is recorded, also a collection
+    # generated again under the same id. Returns number of the recorded collection.
+    def record(self, coll_id: str, seller_ids, product_ids, created: datetime = None, upload_f_path: str = None):
+        if created is None:
+            created = datetime.now()
+        coll_ids = {'product_id': self.to_unique_ids(product_ids), 'seller_id': self.to_unique_ids(seller_ids)}
+        arrays = {}
+        for key, ids in coll_ids.items():
+            arrays[f'{key}_first'], arrays[f'{key}_deltas'] = self.encode_ids(ids)
+
+        self.load()
+        with self.lock:
+            meta = dict(self.state[0])
+            coll_no = meta['count']
+            os.makedirs(os.path.join(self.history_dir, self.COLLS_DIR_NAME), exist_ok=True)
+            np.savez_compressed(self.get_coll_f_path(coll_no), **arrays)
+
+            line = json.dumps({
+                'coll_id': coll_id,
+                'created': created.isoformat(timespec='seconds'),
+                'upload_f_path': upload_f_path,
+                'products': len(coll_ids['product_id']),
+                'sellers': len(coll_ids['seller_id'])
+            }) + '\n'
+            with open(os.path.join(self.history_dir, self.LIST_F_NAME), 'ab') as list_f:
+                # a line written by a record that didn't get to switch history.json is overwritten
+                list_f.truncate(meta['list_bytes'])
+                list_f.write(line.encode())
+            meta['count'] += 1
+            meta['list_bytes'] += len(line.encode())
+            self.write_meta(meta)
+            self.set_state(meta)
+
+            if self.is_merge_due():
+                self.merge_segments()
+            return coll_no
+
+    def is_merge_due(self):
+        _, _, _, _, indexes, segments = self.state
+        segments_count = len(segments[self.ID_KEYS[0]])
+        segments_pairs = sum(len(ids) for key in self.ID_KEYS for _, ids in segments[key])
+        index_pairs = sum(len(indexes[key][0]) for key in self.ID_KEYS)
+        return segments_count >= self.MERGE_MAX_SEGMENTS or segments_pairs * self.MERGE_RATIO >= index_pairs
+
+    # merges segments into the index now, e.g. before a lot of lookups
+    def merge(self):
+        self.load()
+        with self.lock:
+            if len(self.state[5][self.ID_KEYS[0]]) > 0:
+                self.merge_segments()
+
+    # segment collections are numbered above every collection in the index, so their pairs go after equal ids. Only
+    # the pairs of segments are sorted, then inserted into the index arrays in one pass, O(k log k + m).
+    def merge_segments(self):
+        meta, _, _, _, indexes, segments = self.state
+        meta = dict(meta, version=max(meta['version'], self.read_meta()['version']) + 1, merged=meta['count'])
+
+        os.makedirs(self.history_dir, exist_ok=True)
+        for key in self.ID_KEYS:
+            index_ids, index_colls = indexes[key]
+            new_ids = np.concatenate([ids for _, ids in segments[key]])
+            new_colls = np.concatenate([np.full(len(ids), coll_no, dtype=np.int32) for coll_no, ids in segments[key]])
+            order = np.lexsort((new_colls, new_ids))
+            new_ids, new_colls = new_ids[order], new_colls[order]
+
+            pos = np.searchsorted(index_ids, new_ids, side='right')
+            ids_f_path, colls_f_path = self.get_index_f_paths(key, meta['version'])
+            np.save(ids_f_path, np.insert(index_ids, pos, new_ids), allow_pickle=False)
+            np.save(colls_f_path, np.insert(index_colls, pos, new_colls), allow_pickle=False)
+
+        self.write_meta(meta)
+        self.set_state(meta)
+        self.remove_old_versions()
+
+    # files of older versions still mapped somewhere can't be removed on Windows, they're removed by a later merge
+    def remove_old_versions(self):
+        version = self.state[0]['version']
+        current_f_paths = [f_path for key in self.ID_KEYS for f_path in self.get_index_f_paths(key, version)]
+        for f_path in glob.glob(os.path.join(self.history_dir, '*_*.npy')):
+            if f_path not in current_f_paths:
+                try:
+                    os.remove(f_path)
+                except OSError:
+                    pass
+
+    # collections every one of ids was recorded in, by 'product_id' or 'seller_id'. One row per id and collection,
+    # ordered by id and then by time recorded. Ids not in history have no rows.
+    def lookup(self, ids, by: str = 'product_id'):
+        self.load()
+        _, _, coll_ids, created, indexes, segments = self.state
+        index_ids, index_colls = indexes[by]
+        ids = self.to_unique_ids(ids)
+
+        starts = np.searchsorted(index_ids, ids, side='left')
+        counts = np.searchsorted(index_ids, ids, side='right') - starts
+        # positions of every id's pairs, starts repeated and offset by 0..count-1
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pos = np.repeat(starts, counts) + offsets
+        found_ids = [np.asarray(index_ids[pos])]
+        found_colls = [np.asarray(index_colls[pos], dtype=np.intp)]
+
+        for coll_no, segment_ids in segments[by]:
+            if len(segment_ids) == 0:
+                continue
+            is_found = segment_ids[np.searchsorted(segment_ids, ids).clip(max=len(segment_ids) - 1)] == ids
+            found_ids.append(ids[is_found])
+            found_colls.append(np.full(np.count_nonzero(is_found), coll_no, dtype=np.intp))
+
+        found_ids, found_colls = np.concatenate(found_ids), np.concatenate(found_colls)
+        # segment pairs only need sorting in between index pairs of the same ids
+        if len(found_ids) > len(pos):
+            order = np.lexsort((found_colls, found_ids))
+            found_ids, found_colls = found_ids[order], found_colls[order]
+        return pd.DataFrame({
+            by: found_ids,
+            'coll_no': found_colls,
+            'coll_id': coll_ids[found_colls],
+            'created': created[found_colls]
+        })
+
+    # recorded collection with its decoded ids
+    def get_collection(self, coll_no: int):
+        self.load()
+        collection = dict(self.state[1][coll_no])
+        collection.update(self.read_coll_ids(coll_no))
+        return collection
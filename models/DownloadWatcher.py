@@ -0,0 +1,131 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+from datetime import datetime
+from fnmatch import fnmatch
+
+
+# Waits for files matching name patterns to be created in a directory, e.g. CMS exports landing in Downloads. On Linux
+# new files are reported by inotify, elsewhere the directory is rescanned every POLL_S seconds with os.scandir, which
+# only stats entries with a matching name. The process working directory is never changed.
+class DownloadWatcher:
+    POLL_S = 0.1
+    # inotify flags and event header (wd, mask, cookie, len), see inotify(7)
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, download_dir: str, use_inotify: bool = True):
+        self.download_dir = download_dir
+        self.use_inotify = use_inotify and sys.platform.startswith('linux')
+
+    # name and ctime of files in the directory, or only of given names of it. Scanned entries are only stat-ed when
+    # their name matches, on Windows without any extra system call.
+    def get_ctimes(self, patterns: list, names=None):
+        ctimes = {}
+        if names is None:
+            with os.scandir(self.download_dir) as entries:
+                for entry in entries:
+                    if any(fnmatch(entry.name, pattern) for pattern in patterns):
+                        try:
+                            ctimes[entry.name] = entry.stat().st_ctime
+                        except OSError:
+                            continue
+            return ctimes
+
+        for name in names:
+            if any(fnmatch(name, pattern) for pattern in patterns):
+                try:
+                    ctimes[name] = os.path.getctime(os.path.join(self.download_dir, name))
+                except OSError:
+                    continue
+        return ctimes
+
+    # for every key still without a file, latest file matching its pattern created after click_time
+    def resolve(self, patterns: dict, found: dict, click_time: datetime, names=None):
+        pending = {key: pattern for key, pattern in patterns.items() if found[key] is None}
+        ctimes = self.get_ctimes(list(pending.values()), names)
+        for key, pattern in pending.items():
+            matching = [name for name, ctime in ctimes.items()
+                        if fnmatch(name, pattern) and ctime > click_time.timestamp()]
+            if matching:
+                found[key] = max(matching, key=ctimes.get)
+
+    # name of the file found for every key of patterns, None for keys with no file created within wait_t_s
+    async def wait_for(self, patterns: dict, click_time: datetime, wait_t_s: float):
+        found = {key: None for key in patterns}
+        deadline = asyncio.get_running_loop().time() + wait_t_s
+
+        inotify_fd = self.start_inotify() if self.use_inotify else None
+        try:
+            # files could've been created between the click and the start of watching
+            self.resolve(patterns, found, click_time)
+            if inotify_fd is not None:
+                await self.wait_inotify(inotify_fd, patterns, found, click_time, deadline)
+            else:
+                await self.wait_scandir(patterns, found, click_time, deadline)
+        finally:
+            if inotify_fd is not None:
+                os.close(inotify_fd)
+
+        return found
+
+    def start_inotify(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = self.IN_CREATE | self.IN_MOVED_TO | self.IN_CLOSE_WRITE
+            if libc.inotify_add_watch(fd, os.fsencode(self.download_dir), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def read_inotify_names(self, fd: int):
+        names = set()
+        while True:
+            try:
+                buf = os.read(fd, 64 * 1024)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset < len(buf):
+                wd, mask, cookie, name_len = self.EVENT_HEADER.unpack_from(buf, offset)
+                offset += self.EVENT_HEADER.size
+                names.add(buf[offset:offset + name_len].rstrip(b'\0').decode(errors='surrogateescape'))
+                offset += name_len
+
+    async def wait_inotify(self, fd: int, patterns: dict, found: dict, click_time: datetime, deadline: float):
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        loop.add_reader(fd, ready.set)
+        try:
+            while None in found.values():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    return
+                try:
+                    await asyncio.wait_for(ready.wait(), timeout)
+                except asyncio.TimeoutError:
+                    return
+                ready.clear()
+                self.resolve(patterns, found, click_time, self.read_inotify_names(fd))
+        finally:
+            loop.remove_reader(fd)
+
+    async def wait_scandir(self, patterns: dict, found: dict, click_time: datetime, deadline: float):
+        loop = asyncio.get_running_loop()
+        while None in found.values():
+            if loop.time() >= deadline:
+                return
+            await asyncio.sleep(min(self.POLL_S, max(0, deadline - loop.time())))
+            self.resolve(patterns, found, click_time)
@@ -1,19 +1,50 @@
-from models.Collection import CmsColl, BankColl
+import argparse
+import json
+import os
+import sys
+import numpy as np
 import pandas as pd
-from random import sample, choices, uniform, randrange
-from tkinter.filedialog import asksaveasfile
+from config import CMS_COLL_COLUMNS, BANK_COLL_COLUMNS
+from models.Collection import CmsColl, BankColl
+from models.ExportWriter import ExportWriter
+
+# continuous values are drawn from dist and clipped to their value range. Dists: uniform, exponential (scale),
+# lognormal (mean, sigma) and beta (a, b, scaled to the value range). Weights of discrete values are relative, None
+# for equal ones. With by_cluster, every cluster gets its own, evenly split, range of category ids.
+DEF_DISTRIBUTIONS = {
+    'price': {'dist': 'uniform'},
+    'ado': {'dist': 'uniform'},
+    'discount': {'dist': 'uniform'},
+    'rating': {'weights': None},
+    'cat_id': {'weights': None, 'by_cluster': False},
+    'cluster': {'weights': None},
+    'offshore_share': 0.5
+}
 
 
 class DummyDataGenerator:
+    # rows are generated in chunks of this size, each from its own seed derived from the generator's seed, so the same
+    # seed gives the same data however it's read or saved
+    CHUNK_SIZE = 1000000
 
-    def __init__(self, sample_type: str, size: int):
+    def __init__(self, sample_type: str, size: int, seed: int = None, distributions: dict = None):
         # types are cms or bank
         self.sample_type = sample_type
         self.col_mapping = {}
-        self.cms_coll = CmsColl(pd.DataFrame())
-        self.bank_coll = BankColl(pd.DataFrame())
-        self.df = self.gen_dummy_df()
+        self.cms_coll = CmsColl(pd.DataFrame(columns=CMS_COLL_COLUMNS))
+        self.bank_coll = BankColl(pd.DataFrame(columns=BANK_COLL_COLUMNS))
+        self._df = None
+        self.gen_dummy_df()
         self.size = size
+        # entropy of a random seed is kept, so a run without a seed can still be reproduced
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.distributions = {key: dict(val) if isinstance(val, dict) else val
+                              for key, val in DEF_DISTRIBUTIONS.items()}
+        for key, val in (distributions or {}).items():
+            if isinstance(val, dict):
+                self.distributions[key].update(val)
+            else:
+                self.distributions[key] = val
         self.val_ranges = {
             'seller_id': {
                 'min': 100000,
@@ -52,7 +83,22 @@ class DummyDataGenerator:
             },
             'cluster': ['Electronics', 'FMCG', 'Lifestyle', 'Fashion']
         }
-        self.fill_df()
+
+        product_id_count = self.val_ranges['product_id']['max'] - self.val_ranges['product_id']['min']
+        if size > product_id_count:
+            raise ValueError(f'Size can be at most {product_id_count}, the number of unique product ids.')
+        self.product_id_step = self.get_product_id_step(product_id_count)
+
+    # the whole sample is only generated when it's first needed in memory
+    @property
+    def df(self):
+        if self._df is None:
+            self.fill_df()
+        return self._df
+
+    @df.setter
+    def df(self, new_df):
+        self._df = new_df
 
     def gen_dummy_df(self):
         if self.sample_type == 'cms':
@@ -65,87 +111,187 @@ class DummyDataGenerator:
 
         return pd.DataFrame(columns=list(self.col_mapping.values()))
 
-    def fill_df(self):
-        # seller & product id
-        for k in ['seller_id', 'product_id']:
-            self.df[self.col_mapping[k]] = sample(range(self.val_ranges[k]['min'], self.val_ranges[k]['max']),
-                                                  self.size)
-
-        # price
-        price_floats = []
-        for _x in range(self.size):
-            price_floats.append(round(uniform(self.val_ranges['price']['min'], self.val_ranges['price']['max']), 2))
-        self.df[self.col_mapping['price']] = price_floats
-
-        # rating
-        self.df[self.col_mapping['rating']] = choices(
-            [*range(self.val_ranges['rating']['min'], self.val_ranges['rating']['max'] + 1, 1)], k=self.size)
-
-        # ado
-        ado_floats = []
-        for _x in range(self.size):
-            ado_floats.append(round(uniform(self.val_ranges['ado']['min'], self.val_ranges['ado']['max']), 2))
-        self.df[self.col_mapping['ado']] = choices(ado_floats, k=self.size)
+    # product ids are unique across all chunks without keeping track of them: row i gets
+    # min + (i * step + offset) mod count, which is a permutation of the id range for step coprime with count. Ids are
+    # then shuffled within their chunk.
+    def get_product_id_step(self, product_id_count: int):
+        rng = np.random.default_rng([self.seed, 0])
+        while True:
+            step = int(rng.integers(product_id_count // 3, product_id_count))
+            if np.gcd(step, product_id_count) == 1:
+                return step
 
-        # cms only -----------------
-        if self.sample_type == 'cms':
+    def gen_continuous(self, rng: np.random.Generator, key: str, size: int):
+        low, high = self.val_ranges[key]['min'], self.val_ranges[key]['max']
+        dist = self.distributions[key]
+        if dist['dist'] == 'exponential':
+            values = low + rng.exponential(dist.get('scale', (high - low) / 5), size)
+        elif dist['dist'] == 'lognormal':
+            values = rng.lognormal(dist.get('mean', 0.0), dist.get('sigma', 1.0), size)
+        elif dist['dist'] == 'beta':
+            values = low + (high - low) * rng.beta(dist.get('a', 2.0), dist.get('b', 5.0), size)
+        else:
+            values = rng.uniform(low, high, size)
+        return np.round(np.clip(values, low, high), 2)
 
-            # stock
-            self.df[self.col_mapping['stock']] = choices(
-                [*range(self.val_ranges['stock']['min'], self.val_ranges['stock']['max'] + 1)], k=self.size)
+    @staticmethod
+    def gen_choice(rng: np.random.Generator, values: list, weights, size: int):
+        p = DummyDataGenerator.get_probabilities(weights)
+        return np.asarray(values)[rng.choice(len(values), size=size, p=p)]
 
-            # old prices
-            base_prices = self.df[self.col_mapping['price']].tolist()
-            old_prices = []
+    def gen_chunk(self, chunk_i: int, start: int, size: int):
+        rng = np.random.default_rng([self.seed, 1, chunk_i])
+        ranges = self.val_ranges
+        columns = {}
 
-            for price in base_prices:
-                max_price = price * (randrange(1, 10, 1))
-                old_prices.append(round(uniform(price, max_price), 2))
+        # seller & product id
+        columns['seller_id'] = rng.integers(ranges['seller_id']['min'], ranges['seller_id']['max'], size)
+        product_id_count = ranges['product_id']['max'] - ranges['product_id']['min']
+        rows = np.arange(start, start + size, dtype=np.int64)
+        product_id_offset = self.seed % product_id_count
+        columns['product_id'] = rng.permutation(ranges['product_id']['min']
+                                                + (rows * self.product_id_step + product_id_offset) % product_id_count)
 
-            self.df[self.col_mapping['old_price']] = old_prices
+        columns['price'] = self.gen_continuous(rng, 'price', size)
+        columns['rating'] = self.gen_choice(rng, list(range(ranges['rating']['min'], ranges['rating']['max'] + 1)),
+                                            self.distributions['rating']['weights'], size)
+        columns['ado'] = self.gen_continuous(rng, 'ado', size)
 
-            # local & offshore
-            local_to_offshore_vals = [self.cms_coll.local_to_offshore['local'],
-                                      self.cms_coll.local_to_offshore['offshore']]
+        is_offshore = rng.random(size) < self.distributions['offshore_share']
 
-            self.df[self.cms_coll.columns['seller_type']] = choices(local_to_offshore_vals, k=self.size)
+        # cms only -----------------
+        if self.sample_type == 'cms':
+            columns['stock'] = rng.integers(ranges['stock']['min'], ranges['stock']['max'] + 1, size)
+            # old price somewhere between price and up to 9 times the price
+            max_old_prices = columns['price'] * rng.integers(1, 10, size)
+            columns['old_price'] = np.round(rng.uniform(columns['price'], max_old_prices), 2)
+            columns['seller_type'] = np.where(is_offshore, self.cms_coll.local_to_offshore['offshore'],
+                                              self.cms_coll.local_to_offshore['local'])
 
         # bank only -----------------
         if self.sample_type == 'bank':
+            columns['discount'] = self.gen_continuous(rng, 'discount', size)
+            clusters = self.val_ranges['cluster']
+            cluster_ids = rng.choice(len(clusters), size=size,
+                                     p=self.get_probabilities(self.distributions['cluster']['weights']))
+            columns['cluster'] = pd.Categorical.from_codes(cluster_ids, categories=clusters)
+            columns['cat_id'] = self.gen_cat_ids(rng, cluster_ids, size)
+            columns['seller_type'] = pd.Categorical.from_codes(is_offshore.astype(np.int8), categories=[
+                self.bank_coll.local_to_offshore['local'], self.bank_coll.local_to_offshore['offshore']])
+
+        return pd.DataFrame({self.col_mapping[key]: columns[key] for key in self.col_mapping})
+
+    @staticmethod
+    def get_probabilities(weights):
+        if weights is None:
+            return None
+        return np.asarray(weights, dtype=float) / np.sum(weights)
+
+    def gen_cat_ids(self, rng: np.random.Generator, cluster_ids: np.ndarray, size: int):
+        cat_ids = np.arange(self.val_ranges['cat_id']['min'], self.val_ranges['cat_id']['max'] + 1)
+        weights = self.distributions['cat_id']['weights']
+        if not self.distributions['cat_id']['by_cluster']:
+            return self.gen_choice(rng, cat_ids.tolist(), weights, size)
+
+        # every cluster draws from its own slice of category ids
+        cluster_count = len(self.val_ranges['cluster'])
+        bounds = np.linspace(0, len(cat_ids), cluster_count + 1).round().astype(int)
+        p = self.get_probabilities(weights)
+        if p is None:
+            p = np.ones(len(cat_ids))
+        values = np.empty(size, dtype=cat_ids.dtype)
+        for cluster_id in range(cluster_count):
+            rows = np.flatnonzero(cluster_ids == cluster_id)
+            lo, hi = bounds[cluster_id], max(bounds[cluster_id + 1], bounds[cluster_id] + 1)
+            cluster_p = p[lo:hi] / p[lo:hi].sum()
+            values[rows] = cat_ids[lo:hi][rng.choice(hi - lo, size=len(rows), p=cluster_p)]
+        return values
 
-            # discount
-            discount_floats = []
-            for _x in range(self.size):
-                discount_floats.append(
-                    round(uniform(self.val_ranges['discount']['min'], self.val_ranges['discount']['max']), 2))
-            self.df[self.col_mapping['discount']] = choices(discount_floats, k=self.size)
+    def iter_chunks(self):
+        for chunk_i, start in enumerate(range(0, self.size, self.CHUNK_SIZE)):
+            yield self.gen_chunk(chunk_i, start, min(self.CHUNK_SIZE, self.size - start))
 
-            # cat ids
-            self.df[self.col_mapping['cat_id']] = choices(
-                [*range(self.val_ranges['cat_id']['min'], self.val_ranges['cat_id']['max'] + 1, 1)], k=self.size)
+    def fill_df(self):
+        chunks = list(self.iter_chunks())
+        self._df = pd.concat(chunks, ignore_index=True) if chunks else self.gen_dummy_df()
+
+    # .csv or .csv.gz files are written as csv, any other path is a directory with a .npy file for every column,
+    # filled chunk by chunk, so samples much bigger than memory can be saved either way
+    def save(self, f_path: str):
+        if f_path.endswith('.csv') or f_path.endswith('.csv.gz'):
+            ExportWriter(compress=f_path.endswith('.gz')).write_full(f_path, self.iter_chunks())
+        else:
+            self.save_columnar(f_path)
+        return True
 
-            # cluster
-            self.df[self.col_mapping['cluster']] = choices(self.val_ranges['cluster'], k=self.size)
+    def save_columnar(self, f_dir: str):
+        os.makedirs(f_dir, exist_ok=True)
+        arrays = None
+        for chunk_i, chunk in enumerate(self.iter_chunks()):
+            if arrays is None:
+                arrays = [np.lib.format.open_memmap(os.path.join(f_dir, f'{i}.npy'), mode='w+',
+                                                    dtype=self.get_columnar_dtype(chunk[col]), shape=(self.size,))
+                          for i, col in enumerate(chunk.columns)]
+            start = chunk_i * self.CHUNK_SIZE
+            for arr, col in zip(arrays, chunk.columns):
+                arr[start:start + len(chunk)] = chunk[col].to_numpy()
 
-            # local & offshore
-            local_to_offshore_vals = [self.bank_coll.local_to_offshore['local'],
-                                      self.bank_coll.local_to_offshore['offshore']]
+        for arr in arrays or []:
+            arr.flush()
+        meta = {
+            'sample_type': self.sample_type,
+            'size': self.size,
+            'seed': self.seed,
+            'columns': list(self.col_mapping.values()),
+            'dtypes': [arr.dtype.str for arr in arrays or []]
+        }
+        with open(os.path.join(f_dir, 'meta.json'), 'w') as meta_f:
+            json.dump(meta, meta_f)
 
-            self.df[self.bank_coll.columns['seller_type']] = choices(local_to_offshore_vals, k=self.size)
+    def get_columnar_dtype(self, column: pd.Series):
+        if column.dtype.kind in 'iufb':
+            return column.dtype
+        # strings are stored fixed width, as long as the longest possible value
+        str_values = self.val_ranges['cluster'] + list(self.bank_coll.local_to_offshore.values())
+        return np.dtype(f'U{max(len(val) for val in str_values)}')
 
-    def save_to_csv(self):
-        def_f_name = f'{self.sample_type}_{self.size}_dummy_data'
-        save_f_path = asksaveasfile(initialfile=f'{def_f_name}.csv',
-                                    defaultextension=".csv", filetypes=[("csv file(*.csv)", "*.csv")], )
+    def save_to_csv(self, f_path: str = None):
+        if f_path is None:
+            from tkinter.filedialog import asksaveasfilename
+            def_f_name = f'{self.sample_type}_{self.size}_dummy_data'
+            f_path = asksaveasfilename(initialfile=f'{def_f_name}.csv',
+                                       defaultextension=".csv", filetypes=[("csv file(*.csv)", "*.csv")], )
         try:
-            self.df.to_csv(save_f_path, index=False, lineterminator='\n')
-            return True
+            return self.save(f_path)
         except OSError:
             print("ERROR: output directory not found.")
             return False
 
 
-# select source type and sample size to generate and save to file
+# select source type and sample size to generate and save to file, e.g.
+# python -m models.DummyDataGenerator bank 5000000 bank_5M.csv --seed 1 --ado exponential --offshore-share 0.3
+def main(argv: list = None):
+    arg_parser = argparse.ArgumentParser(description='Generate a dummy cms or bank source.')
+    arg_parser.add_argument('sample_type', choices=['cms', 'bank'])
+    arg_parser.add_argument('size', type=int)
+    arg_parser.add_argument('output', help='.csv or .csv.gz file, or a directory for columnar .npy output')
+    arg_parser.add_argument('--seed', type=int, default=None)
+    arg_parser.add_argument('--ado', choices=['uniform', 'exponential', 'lognormal', 'beta'], default='uniform')
+    arg_parser.add_argument('--offshore-share', type=float, default=DEF_DISTRIBUTIONS['offshore_share'])
+    arg_parser.add_argument('--cats-by-cluster', action='store_true')
+    args = arg_parser.parse_args(argv)
+
+    distributions = {
+        'ado': {'dist': args.ado},
+        'offshore_share': args.offshore_share,
+        'cat_id': {'by_cluster': args.cats_by_cluster}
+    }
+    dg = DummyDataGenerator(args.sample_type, args.size, args.seed, distributions)
+    if not dg.save_to_csv(args.output):
+        return 1
+    print(f'Saved {args.size} rows with seed {dg.seed}.')
+    return 0
+
 
-# dumdum = DummyDataGenerator('bank', 20)
-# dumdum.save_to_csv()
+if __name__ == "__main__":
+    sys.exit(main())
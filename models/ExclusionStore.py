@@ -0,0 +1,143 @@
+import glob
+import json
+import os
+from datetime import date
+from threading import Lock
+import numpy as np
+import pandas as pd
+
+
+# Product ids used by collections still running, kept on disk so one product doesn't end up in several collections
+# at the same time. Ids are a sorted int64 array, with the latest end date of collections using every id in a
+# datetime64 array next to it. Both are .npy files memory-mapped on load, so tens of millions of ids only take memory
+# for pages a lookup touches. Looking up n product ids is a binary search each, O(n log m).
+# Registering a collection merges its ids into the arrays and drops ids of ended collections on the way. Merged arrays
+# are saved under a new version and store.json is switched to it, so files that are mapped are never overwritten
+# (Windows can't replace them) and readers in other processes pick up the new version on their next lookup.
+# Registering is safe from several threads, but only one process should register at a time.
+class ExclusionStore:
+    META_F_NAME = 'store.json'
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.version = 0
+        # product ids and end dates are swapped together, so lookups never see arrays of two versions
+        self.arrays = (np.array([], dtype=np.int64), np.array([], dtype='datetime64[D]'))
+        self.lock = Lock()
+        self.load()
+
+    def get_arrays_f_paths(self, version: int):
+        return (os.path.join(self.store_dir, f'product_ids_{version}.npy'),
+                os.path.join(self.store_dir, f'end_dates_{version}.npy'))
+
+    def read_version(self):
+        try:
+            with open(os.path.join(self.store_dir, self.META_F_NAME)) as meta_f:
+                return json.load(meta_f)['version']
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    # maps arrays of the current version, if it changed since they were last mapped
+    def load(self):
+        with self.lock:
+            version = self.read_version()
+            if version == self.version:
+                return
+            product_ids_f_path, end_dates_f_path = self.get_arrays_f_paths(version)
+            self.arrays = (np.load(product_ids_f_path, mmap_mode='r', allow_pickle=False),
+                           np.load(end_dates_f_path, mmap_mode='r', allow_pickle=False))
+            self.version = version
+
+    def get_version(self):
+        self.load()
+        return self.version
+
+    @staticmethod
+    def to_day(day=None):
+        return np.datetime64(date.today() if day is None else day, 'D')
+
+    # ids that aren't integers become -1, which is never registered
+    @staticmethod
+    def to_int_ids(product_ids):
+        product_ids = np.asarray(product_ids)
+        if product_ids.dtype.kind in 'iu':
+            return product_ids.astype(np.int64, copy=False)
+        product_ids = pd.to_numeric(pd.Series(product_ids), errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        return np.where(np.isfinite(product_ids), product_ids, -1).astype(np.int64)
+
+    # mask of product ids used by collections that haven't ended before today
+    def contains(self, product_ids, today: date = None):
+        self.load()
+        stored_ids, end_dates = self.arrays
+        product_ids = self.to_int_ids(product_ids)
+        if len(stored_ids) == 0 or len(product_ids) == 0:
+            return np.zeros(len(product_ids), dtype=bool)
+
+        # ids searched in ascending order touch the stored ones mostly sequentially, which is several times faster
+        # than random probes once stored ids don't fit in cache
+        order = np.argsort(product_ids, kind='stable')
+        idx = np.empty(len(product_ids), dtype=np.intp)
+        idx[order] = np.searchsorted(stored_ids, product_ids[order])
+        idx = idx.clip(max=len(stored_ids) - 1)
+        mask = stored_ids[idx] == product_ids
+        mask[mask] = end_dates[idx[mask]] >= self.to_day(today)
+        return mask
+
+    def get_active_count(self, today: date = None):
+        self.load()
+        return int(np.count_nonzero(self.arrays[1] >= self.to_day(today)))
+
+    # adds product ids of a collection running until end_date, inclusive. Ids already stored keep the later of their
+    # end dates. New ids are sorted once and inserted into the stored ones, O(k log m + m).
+    def register(self, product_ids, end_date, today: date = None):
+        new_ids = np.sort(self.to_int_ids(product_ids))
+        new_ids = new_ids[np.append(new_ids[1:] != new_ids[:-1], True) & (new_ids >= 0)]
+        self.merge(new_ids, self.to_day(end_date), today)
+
+    # drops ids of collections ended before today
+    def expire(self, today: date = None):
+        self.merge(np.array([], dtype=np.int64), None, today)
+
+    def merge(self, new_ids, end_day, today: date = None):
+        self.load()
+        with self.lock:
+            stored_ids, end_dates = self.arrays
+            if len(new_ids) > 0:
+                pos = np.searchsorted(stored_ids, new_ids)
+                is_stored = pos < len(stored_ids)
+                is_stored[is_stored] = stored_ids[pos[is_stored]] == new_ids[is_stored]
+
+                end_dates = np.array(end_dates)
+                end_dates[pos[is_stored]] = np.maximum(end_dates[pos[is_stored]], end_day)
+                stored_ids = np.insert(stored_ids, pos[~is_stored], new_ids[~is_stored])
+                end_dates = np.insert(end_dates, pos[~is_stored], end_day)
+
+            is_active = end_dates >= self.to_day(today)
+            self.save(stored_ids[is_active], end_dates[is_active])
+
+    def save(self, product_ids, end_dates):
+        os.makedirs(self.store_dir, exist_ok=True)
+        version = max(self.version, self.read_version()) + 1
+        product_ids_f_path, end_dates_f_path = self.get_arrays_f_paths(version)
+        np.save(product_ids_f_path, product_ids, allow_pickle=False)
+        np.save(end_dates_f_path, end_dates, allow_pickle=False)
+
+        meta_f_path = os.path.join(self.store_dir, self.META_F_NAME)
+        with open(f'{meta_f_path}.tmp', 'w') as meta_f:
+            json.dump({'version': version, 'count': len(product_ids)}, meta_f)
+        os.replace(f'{meta_f_path}.tmp', meta_f_path)
+
+        self.arrays = (np.load(product_ids_f_path, mmap_mode='r', allow_pickle=False),
+                       np.load(end_dates_f_path, mmap_mode='r', allow_pickle=False))
+        self.version = version
+        self.remove_old_versions()
+
+    # files of older versions still mapped somewhere can't be removed on Windows, they're removed by a later save
+    def remove_old_versions(self):
+        current_f_paths = self.get_arrays_f_paths(self.version)
+        for f_path in glob.glob(os.path.join(self.store_dir, '*_*.npy')):
+            if f_path not in current_f_paths:
+                try:
+                    os.remove(f_path)
+                except OSError:
+                    pass
@@ -0,0 +1,133 @@
+import gzip
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+
+# Writes upload and full collection files. Every file is written to a temp file in its target directory and renamed
+# over the target only once complete, so a failed or interrupted write never leaves a partial file behind. Rows are
+# formatted column by column and written in blocks of BLOCK_ROWS through a BUFFER_SIZE buffer, optionally gzip
+# compressed. Formatting matches DataFrame.to_csv, which is still used for blocks with columns it can't format.
+class ExportWriter:
+    BLOCK_ROWS = 65536
+    BUFFER_SIZE = 1024 ** 2
+    UPLOAD_HEADERS = ['sellerid', 'productid', 'stock']
+
+    def __init__(self, compress: bool = False):
+        self.compress = compress
+
+    @contextmanager
+    def open_atomic(self, f_path: str):
+        tmp_path = f'{f_path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp_path, 'xb', buffering=self.BUFFER_SIZE) as raw_f:
+                if self.compress:
+                    with gzip.GzipFile(fileobj=raw_f, mode='wb', compresslevel=6) as gz_f:
+                        yield gz_f
+                else:
+                    yield raw_f
+            os.replace(tmp_path, f_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # seller and product ids with an empty stock column, same as pandas would write them
+    def write_upload(self, f_path: str, seller_ids, product_ids):
+        seller_ids = self.to_int_array(seller_ids)
+        product_ids = self.to_int_array(product_ids)
+        line_fmt = f'%d,%d,{os.linesep}'
+
+        with self.open_atomic(f_path) as f:
+            f.write((','.join(self.UPLOAD_HEADERS) + os.linesep).encode())
+            for start in range(0, len(seller_ids), self.BLOCK_ROWS):
+                block = zip(seller_ids[start:start + self.BLOCK_ROWS].tolist(),
+                            product_ids[start:start + self.BLOCK_ROWS].tolist())
+                f.write(''.join(map(line_fmt.__mod__, block)).encode())
+
+    # full file from blocks of rows, header is taken from the first one
+    def write_full(self, f_path: str, df_blocks):
+        with self.open_atomic(f_path) as f:
+            is_first = True
+            for df_block in df_blocks:
+                if is_first:
+                    f.write((','.join(map(str, df_block.columns)) + os.linesep).encode())
+                    is_first = False
+                f.write(self.format_csv_block(df_block).encode())
+
+    @staticmethod
+    def format_values(values: np.ndarray):
+        if values.dtype == np.float64:
+            return list(map(repr, values.tolist()))
+        if values.dtype.kind == 'f':
+            # float32 values are formatted by numpy, as their shortest repr
+            return list(map(str, values))
+        return list(map(str, values.tolist()))
+
+    # column values formatted same as to_csv would write them, None for columns that have to be left to to_csv. Values
+    # repeated a lot, like categories or ratings, are only formatted once.
+    @staticmethod
+    def format_column(column: pd.Series):
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            values = column.cat.categories.to_numpy()
+            codes = column.cat.codes.to_numpy()
+        elif isinstance(column.dtype, np.dtype) or pd.api.types.is_string_dtype(column.dtype):
+            values = column.to_numpy()
+            codes = None
+        else:
+            # nullable and extension dtypes
+            return None
+
+        if values.dtype.kind not in 'iubf':
+            if pd.api.types.infer_dtype(values, skipna=True) != 'string':
+                return None
+            # strings that would need quoting
+            if pd.Series(values).str.contains('[,"\r\n]', regex=True).any():
+                return None
+        elif codes is None and len(values) > 0:
+            codes, uniques = pd.factorize(values)
+            if len(uniques) * 4 < len(values):
+                values = uniques
+            else:
+                codes = None
+
+        if codes is None:
+            formatted = ExportWriter.format_values(values)
+            for i in np.flatnonzero(pd.isna(values)):
+                formatted[i] = ''
+            return formatted
+
+        formatted = np.array(ExportWriter.format_values(values) + [''], dtype=object)
+        return formatted[codes].tolist()
+
+    @staticmethod
+    def format_csv_block(df_block: pd.DataFrame):
+        columns = [ExportWriter.format_column(df_block[col]) for col in df_block.columns]
+        if any(column is None for column in columns):
+            return df_block.to_csv(index=False, header=False)
+        line_fmt = ','.join(['%s'] * len(columns)) + os.linesep
+        return ''.join(map(line_fmt.__mod__, zip(*columns)))
+
+    # upload and full file written at the same time, from the same selection of rows
+    def write_upload_and_full(self, upload_f_path: str, seller_ids, product_ids, full_f_path: str = None,
+                              df_blocks=None):
+        if full_f_path is None:
+            self.write_upload(upload_f_path, seller_ids, product_ids)
+            return
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            upload_future = executor.submit(self.write_upload, upload_f_path, seller_ids, product_ids)
+            full_future = executor.submit(self.write_full, full_f_path, df_blocks)
+            upload_future.result()
+            full_future.result()
+
+    # ids that already passed upload validation, so they're integers or strings of digits
+    @staticmethod
+    def to_int_array(ids):
+        ids = np.asarray(ids)
+        if ids.dtype.kind in 'iu':
+            return ids
+        return pd.to_numeric(pd.Series(ids)).to_numpy(dtype=np.int64)
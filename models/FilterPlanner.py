@@ -0,0 +1,75 @@
+from contextlib import nullcontext
+import numpy as np
+from models.SourceIndex import SourceIndex
+from models.StageTrace import StageTrace
+
+
+# Collects row predicates of a collection and evaluates them as one conjunction. Predicates are functions taking an
+# array of row positions and returning a boolean mask for those rows. Most selective ones, estimated on an evenly
+# spaced sample of rows, go first, so every next predicate only looks at rows that are still left.
+# A predicate can also come with postings, a function returning ascending positions of all rows passing it, e.g. from
+# SourceIndex. Those are intersected first, shortest first, and the rest of predicates only see the intersection.
+# With a trace, every predicate is traced as a stage under its name. Postings are traced over all rows.
+class FilterPlanner:
+    SAMPLE_SIZE = 1024
+
+    def __init__(self, size: int, trace: StageTrace = None):
+        self.size = size
+        self.trace = trace
+        self.predicates = {}
+        self.postings = {}
+
+    def add(self, name: str, predicate, postings=None):
+        self.predicates[name] = predicate
+        if postings is not None:
+            self.postings[name] = postings
+
+    def remove(self, name: str):
+        self.predicates.pop(name, None)
+        self.postings.pop(name, None)
+
+    def has(self, name: str):
+        return name in self.predicates
+
+    def estimate_selectivity(self, names: list):
+        sample_rows = np.unique(np.linspace(0, self.size - 1, min(self.size, self.SAMPLE_SIZE)).astype(np.intp))
+        return {name: float(np.mean(self.predicates[name](sample_rows))) for name in names}
+
+    def get_plan(self):
+        names = [name for name in self.predicates if name not in self.postings]
+        if self.size == 0 or len(names) < 2:
+            return names
+        selectivity = self.estimate_selectivity(names)
+        return sorted(names, key=lambda name: selectivity[name])
+
+    def trace_stage(self, name: str, rows_in: int):
+        if self.trace is None:
+            return nullcontext({})
+        return self.trace.stage(name, rows_in)
+
+    def get_postings_rows(self):
+        postings_rows = []
+        for name, postings in self.postings.items():
+            with self.trace_stage(name, self.size) as entry:
+                postings_rows.append(postings())
+                entry['rows_out'] = len(postings_rows[-1])
+        postings_rows.sort(key=len)
+        rows = postings_rows[0]
+        for other_rows in postings_rows[1:]:
+            rows = SourceIndex.intersect(rows, other_rows)
+        return rows
+
+    # returns ascending positions of rows passing all predicates
+    def evaluate(self):
+        if self.postings:
+            rows = self.get_postings_rows()
+        else:
+            rows = np.arange(self.size)
+
+        for name in self.get_plan():
+            if len(rows) == 0:
+                break
+            with self.trace_stage(name, len(rows)) as entry:
+                rows = rows[np.asarray(self.predicates[name](rows), dtype=bool)]
+                entry['rows_out'] = len(rows)
+        return rows
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+
+# Counts of source rows matching filter values and a price band, without touching the rows. Rows are grouped by
+# combination of values of the counted keys, e.g. cluster, category and seller_type, and kept as one sorted array of
+# group code and price rank. Rows of a group within a price band are then a range of that array, so counting any
+# selection of groups is two searchsorted calls, however many rows the source has.
+class MatchCounter:
+    def __init__(self, values: dict, prices: pd.Series):
+        self.size = len(prices)
+        group_codes = np.zeros(self.size, dtype=np.int64)
+        self.uniques = {}
+        key_codes = {}
+        for key, column in values.items():
+            codes, uniques = pd.factorize(column)
+            self.uniques[key] = {value: code for code, value in enumerate(uniques.tolist())}
+            # missing values get code -1, shifted to 0 so they're a group of their own
+            key_codes[key] = codes + 1
+            # renumbered after every key, so codes stay below rows count and never overflow
+            group_codes = pd.factorize(group_codes * (len(uniques) + 1) + key_codes[key])[0]
+
+        self.groups_count = int(group_codes.max()) + 1 if self.size else 0
+        # values of every key in every group, as codes of the key, -1 for missing values. All rows of a group have
+        # the same values, so any of them will do.
+        group_rows = np.zeros(self.groups_count, dtype=np.intp)
+        group_rows[group_codes] = np.arange(self.size)
+        self.group_values = {key: codes[group_rows] - 1 for key, codes in key_codes.items()}
+
+        prices = prices.to_numpy(dtype=float, na_value=np.nan)
+        is_priced = ~np.isnan(prices)
+        self.prices = np.unique(prices[is_priced])
+        # NaN prices are ranked after all others and only counted without a price band
+        price_ranks = np.full(self.size, len(self.prices), dtype=np.int64)
+        price_ranks[is_priced] = np.searchsorted(self.prices, prices[is_priced])
+        self.ranks_count = len(self.prices) + 1
+        self.sorted_keys = np.sort(group_codes.astype(np.int64) * self.ranks_count + price_ranks)
+
+    def has_key(self, key: str):
+        return key in self.uniques
+
+    # mask of groups having one of the values of every key in values, keys missing from values aren't filtered
+    def get_groups_mask(self, values: dict):
+        mask = np.ones(self.groups_count, dtype=bool)
+        for key, key_values in values.items():
+            # lookup of which codes are selected, shifted by one for missing values
+            is_selected = np.zeros(len(self.uniques[key]) + 1, dtype=bool)
+            is_selected[[self.uniques[key][value] + 1 for value in key_values if value in self.uniques[key]]] = True
+            mask &= is_selected[self.group_values[key] + 1]
+        return mask
+
+    # whether any row has one of the values of every key in values, regardless of price
+    def has_rows(self, values: dict):
+        return bool(self.get_groups_mask(values).any())
+
+    # rows per value of by_key among rows with one of the values of every key in values and price within inclusive
+    # low and high, either of them can be None for no bound. Rows missing by_key are counted under None.
+    def count(self, values: dict, low=None, high=None, by_key: str = 'seller_type'):
+        groups = np.flatnonzero(self.get_groups_mask(values))
+        if low is None and high is None:
+            lo_rank, hi_rank = 0, self.ranks_count
+        else:
+            lo_rank = 0 if low is None else np.searchsorted(self.prices, low, side='left')
+            hi_rank = len(self.prices) if high is None else np.searchsorted(self.prices, high, side='right')
+            hi_rank = max(lo_rank, hi_rank)
+
+        group_starts = groups.astype(np.int64) * self.ranks_count
+        group_counts = (np.searchsorted(self.sorted_keys, group_starts + hi_rank) -
+                        np.searchsorted(self.sorted_keys, group_starts + lo_rank))
+
+        if by_key not in self.group_values:
+            return {None: int(group_counts.sum())}
+        by_values = [None] + list(self.uniques[by_key])
+        by_counts = np.bincount(self.group_values[by_key][groups] + 1, weights=group_counts,
+                                minlength=len(by_values))
+        return {value: int(count) for value, count in zip(by_values, by_counts)}
@@ -0,0 +1,57 @@
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
+
+
+# Row position arrays computed over all rows of one source, e.g. rows passing a filter or rows ranked by sort keys,
+# shared by every view collection of that source. Safe to use from several threads, every key is only computed once.
+# With max_bytes, least recently used values are evicted once arrays kept take more than that.
+class RowsMemo:
+    def __init__(self, max_bytes: int = None):
+        self.values = OrderedDict()
+        self.locks = {}
+        self.lock = Lock()
+        self.max_bytes = max_bytes
+        self.bytes = 0
+
+    def get(self, key: tuple, compute):
+        with self.lock:
+            if key in self.values:
+                self.values.move_to_end(key)
+                return self.values[key]
+            key_lock = self.locks.setdefault(key, Lock())
+
+        with key_lock:
+            with self.lock:
+                if key in self.values:
+                    return self.values[key]
+            value = compute()
+            with self.lock:
+                self.values[key] = value
+                self.bytes += self.get_nbytes(value)
+                self.locks.pop(key, None)
+                self.evict()
+        return value
+
+    # bytes of arrays in a value, also of arrays in tuples of them
+    @staticmethod
+    def get_nbytes(value):
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, (tuple, list)):
+            return sum(RowsMemo.get_nbytes(item) for item in value)
+        return 0
+
+    # the latest value is kept even if it doesn't fit by itself, it's in use already anyway
+    def evict(self):
+        if self.max_bytes is None:
+            return
+        while self.bytes > self.max_bytes and len(self.values) > 1:
+            key, value = self.values.popitem(last=False)
+            self.bytes -= self.get_nbytes(value)
+
+    def __contains__(self, key: tuple):
+        return key in self.values
+
+    def __len__(self):
+        return len(self.values)
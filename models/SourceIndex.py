@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+
+# Built once per loaded source and shared by every collection generated from it. Holds postings, i.e. ascending row
+# positions of the source, for every value of cluster, category and seller_type, plus source rows ordered by price,
+# so filters only touch the rows they return.
+class SourceIndex:
+    INDEXED_KEYS = ['cluster', 'cat_id', 'seller_type']
+
+    def __init__(self, values: dict, prices: pd.Series):
+        self.size = len(prices)
+        self.postings = {key: self.build_postings(column) for key, column in values.items()}
+
+        prices = prices.to_numpy(dtype=float, na_value=np.nan)
+        # NaN prices are sorted last and never match a price band
+        self.price_order = np.argsort(prices, kind='stable')
+        self.priced_count = int(np.count_nonzero(~np.isnan(prices)))
+        self.sorted_prices = prices[self.price_order[:self.priced_count]]
+
+    @staticmethod
+    def build_postings(column: pd.Series):
+        codes, uniques = pd.factorize(column)
+        # missing values get code -1 and are sorted in front of all the others
+        order = np.argsort(codes, kind='stable')
+        bounds = np.count_nonzero(codes < 0) + np.concatenate([[0], np.cumsum(np.bincount(codes[codes >= 0],
+                                                                                             minlength=len(uniques)))])
+        return {value: order[bounds[i]:bounds[i + 1]] for i, value in enumerate(uniques.tolist())}
+
+    # mask of which positions are in ascending positions sorted_rows
+    @staticmethod
+    def contains(positions, sorted_rows):
+        if len(sorted_rows) == 0:
+            return np.zeros(len(positions), dtype=bool)
+        idx = np.searchsorted(sorted_rows, positions).clip(max=len(sorted_rows) - 1)
+        return sorted_rows[idx] == positions
+
+    @staticmethod
+    def intersect(sorted_rows, other_sorted_rows):
+        return sorted_rows[SourceIndex.contains(sorted_rows, other_sorted_rows)]
+
+    def has_key(self, key: str):
+        return key in self.postings
+
+    def get_values(self, key: str):
+        return list(self.postings[key])
+
+    def has_value(self, key: str, value):
+        return value in self.postings[key]
+
+    def get_rows(self, key: str, values: list):
+        rows = [self.postings[key][value] for value in set(values) if value in self.postings[key]]
+        if len(rows) == 0:
+            return np.array([], dtype=np.intp)
+        if len(rows) == 1:
+            return rows[0]
+        return np.sort(np.concatenate(rows))
+
+    # rows with price within inclusive low and high, either of them can be None for no bound
+    def get_price_rows(self, low, high):
+        if low is None and high is None:
+            return np.arange(self.size)
+        lo = 0 if low is None else np.searchsorted(self.sorted_prices, low, side='left')
+        hi = self.priced_count if high is None else np.searchsorted(self.sorted_prices, high, side='right')
+        return np.sort(self.price_order[lo:max(lo, hi)])
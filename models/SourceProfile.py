@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+
+# Summary of a loaded source, computed once in one pass over each profiled column and cached with the source: counts
+# of every cluster, category and seller_type value, price min, max and quantiles, and count of out of stock rows.
+# Values are kept as dict keys, so checking user input against the source is a set lookup, never a column scan.
+class SourceProfile:
+    COUNTED_KEYS = ['cluster', 'cat_id', 'seller_type']
+    PRICE_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+    def __init__(self, rows: int, counts: dict, prices: dict, out_of_stock: int = None):
+        self.rows = rows
+        self.counts = counts
+        self.prices = prices
+        self.out_of_stock = out_of_stock
+
+    # columns maps keys to column names, same as Collection.columns
+    @classmethod
+    def from_df(cls, df: pd.DataFrame, columns: dict):
+        counts = {key: cls.count_values(df[columns[key]]) for key in cls.COUNTED_KEYS if key in columns}
+
+        prices = cls.get_price_stats(df[columns['price']]) if 'price' in columns else None
+
+        out_of_stock = None
+        if 'stock' in columns:
+            out_of_stock = int(np.count_nonzero(df[columns['stock']].to_numpy() == 0))
+
+        return cls(len(df), counts, prices, out_of_stock)
+
+    # count of every value, in order of first appearance. Missing values aren't counted.
+    @staticmethod
+    def count_values(column: pd.Series):
+        codes, uniques = pd.factorize(column)
+        value_counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        return dict(zip(uniques.tolist(), value_counts.tolist()))
+
+    @staticmethod
+    def get_price_stats(prices: pd.Series):
+        if not pd.api.types.is_numeric_dtype(prices):
+            prices = pd.to_numeric(prices.astype(str).str.replace(',', ''), errors='coerce')
+        prices = prices.to_numpy(dtype=float, na_value=np.nan)
+        prices = prices[~np.isnan(prices)]
+        if len(prices) == 0:
+            return None
+        return {
+            'min': float(prices.min()),
+            'max': float(prices.max()),
+            'quantiles': dict(zip(SourceProfile.PRICE_QUANTILES,
+                                  np.quantile(prices, SourceProfile.PRICE_QUANTILES).tolist()))
+        }
+
+    def has_key(self, key: str):
+        return key in self.counts
+
+    def has_value(self, key: str, value):
+        return value in self.counts.get(key, {})
+
+    # values of key, as dict keys view, so in is a set lookup
+    def get_values(self, key: str):
+        return self.counts.get(key, {}).keys()
+
+    def get_count(self, key: str, value):
+        return self.counts.get(key, {}).get(value, 0)
+
+    # JSON keys can only be strings, so counts are stored as pairs, keeping int values ints
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'counts': {key: list(map(list, value_counts.items())) for key, value_counts in self.counts.items()},
+            'prices': None if self.prices is None else dict(self.prices, quantiles=list(
+                map(list, self.prices['quantiles'].items()))),
+            'out_of_stock': self.out_of_stock
+        }
+
+    @classmethod
+    def from_dict(cls, profile: dict):
+        prices = profile['prices']
+        if prices is not None:
+            prices = dict(prices, quantiles={q: val for q, val in prices['quantiles']})
+        counts = {key: {val: count for val, count in pairs} for key, pairs in profile['counts'].items()}
+        return cls(profile['rows'], counts, prices, profile['out_of_stock'])
+
+    def get_summary(self):
+        summary = [f'{self.rows} rows']
+        if 'cluster' in self.counts:
+            summary.append(f"{len(self.counts['cluster'])} clusters")
+        if 'cat_id' in self.counts:
+            summary.append(f"{len(self.counts['cat_id'])} categories")
+        if self.prices is not None:
+            summary.append(f"price {self.prices['min']:.2f}-{self.prices['max']:.2f}")
+        if self.out_of_stock is not None:
+            summary.append(f'{self.out_of_stock} out of stock')
+        return ', '.join(summary)
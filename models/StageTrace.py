@@ -0,0 +1,55 @@
+import json
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter
+
+
+# Structured trace of collection generation, one entry per stage in the order stages ran: rows in, rows out, wall time
+# and bytes allocated at peak during the stage. Bytes are only known while tracemalloc is tracing, which trace_alloc
+# starts, and they're process wide, so collections generated on several threads at once share them.
+class StageTrace:
+    def __init__(self, trace_alloc: bool = False):
+        self.trace_alloc = trace_alloc
+        self.stages = []
+
+    # entry of the stage is yielded, for stages that set rows_out themselves instead of passing get_rows_out
+    @contextmanager
+    def stage(self, name: str, rows_in: int, get_rows_out=None):
+        if self.trace_alloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        is_tracing = tracemalloc.is_tracing()
+        if is_tracing:
+            start_bytes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        entry = {
+            'stage': name,
+            'rows_in': int(rows_in),
+            'rows_out': None,
+            'wall_s': None,
+            'bytes': None
+        }
+        start_t = perf_counter()
+        yield entry
+        entry['wall_s'] = perf_counter() - start_t
+
+        if get_rows_out is not None:
+            entry['rows_out'] = int(get_rows_out())
+        if is_tracing:
+            entry['bytes'] = max(tracemalloc.get_traced_memory()[1] - start_bytes, 0)
+        self.stages.append(entry)
+
+    def get_stages(self):
+        return self.stages
+
+    def get_total_wall_s(self):
+        return sum(entry['wall_s'] for entry in self.stages)
+
+    def to_dict(self):
+        return {
+            'total_wall_s': self.get_total_wall_s(),
+            'stages': self.stages
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from models.CmsFileHelper import CmsFileHelper
+
+
+class TestCmsFileHelper(unittest.TestCase):
+    def test_validate_upload_ids(self):
+        report = CmsFileHelper.validate_upload_ids(np.array([1, 2, 3]), np.array([10, 20, 30]))
+        self.assertTrue(report['is_valid'])
+        self.assertEqual(3, report['count'])
+
+        report = CmsFileHelper.validate_upload_ids([1, None, 3, 'abc', 50], [10, 20, np.nan, 40, 40])
+        self.assertFalse(report['is_valid'])
+        self.assertEqual({'sellerid': [1], 'productid': [2]}, report['null_rows'])
+        self.assertEqual({'sellerid': [3], 'productid': [0, 1, 3, 4]}, report['not_int_rows'])
+
+        report = CmsFileHelper.validate_upload_ids(['1', 25, 3], [10, 20, 30])
+        self.assertEqual([1], report['order_rows'])
+        self.assertEqual({'sellerid': [], 'productid': []}, report['not_int_rows'])
+
+        report = CmsFileHelper.validate_upload_ids([], [])
+        self.assertTrue(report['is_empty'])
+        self.assertFalse(report['is_valid'])
+
+        report = CmsFileHelper.validate_upload_ids([1, 2], [10])
+        self.assertTrue(report['is_length_mismatch'])
+        self.assertFalse(report['is_valid'])
+
+    def test_prepare_upload_f(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for paranoid in [False, True]:
+                fh = CmsFileHelper('1')
+                fh.upload_f_path = os.path.join(tmp_dir, f'upload_{paranoid}.csv')
+                self.assertTrue(fh.prepare_upload_f(seller_product_ids={'seller_id': [1, 2], 'product_id': [10, 20]},
+                                                    paranoid=paranoid))
+                self.assertEqual(2, fh.upload_f_count)
+
+            # invalid ids are never written
+            fh = CmsFileHelper('2')
+            fh.upload_f_path = os.path.join(tmp_dir, 'upload_invalid.csv')
+            self.assertFalse(fh.prepare_upload_f(seller_product_ids={'seller_id': [1, 30], 'product_id': [10, 20]}))
+            self.assertEqual([1], fh.upload_report['order_rows'])
+            self.assertFalse(os.path.exists(fh.upload_f_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
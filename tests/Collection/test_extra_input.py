@@ -0,0 +1,60 @@
+import unittest
+import numpy as np
+import pandas as pd
+from models.Collection import CmsColl, BankColl
+from tests.helpers import make_bank_df, make_cms_df
+
+
+class TestExtraInput(unittest.TestCase):
+    def setUp(self):
+        self.bank_df = make_bank_df(1000)
+        self.cms_df = make_cms_df(1000)
+
+    def get_extra_input(self, df: pd.DataFrame, columns: dict, new_product_ids: list):
+        product_ids = df[columns['product_id']].iloc[[5, 10, 5]].tolist() + new_product_ids
+        return {
+            'seller_id': list(range(100001, 100001 + len(product_ids))),
+            'product_id': product_ids
+        }
+
+    def test_concat_extra_input(self):
+        for coll_cls, df in [(BankColl, self.bank_df), (CmsColl, self.cms_df)]:
+            for view in [False, True]:
+                with self.subTest(coll_cls=coll_cls.__name__, view=view):
+                    coll = coll_cls(df, view=view)
+                    columns = coll.columns
+                    coll.keep(np.arange(len(df)) % 2 == 0)
+                    coll.set_extra_input(self.get_extra_input(df, columns, [1]))
+                    coll.concat_extra_input()
+                    coll_df = coll.get_df()
+
+                    # products 5 and 10 are moved to the front, duplicate of 5 dropped, 1 isn't in source
+                    self.assertEqual(3 + len(df) // 2 - 1, len(coll_df))
+                    self.assertTrue(coll_df[columns['product_id']].is_unique)
+                    self.assertEqual([100001, 100002, 100004], coll_df[columns['seller_id']].iloc[:3].tolist())
+
+                    # source columns are taken from the source, also for products not in collection rows
+                    other_cols = [col for col in df.columns if col not in [columns['seller_id'], columns['product_id']]]
+                    pd.testing.assert_frame_equal(df[other_cols].iloc[[5, 10]].reset_index(drop=True),
+                                                  coll_df[other_cols].iloc[:2].reset_index(drop=True),
+                                                  check_dtype=False)
+                    self.assertTrue(coll_df[other_cols].iloc[2].isna().all())
+
+                    # dtypes are kept, ints become nullable ints
+                    for col in df.columns:
+                        if isinstance(df[col].dtype, np.dtype) and df[col].dtype.kind in 'iub' and \
+                                col not in [columns['seller_id'], columns['product_id']]:
+                            self.assertEqual(pd.array(df[col].to_numpy()).dtype, coll_df[col].dtype)
+                        else:
+                            self.assertEqual(df[col].dtype, coll_df[col].dtype)
+
+    def test_all_in_source(self):
+        coll = BankColl(self.bank_df)
+        coll.set_extra_input(self.get_extra_input(self.bank_df, coll.columns, []))
+        coll.concat_extra_input()
+        pd.testing.assert_series_equal(self.bank_df.dtypes, coll.get_df().dtypes)
+        self.assertEqual(len(self.bank_df), coll.get_df_size())
+
+
+if __name__ == '__main__':
+    unittest.main()
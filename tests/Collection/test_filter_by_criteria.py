@@ -0,0 +1,32 @@
+import unittest
+from models.Collection import BankColl
+from tests.helpers import make_bank_df
+
+
+class TestFilterByCriteria(unittest.TestCase):
+    def test_filter_by_criteria(self):
+        bank_df = make_bank_df(500)
+        crits_cases = [
+            {'cluster': 'Fashion', 'cat_id': [1, 5], 'price_min': 10, 'price_max': 900},
+            {'cluster': 'Not a cluster', 'cat_id': ['1', 'abc', 2000], 'price_min': '', 'price_max': 500},
+            {'cluster': None, 'cat_id': [100], 'price_min': 5000, 'price_max': ''},
+        ]
+
+        for crits in crits_cases:
+            with self.subTest(crits=crits):
+                # same rows and messages as applying filters one after another
+                seq_coll = BankColl(bank_df.copy())
+                if crits['cluster']:
+                    seq_coll.filter_by_cluster(crits['cluster'])
+                seq_coll.filter_by_cat_allocation(crits['cat_id'])
+                seq_coll.filter_by_single_price_points(crits['price_min'], crits['price_max'])
+
+                fused_coll = BankColl(bank_df, view=True)
+                fused_coll.filter_by_criteria(crits)
+
+                self.assertEqual(seq_coll.get_column_values('product_id'), fused_coll.get_column_values('product_id'))
+                self.assertEqual(seq_coll.messages, fused_coll.messages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import numpy as np
+from models.Collection import BankColl
+from tests.helpers import make_bank_df, default_criteria
+
+
+class TestInterleave(unittest.TestCase):
+    def setUp(self):
+        self.df = make_bank_df()
+
+    # blocks filled group by group, as many rows of each as its weight, skipping groups that ran out
+    @staticmethod
+    def get_expected_groups(group_lens: list, weights: list, size_max: int):
+        taken = [0] * len(group_lens)
+        groups = []
+        while len(groups) < min(size_max, sum(group_lens)):
+            for group, weight in enumerate(weights):
+                for _ in range(weight):
+                    if taken[group] < group_lens[group] and len(groups) < size_max:
+                        groups.append(group)
+                        taken[group] += 1
+        return groups
+
+    def test_slots(self):
+        group_lens = [7, 2, 12, 5]
+        weights = [2, 1, 3, 1]
+        for size_max in [None, 0, 10, 26, 100]:
+            with self.subTest(size_max=size_max):
+                slots = BankColl.get_interleave_slots(group_lens, weights, size_max)
+                groups = np.empty(sum(len(group_slots) for group_slots in slots), dtype=int)
+                for group, group_slots in enumerate(slots):
+                    groups[group_slots] = group
+                expected_size_max = sum(group_lens) if size_max is None else size_max
+                self.assertEqual(self.get_expected_groups(group_lens, weights, expected_size_max), groups.tolist())
+
+    def test_two_way_same_as_ratio_slots(self):
+        for local_len, offshore_len, ratio, size_max in [(10, 10, (3, 2), None), (4, 20, (1, 2), 15),
+                                                         (30, 3, (2, 5), 20), (0, 5, (1, 1), None)]:
+            local_c = np.arange(min(local_len, size_max or local_len))
+            offshore_c = np.arange(min(offshore_len, size_max or offshore_len))
+            local_slots = local_c + np.minimum(offshore_len, (local_c // ratio[0]) * ratio[1])
+            offshore_slots = offshore_c + np.minimum(local_len, (offshore_c // ratio[1] + 1) * ratio[0])
+            cap = local_len + offshore_len if size_max is None else size_max
+
+            slots = BankColl.get_interleave_slots([local_len, offshore_len], list(ratio), size_max)
+            np.testing.assert_array_equal(local_slots[local_slots < cap], slots[0])
+            np.testing.assert_array_equal(offshore_slots[offshore_slots < cap], slots[1])
+
+    def test_interleave_criterion(self):
+        weights = [['Electronics', 2], ['FMCG', 1], ['Fashion', 1]]
+        for view, build_index in [(False, False), (True, False), (True, True)]:
+            with self.subTest(view=view, index=build_index):
+                coll = BankColl(self.df.copy(), view=view)
+                if build_index:
+                    coll.build_index()
+                coll.process_by_criteria(default_criteria(interleave={'by': 'cluster', 'weights': weights}))
+                coll_df = coll.get_df()
+
+                clusters = coll_df['cluster'].tolist()
+                group_lens = [int((self.df['cluster'] == cluster).sum()) for cluster, _ in weights]
+                expected_groups = self.get_expected_groups(group_lens, [weight for _, weight in weights], 100)
+                self.assertEqual([weights[group][0] for group in expected_groups], clusters)
+
+                # ADO order is kept within every cluster
+                for cluster, _ in weights:
+                    ado = coll_df.loc[coll_df['cluster'] == cluster, 'ado'].tolist()
+                    expected_ado = self.df.loc[self.df['cluster'] == cluster, 'ado'].sort_values(
+                        ascending=False, kind='stable').tolist()[:len(ado)]
+                    self.assertEqual(expected_ado, ado)
+
+    def test_interleave_cat_ids(self):
+        coll = BankColl(self.df.copy())
+        coll.process_by_criteria(default_criteria(interleave={'by': 'cat_id', 'weights': {'1': 1, '2': 1, '1000': 1}}))
+        self.assertEqual([1, 2] * 10, coll.get_df()['category_id'].tolist()[:20])
+        self.assertIn('Interleave values not found: [1000].', coll.get_messages())
+
+        coll = BankColl(self.df.copy())
+        coll.process_by_criteria(default_criteria(interleave={'by': 'brand', 'weights': {'x': 1}}))
+        self.assertIn('Failed to interleave by brand.', coll.get_messages())
+
+
+if __name__ == '__main__':
+    unittest.main()
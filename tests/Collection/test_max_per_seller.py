@@ -0,0 +1,43 @@
+import unittest
+import numpy as np
+from models.Collection import CmsColl, BankColl
+from tests.helpers import make_bank_df, make_cms_df, default_criteria
+
+
+class TestMaxPerSeller(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.bank_df = make_bank_df()
+        self.bank_df['seller_id'] = rng.integers(100000, 100050, len(self.bank_df)).astype(np.int32)
+        self.cms_df = make_cms_df()
+        self.cms_df['Seller ID'] = rng.integers(100000, 100050, len(self.cms_df))
+        self.criteria = default_criteria(size_max=120, max_per_seller=2)
+
+    def test_top_rows_per_seller(self):
+        for coll_cls, df in [(BankColl, self.bank_df), (CmsColl, self.cms_df)]:
+            for view in [False, True]:
+                with self.subTest(coll_cls=coll_cls.__name__, view=view):
+                    coll = coll_cls(df.copy(), view=view)
+                    seller_col, ado_col = coll.columns['seller_id'], coll.columns['ado']
+                    coll.process_by_criteria(dict(self.criteria))
+                    coll_df = coll.get_df()
+
+                    # only top 2 rows by ADO of every seller are left, 50 sellers give 100 rows, below size_max
+                    top_df = df.sort_values(ado_col, ascending=False, kind='stable').groupby(seller_col).head(2)
+                    self.assertEqual(100, len(coll_df))
+                    self.assertEqual(set(top_df[coll.columns['product_id']]),
+                                     set(coll_df[coll.columns['product_id']]))
+
+                    # same as generating from those rows without the cap
+                    uncapped_coll = coll_cls(df.loc[sorted(top_df.index)].copy())
+                    uncapped_coll.process_by_criteria(dict(self.criteria, max_per_seller=None))
+                    self.assertEqual(uncapped_coll.export_for_upload(), coll.export_for_upload())
+
+    def test_no_seller_over_cap(self):
+        coll = BankColl(self.bank_df.copy(), view=True)
+        coll.cap_per_seller(len(self.bank_df))
+        self.assertIsNone(coll.positions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+from models.Collection import CmsColl, BankColl
+from tests.helpers import make_bank_df, make_cms_df, default_criteria
+
+
+class TestProcessMany(unittest.TestCase):
+    def test_process_many(self):
+        base_crits = default_criteria(size_max=8, sort_next='rating', ratio=None, out_of_stock=True)
+        crits_cases = [
+            {},
+            {'price_min': 10, 'price_max': 900},
+            {'price_min': 10, 'price_max': 900, 'ratio': {'local': 3, 'offshore': 2}},
+            {'sort_first': 'rating', 'sort_next': '', 'size_max': 3000},
+        ]
+        crits_list = [dict(base_crits, **crits) for crits in crits_cases]
+
+        for coll_cls, df in [(CmsColl, make_cms_df(200)), (BankColl, make_bank_df(200))]:
+            colls = coll_cls.process_many(df, crits_list, max_workers=2)
+            # same collections as generated one by one
+            for crits, coll in zip(crits_list, colls):
+                with self.subTest(coll_cls=coll_cls.__name__, crits=crits):
+                    single_coll = coll_cls(df.copy(deep=True))
+                    single_coll.process_by_criteria(dict(crits))
+                    self.assertEqual(single_coll.export_for_upload(), coll.export_for_upload())
+                    self.assertEqual(single_coll.messages, coll.messages)
+
+
+if __name__ == '__main__':
+    unittest.main()
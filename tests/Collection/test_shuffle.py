@@ -0,0 +1,28 @@
+import unittest
+from models.Collection import CmsColl, BankColl
+from tests.helpers import make_bank_df, make_cms_df
+
+
+class TestShuffle(unittest.TestCase):
+    def test_shuffle_size_max(self):
+        ratio = {'local': 3, 'offshore': 2}
+
+        for coll_cls, df in [(CmsColl, make_cms_df(50)), (BankColl, make_bank_df(50))]:
+            with self.subTest(coll_cls=coll_cls.__name__):
+                full_coll = coll_cls(df.copy())
+                full_coll.shuffle(ratio)
+
+                capped_coll = coll_cls(df.copy())
+                capped_coll.shuffle(ratio, size_max=7)
+
+                # capped shuffle is the same order, just stopped early
+                self.assertEqual(7, capped_coll.get_df_size())
+                self.assertEqual(full_coll.get_column_values('product_id')[:7],
+                                 capped_coll.get_column_values('product_id'))
+                # original dtypes and index are kept
+                self.assertEqual(list(df.dtypes), list(capped_coll.df.dtypes))
+                self.assertEqual(list(full_coll.df.index[:7]), list(capped_coll.df.index))
+
+
+if __name__ == '__main__':
+    unittest.main()
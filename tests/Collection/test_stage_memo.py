@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+from models.Collection import BankColl
+from models.RowsMemo import RowsMemo
+from tests.helpers import make_bank_df, default_criteria
+
+
+class TestStageMemo(unittest.TestCase):
+    def setUp(self):
+        self.df = make_bank_df()
+        self.criteria = default_criteria(size_max=300, cluster='Fashion', cat_id=[1, 2, 3, 'x'], price_min=50.0,
+                                         price_max=900.0, sort_next='rating')
+
+    def process(self, coll: BankColl, criteria: dict):
+        coll.reset()
+        coll.messages = []
+        coll.process_by_criteria(dict(criteria))
+        return coll
+
+    def test_memo_hit_equals_fresh_run(self):
+        coll = BankColl(self.df, view=True)
+        coll.set_memo(RowsMemo())
+        self.process(coll, self.criteria)
+
+        for changed in [{'size_max': 100}, {'ratio': {'local': 1, 'offshore': 1}}, {}]:
+            with self.subTest(changed=changed):
+                criteria = dict(self.criteria, **changed)
+                self.process(coll, criteria)
+                self.assertIn('filters_memo', [entry['stage'] for entry in coll.get_trace().get_stages()])
+
+                fresh_coll = BankColl(self.df.copy())
+                fresh_coll.process_by_criteria(dict(criteria))
+                self.assertEqual(fresh_coll.export_for_upload(), coll.export_for_upload())
+                # messages of the filters are replayed
+                self.assertEqual(fresh_coll.messages, coll.messages)
+
+        # same criteria again, order is restored too
+        self.process(coll, self.criteria)
+        self.assertIn('order_memo', [entry['stage'] for entry in coll.get_trace().get_stages()])
+
+    def test_eviction(self):
+        memo = RowsMemo(max_bytes=100)
+        memo.get(('a',), lambda: np.arange(10))
+        memo.get(('b',), lambda: np.arange(10))
+        self.assertNotIn(('a',), memo)
+        self.assertIn(('b',), memo)
+        self.assertEqual(80, memo.bytes)
+
+        # the latest value is kept even if it's bigger than max_bytes
+        memo.get(('c',), lambda: (np.arange(20), ('message',)))
+        self.assertEqual([('c',)], list(memo.values))
+        self.assertEqual(160, memo.bytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+import numpy as np
+from models.Collection import CmsColl, BankColl
+from models.RowsMemo import RowsMemo
+from tests.helpers import make_bank_df, make_cms_df, default_criteria
+
+
+class TestTopRows(unittest.TestCase):
+    def test_top_rows(self):
+        for coll in [CmsColl(make_cms_df(20)), BankColl(make_bank_df(20))]:
+            all_rows = np.arange(coll.get_df_size())
+            for sort_keys in [['ado'], ['rating'], ['ado', 'rating']]:
+                sorted_rows = coll.get_top_rows(sort_keys, None, all_rows)
+                for k in [0, 1, 5, 19, 20, 50]:
+                    # same as sorting everything and truncating
+                    self.assertEqual(sorted_rows[:k].tolist(), coll.get_top_rows(sort_keys, k, all_rows).tolist())
+
+    # rows with equal sort keys keep their source order, also when sorting by a single key. Before the top rows
+    # selection a single key was sorted with an unstable quicksort, which ordered ties arbitrarily.
+    def test_tie_order(self):
+        df = make_bank_df(500)
+        df['ado'] = np.random.default_rng(1).integers(0, 5, len(df)).astype(float)
+        expected_ids = df.sort_values('ado', ascending=False, kind='stable')['product_id'].tolist()
+
+        coll = BankColl(df.copy())
+        coll.sort_by('ado')
+        self.assertEqual(expected_ids, coll.get_column_values('product_id'))
+
+        for view, memo in [(False, None), (True, None), (True, RowsMemo())]:
+            with self.subTest(view=view, memo=memo is not None):
+                coll = BankColl(df.copy(), view=view)
+                if memo is not None:
+                    coll.set_memo(memo)
+                coll.process_by_criteria(default_criteria(size_max=30, ratio=None))
+                self.assertEqual(expected_ids[:30], coll.get_column_values('product_id'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+import pandas as pd
+from models.Collection import CmsColl, BankColl
+from tests.helpers import make_bank_df, make_cms_df, default_criteria
+
+
+class TestViewMode(unittest.TestCase):
+    def test_view_mode(self):
+        criteria = default_criteria(size_max=12, price_min=10, price_max=900, sort_next='rating', out_of_stock=True,
+                                    extra_input={'seller_id': [123456, 234567], 'product_id': [12345678, 23456789]})
+
+        for coll_cls, df in [(CmsColl, make_cms_df(200)), (BankColl, make_bank_df(200))]:
+            with self.subTest(coll_cls=coll_cls.__name__):
+                df_before = df.copy(deep=True)
+                coll = coll_cls(df.copy(deep=True))
+                view_coll = coll_cls(df, view=True)
+
+                coll.process_by_criteria(dict(criteria))
+                view_coll.process_by_criteria(dict(criteria))
+
+                self.assertEqual(coll.export_for_upload(), view_coll.export_for_upload())
+                # extra input rows have missing values, NaN only equals NaN in a frame comparison
+                pd.testing.assert_frame_equal(coll.get_df().reset_index(drop=True),
+                                              view_coll.get_df().reset_index(drop=True))
+                # base of a view is never modified
+                self.assertTrue(df_before.equals(df))
+
+                # reset brings back all source rows, without extra input
+                view_coll.reset()
+                self.assertEqual(len(df), view_coll.get_df_size())
+                self.assertEqual(df[coll.columns['product_id']].tolist(), view_coll.get_column_values('product_id'))
+
+
+if __name__ == '__main__':
+    unittest.main()
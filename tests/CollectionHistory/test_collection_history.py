@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+import numpy as np
+from models.CmsFileHelper import CmsFileHelper
+from models.CollectionHistory import CollectionHistory
+
+
+class TestCollectionHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.history_dir = os.path.join(self.tmp_dir.name, 'history')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_encode_ids(self):
+        for ids, dtype in [([], np.uint8), ([7], np.uint8), ([3, 200, 455], np.uint8), ([3, 70000], np.uint32),
+                           ([10 ** 11, 2 * 10 ** 11], np.uint64)]:
+            with self.subTest(ids=ids):
+                first_id, deltas = CollectionHistory.encode_ids(np.array(ids, dtype=np.int64))
+                self.assertEqual(dtype, deltas.dtype)
+                np.testing.assert_array_equal(ids, CollectionHistory.decode_ids(first_id, deltas))
+
+    def test_record_and_lookup(self):
+        history = CollectionHistory(self.history_dir)
+        self.assertEqual(0, len(history.lookup([1, 2])))
+
+        self.assertEqual(0, history.record('a', [1, 1, 2], [30, 10, 10], datetime(2026, 1, 1, 10)))
+        self.assertEqual(1, history.record('b', [2, 3], [20, 30], datetime(2026, 2, 1, 10)))
+        # same collection generated again is recorded again
+        self.assertEqual(2, history.record('a', [1], ['30', 'x'], datetime(2026, 3, 1, 10)))
+
+        # other instances pick up recorded collections
+        other_history = CollectionHistory(self.history_dir)
+        found_df = other_history.lookup([30, 10, 40, 10])
+        self.assertEqual([10, 30, 30, 30], found_df['product_id'].tolist())
+        self.assertEqual(['a', 'a', 'b', 'a'], found_df['coll_id'].tolist())
+        self.assertEqual([np.datetime64('2026-01-01T10:00:00'), np.datetime64('2026-02-01T10:00:00')],
+                         found_df['created'].tolist()[1:3])
+        self.assertEqual({2: [0, 1], 3: [1]}, other_history.lookup([2, 3], 'seller_id').groupby(
+            'seller_id')['coll_no'].apply(list).to_dict())
+
+        collection = other_history.get_collection(0)
+        self.assertEqual(('a', 2, 2), (collection['coll_id'], collection['products'], collection['sellers']))
+        np.testing.assert_array_equal([10, 30], collection['product_id'])
+        np.testing.assert_array_equal([1, 2], collection['seller_id'])
+
+        # only index files of the current version are left
+        self.assertEqual(3, history.get_version())
+        self.assertEqual(['collections', 'collections.jsonl', 'history.json', 'product_id_colls_3.npy',
+                          'product_id_ids_3.npy', 'seller_id_colls_3.npy', 'seller_id_ids_3.npy'],
+                         sorted(os.listdir(self.history_dir)))
+
+    def test_segments_merged(self):
+        history = CollectionHistory(self.history_dir)
+        # only the first record is merged into the empty index, later ones are kept as segments
+        history.MERGE_RATIO = 0
+        for coll_no in range(5):
+            history.record(str(coll_no), [coll_no % 2], [100, 100 + coll_no], datetime(2026, 1, 1 + coll_no))
+        self.assertEqual(1, history.get_version())
+        self.assertEqual(4, len(history.state[5]['product_id']))
+
+        found_df = history.lookup([102, 100, 104])
+        self.assertEqual([100] * 5 + [102, 104], found_df['product_id'].tolist())
+        self.assertEqual([0, 1, 2, 3, 4, 2, 4], found_df['coll_no'].tolist())
+        # other instances read segments from collection files
+        self.assertTrue(found_df.equals(CollectionHistory(self.history_dir).lookup([100, 102, 104])))
+
+        history.merge()
+        self.assertEqual((2, 0), (history.get_version(), len(history.state[5]['product_id'])))
+        self.assertTrue(found_df.equals(history.lookup([100, 102, 104])))
+        found_df = CollectionHistory(self.history_dir).lookup([0, 1], 'seller_id')
+        self.assertEqual({0: [0, 2, 4], 1: [1, 3]}, found_df.groupby('seller_id')['coll_no'].apply(list).to_dict())
+
+    def test_upload_recorded(self):
+        history = CollectionHistory(self.history_dir)
+        fh = CmsFileHelper('123')
+        fh.upload_f_path = os.path.join(self.tmp_dir.name, 'upload_123.csv')
+        fh.history = history
+        self.assertTrue(fh.prepare_upload_f(seller_product_ids={'seller_id': [1, 2], 'product_id': [10, 20]}))
+
+        # invalid upload files aren't written, nor recorded
+        fh = CmsFileHelper('124')
+        fh.upload_f_path = os.path.join(self.tmp_dir.name, 'upload_124.csv')
+        fh.history = history
+        self.assertFalse(fh.prepare_upload_f(seller_product_ids={'seller_id': [1, 30], 'product_id': [10, 20]}))
+
+        found_df = history.lookup([10, 20])
+        self.assertEqual(['123', '123'], found_df['coll_id'].tolist())
+        self.assertEqual(os.path.join(self.tmp_dir.name, 'upload_123.csv'),
+                         history.get_collection(0)['upload_f_path'])
+
+
+if __name__ == '__main__':
+    unittest.main()
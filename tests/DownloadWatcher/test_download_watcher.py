@@ -0,0 +1,67 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from models.DownloadWatcher import DownloadWatcher
+
+
+class TestDownloadWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.download_dir = self.tmp_dir.name
+        self.patterns = {
+            '101': 'coll_101_selected_products*.csv',
+            '202': 'coll_202_selected_products*.csv'
+        }
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_file(self, f_name: str, download_dir: str = None):
+        with open(os.path.join(download_dir or self.download_dir, f_name), 'w') as f:
+            f.write('Seller ID,Product ID\n')
+
+    def wait_for(self, watcher: DownloadWatcher, patterns: dict, wait_t_s: float, delayed_files: list = ()):
+        click_time = datetime.now() - timedelta(seconds=1)
+        timers = [threading.Timer(0.2, self.create_file, [f_name, watcher.download_dir]) for f_name in delayed_files]
+        for timer in timers:
+            timer.start()
+        found = asyncio.run(watcher.wait_for(patterns, click_time, wait_t_s))
+        for timer in timers:
+            timer.join()
+        return found
+
+    def test_wait_for(self):
+        for use_inotify in [True, False]:
+            with self.subTest(use_inotify=use_inotify):
+                download_dir = tempfile.mkdtemp(dir=self.download_dir)
+                watcher = DownloadWatcher(download_dir, use_inotify)
+                # one export already there, one downloaded while waiting
+                self.create_file('coll_101_selected_products.csv', download_dir)
+                self.create_file('coll_303_selected_products.csv', download_dir)
+
+                found = self.wait_for(watcher, self.patterns, 5, ['coll_202_selected_products (1).csv', 'other.csv'])
+                self.assertEqual({
+                    '101': 'coll_101_selected_products.csv',
+                    '202': 'coll_202_selected_products (1).csv'
+                }, found)
+
+    def test_timeout(self):
+        for use_inotify in [True, False]:
+            with self.subTest(use_inotify=use_inotify):
+                watcher = DownloadWatcher(tempfile.mkdtemp(dir=self.download_dir), use_inotify)
+                found = self.wait_for(watcher, self.patterns, 0.5, ['coll_101_selected_products.csv'])
+                self.assertEqual('coll_101_selected_products.csv', found['101'])
+                self.assertIsNone(found['202'])
+
+    def test_old_files_ignored(self):
+        self.create_file('coll_101_selected_products.csv')
+        watcher = DownloadWatcher(self.download_dir)
+        found = asyncio.run(watcher.wait_for(self.patterns, datetime.now() + timedelta(seconds=1), 0.3))
+        self.assertIsNone(found['101'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from models.DummyDataGenerator import DummyDataGenerator
+
+
+class TestDummyDataGenerator(unittest.TestCase):
+    def test_seed(self):
+        for sample_type in ['cms', 'bank']:
+            with self.subTest(sample_type=sample_type):
+                df = DummyDataGenerator(sample_type, 500, seed=7).df
+                pd.testing.assert_frame_equal(df, DummyDataGenerator(sample_type, 500, seed=7).df)
+                self.assertFalse(df.equals(DummyDataGenerator(sample_type, 500, seed=8).df))
+
+    def test_chunks(self):
+        dg = DummyDataGenerator('bank', 2500, seed=1)
+        dg.CHUNK_SIZE = 1000
+        df = dg.df
+        self.assertEqual(2500, len(df))
+        self.assertTrue(df['product_id'].is_unique)
+        self.assertTrue(df['price'].between(dg.val_ranges['price']['min'], dg.val_ranges['price']['max']).all())
+        self.assertTrue(set(df['cluster']) <= set(dg.val_ranges['cluster']))
+
+    def test_distributions(self):
+        dg = DummyDataGenerator('bank', 5000, seed=1, distributions={'offshore_share': 0.2})
+        offshore_share = (dg.df['seller_type'] == dg.bank_coll.local_to_offshore['offshore']).mean()
+        self.assertAlmostEqual(0.2, offshore_share, delta=0.03)
+
+    def test_save(self):
+        dg = DummyDataGenerator('cms', 300, seed=1)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            f_path = os.path.join(tmp_dir, 'cms.csv')
+            dg.save(f_path)
+            saved_df = pd.read_csv(f_path)
+        self.assertEqual(list(dg.df.columns), list(saved_df.columns))
+        self.assertTrue((dg.df['Product ID'].to_numpy() == saved_df['Product ID'].to_numpy()).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
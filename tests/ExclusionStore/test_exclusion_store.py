@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+import numpy as np
+from models.Collection import BankColl
+from models.ExclusionStore import ExclusionStore
+from tests.helpers import make_bank_df, default_criteria
+
+
+class TestExclusionStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store_dir = os.path.join(self.tmp_dir.name, 'exclusions')
+        self.today = date(2026, 1, 10)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_register_and_expire(self):
+        store = ExclusionStore(self.store_dir)
+        self.assertFalse(store.contains([1, 2]).any())
+
+        store.register([5, 3, 3, 9], date(2026, 1, 20), self.today)
+        store.register(np.array([9, 12]), '2026-01-15', self.today)
+        # 9 keeps the later end date, ids are kept sorted and unique
+        np.testing.assert_array_equal([3, 5, 9, 12], store.arrays[0])
+        self.assertEqual(np.datetime64('2026-01-20'), store.arrays[1][2])
+
+        self.assertEqual([True, True, True, False, False], store.contains([12, 9, '3', 4, 'x'], self.today).tolist())
+        # a collection's ids are excluded until its end date, inclusive
+        self.assertEqual([True, False], store.contains([9, 12], date(2026, 1, 20)).tolist())
+
+        # other instances pick up registered ids, and expired ones are dropped on the next merge
+        other_store = ExclusionStore(self.store_dir)
+        other_store.expire(date(2026, 1, 16))
+        self.assertFalse(store.contains([12], self.today).any())
+        self.assertEqual(3, store.get_version())
+        np.testing.assert_array_equal([3, 5, 9], store.arrays[0])
+        self.assertEqual(3, store.get_active_count(self.today))
+        # only files of the current version are left
+        self.assertEqual(['end_dates_3.npy', 'product_ids_3.npy', 'store.json'], sorted(os.listdir(self.store_dir)))
+
+    def test_exclude_used(self):
+        df = make_bank_df()
+        criteria = default_criteria(exclude_used=True)
+        store = ExclusionStore(self.store_dir)
+
+        first_coll = BankColl(df.copy())
+        first_coll.set_exclusion_store(store)
+        first_coll.process_by_criteria(dict(criteria))
+        used_ids = first_coll.get_column('product_id').to_numpy()
+        store.register(used_ids, date(2099, 1, 1))
+
+        coll = BankColl(df.copy(), view=True)
+        coll.set_exclusion_store(store)
+        coll.process_by_criteria(dict(criteria))
+        self.assertEqual(100, coll.get_df_size())
+        self.assertEqual(0, len(np.intersect1d(used_ids, coll.get_column('product_id').to_numpy())))
+
+        # same as generating from the source without used products
+        unused_coll = BankColl(df[~df['product_id'].isin(used_ids)].copy())
+        unused_coll.process_by_criteria(dict(criteria, exclude_used=False))
+        self.assertEqual(unused_coll.export_for_upload(), coll.export_for_upload())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import gzip
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from models.ExportWriter import ExportWriter
+
+
+class TestExportWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.df = pd.DataFrame({
+            'seller_id': np.array([101, 102, 103, 104], dtype=np.int32),
+            'price': [10.5, np.nan, 1500.0, 1e-7],
+            'ado': np.array([0.1, 0.2, 0.1, 0.1], dtype=np.float32),
+            'cluster': pd.Categorical(['Fashion', None, 'FMCG', 'Fashion']),
+            'seller_type': ['Local', 'Offshore', '', 'a, "quoted" one'],
+            'Offshore Seller': [True, False, False, True]
+        })
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_format_csv_block(self):
+        # same as to_csv, also for blocks with columns only to_csv can format
+        for df in [self.df, self.df.drop(columns='seller_type'), self.df.iloc[:0],
+                   self.df.astype({'seller_id': 'Int64'})]:
+            self.assertEqual(df.to_csv(index=False, header=False), ExportWriter.format_csv_block(df))
+
+    def test_write_upload_and_full(self):
+        for compress in [False, True]:
+            writer = ExportWriter(compress)
+            upload_f_path = os.path.join(self.tmp_dir.name, f'upload_{compress}.csv')
+            full_f_path = os.path.join(self.tmp_dir.name, f'full_{compress}.csv')
+            writer.write_upload_and_full(upload_f_path, self.df['seller_id'].to_numpy(), [201, 202, 203, 204],
+                                         full_f_path, [self.df.iloc[:3], self.df.iloc[3:]])
+
+            open_f = gzip.open if compress else open
+            with open_f(upload_f_path, 'rb') as f:
+                self.assertEqual(['sellerid,productid,stock', '101,201,', '102,202,', '103,203,', '104,204,'],
+                                 f.read().decode().splitlines())
+            with open_f(full_f_path, 'rb') as f:
+                self.assertEqual(self.df.to_csv(index=False).encode(), f.read())
+
+    def test_atomic_write(self):
+        f_path = os.path.join(self.tmp_dir.name, 'upload.csv')
+        writer = ExportWriter()
+        writer.write_upload(f_path, [1], [10])
+
+        # failed write leaves the previous file as it was, without temp files
+        with self.assertRaises(ValueError):
+            writer.write_upload(f_path, [1, 'abc'], [10, 20])
+        self.assertEqual(['upload.csv'], os.listdir(self.tmp_dir.name))
+        self.assertEqual(['1', '10', ''], open(f_path).read().splitlines()[1].split(','))
+
+
+if __name__ == '__main__':
+    unittest.main()
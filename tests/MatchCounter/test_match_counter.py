@@ -0,0 +1,62 @@
+import unittest
+import numpy as np
+import pandas as pd
+from models.Collection import CmsColl, BankColl
+from models.MatchCounter import MatchCounter
+from tests.helpers import make_bank_df, make_cms_df, default_criteria
+
+
+class TestMatchCounter(unittest.TestCase):
+    def setUp(self):
+        self.bank_df = make_bank_df()
+        self.bank_df.loc[:9, 'price'] = np.nan
+        self.cms_df = make_cms_df()
+
+    def assert_counts_filtered_rows(self, coll_cls, df: pd.DataFrame, criteria: dict):
+        coll = coll_cls(df, view=True)
+        coll.build_match_counter()
+        counts = coll.count_matches(criteria)
+
+        filtered_coll = coll_cls(df.copy())
+        filtered_coll.filter_by_criteria(criteria)
+        seller_types = filtered_coll.get_column('seller_type')
+        self.assertEqual({
+            'total': len(seller_types),
+            'local': int((seller_types == coll.local_to_offshore['local']).sum()),
+            'offshore': int((seller_types == coll.local_to_offshore['offshore']).sum())
+        }, counts)
+
+    def test_bank_counts(self):
+        for criteria in [
+            default_criteria(),
+            default_criteria(cluster='Fashion', price_min=100.0, price_max=500.0),
+            default_criteria(cat_id=[1, 2, 'x'], price_min=300.0),
+            # cluster not in source is ignored, same as categories not in the cluster
+            default_criteria(cluster='Unknown', cat_id=[1, 1000]),
+            default_criteria(price_min=700.0, price_max=200.0),
+            # bank sources have no stock, out_of_stock is ignored
+            default_criteria(out_of_stock=True, price_max=250.0)
+        ]:
+            with self.subTest(criteria=criteria):
+                self.assert_counts_filtered_rows(BankColl, self.bank_df, criteria)
+
+    def test_cms_counts(self):
+        for criteria in [
+            default_criteria(out_of_stock=True),
+            default_criteria(out_of_stock=True, price_min=150.0, price_max=150.0),
+            default_criteria(price_max=600.0)
+        ]:
+            with self.subTest(criteria=criteria):
+                self.assert_counts_filtered_rows(CmsColl, self.cms_df, criteria)
+
+    def test_missing_values(self):
+        counter = MatchCounter({'seller_type': pd.Series(['Local', None, 'Offshore', 'Local'])},
+                               pd.Series([10.0, 20.0, np.nan, 30.0]))
+        self.assertEqual({None: 1, 'Local': 2, 'Offshore': 1}, counter.count({}))
+        # NaN prices never match a price band
+        self.assertEqual({None: 1, 'Local': 2, 'Offshore': 0}, counter.count({}, low=0))
+        self.assertEqual({None: 0, 'Local': 1, 'Offshore': 0}, counter.count({'seller_type': ['Local']}, 15, 30))
+
+
+if __name__ == '__main__':
+    unittest.main()
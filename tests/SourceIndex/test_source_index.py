@@ -0,0 +1,45 @@
+import unittest
+import numpy as np
+import pandas as pd
+from models.SourceIndex import SourceIndex
+
+
+class TestSourceIndex(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'cluster': ['Fashion', 'FMCG', None, 'Fashion', 'Electronics', 'FMCG'],
+            'category_id': [1, 2, 2, 3, 1, 1],
+            'seller_type': ['Local', 'Offshore', 'Local', 'Local', 'Offshore', 'Local'],
+            'price': [10.0, 250.5, np.nan, 99.99, 10.0, 500.0]
+        })
+        self.index = SourceIndex({
+            'cluster': self.df['cluster'],
+            'cat_id': self.df['category_id'],
+            'seller_type': self.df['seller_type']
+        }, self.df['price'])
+
+    def test_postings(self):
+        self.assertEqual(['Fashion', 'FMCG', 'Electronics'], self.index.get_values('cluster'))
+        self.assertEqual([0, 3], self.index.get_rows('cluster', ['Fashion']).tolist())
+        self.assertEqual([0, 1, 2, 4, 5], self.index.get_rows('cat_id', [1, 2, 100]).tolist())
+        self.assertEqual([1, 4], self.index.get_rows('seller_type', ['Offshore']).tolist())
+        self.assertEqual([], self.index.get_rows('cluster', ['Not a cluster']).tolist())
+
+    def test_price_rows(self):
+        for low, high in [(10.0, 99.99), (None, 250.5), (100, None), (10.0, 10.0), (None, None), (600, 700)]:
+            mask = pd.Series(True, index=self.df.index)
+            if low is not None:
+                mask &= self.df['price'] >= low
+            if high is not None:
+                mask &= self.df['price'] <= high
+            self.assertEqual(np.flatnonzero(mask).tolist(), self.index.get_price_rows(low, high).tolist())
+
+    def test_intersect(self):
+        fashion_rows = self.index.get_rows('cluster', ['Fashion'])
+        local_rows = self.index.get_rows('seller_type', ['Local'])
+        self.assertEqual([0, 3], SourceIndex.intersect(fashion_rows, local_rows).tolist())
+        self.assertEqual([True, False, True], SourceIndex.contains(np.array([3, 1, 0]), fashion_rows).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import unittest
+import numpy as np
+from models.Collection import CmsColl, BankColl
+from models.SourceProfile import SourceProfile
+from tests.helpers import make_bank_df, make_cms_df
+
+
+class TestSourceProfile(unittest.TestCase):
+    def setUp(self):
+        self.bank_df = make_bank_df()
+        self.cms_df = make_cms_df()
+
+    def test_from_df(self):
+        coll = BankColl(self.bank_df)
+        profile = SourceProfile.from_df(self.bank_df, coll.columns)
+
+        self.assertEqual(2000, profile.rows)
+        self.assertEqual(self.bank_df['cluster'].value_counts().to_dict(), profile.counts['cluster'])
+        self.assertEqual(self.bank_df['category_id'].value_counts().to_dict(), profile.counts['cat_id'])
+        self.assertEqual(list(self.bank_df['cluster'].unique()), list(profile.get_values('cluster')))
+        self.assertEqual(self.bank_df['price'].min(), profile.prices['min'])
+        self.assertEqual(self.bank_df['price'].max(), profile.prices['max'])
+        self.assertAlmostEqual(self.bank_df['price'].median(), profile.prices['quantiles'][0.5])
+        self.assertIsNone(profile.out_of_stock)
+        self.assertTrue(profile.has_value('cat_id', int(self.bank_df['category_id'].iloc[0])))
+        self.assertFalse(profile.has_value('cat_id', -1))
+
+        cms_profile = SourceProfile.from_df(self.cms_df, CmsColl(self.cms_df).columns)
+        self.assertEqual(int((self.cms_df['Stock'] == 0).sum()), cms_profile.out_of_stock)
+        self.assertEqual({False, True}, set(cms_profile.get_values('seller_type')))
+        self.assertFalse(cms_profile.has_key('cluster'))
+
+    def test_to_dict(self):
+        profile = SourceProfile.from_df(self.bank_df, BankColl(self.bank_df).columns)
+        loaded = SourceProfile.from_dict(json.loads(json.dumps(profile.to_dict())))
+        self.assertEqual(profile.counts, loaded.counts)
+        self.assertEqual(profile.prices, loaded.prices)
+        self.assertEqual(profile.get_summary(), loaded.get_summary())
+
+    def test_collection(self):
+        for view in [False, True]:
+            with self.subTest(view=view):
+                coll = BankColl(self.bank_df, view=view)
+                profile = coll.build_profile()
+                self.assertTrue(coll.is_profile_usable('cat_id'))
+                self.assertEqual(list(profile.get_values('cluster')), coll.get_clusters())
+
+                coll.filter_by_cat_allocation([1, 2, 99])
+                self.assertEqual(['Invalid categories: [\'99\'].'], coll.get_messages())
+                self.assertFalse(coll.is_profile_usable('cat_id'))
+                self.assertTrue(np.isin(coll.get_column('cat_id').to_numpy(), [1, 2]).all())
+                # clusters of filtered rows come from the rows again
+                self.assertEqual(list(coll.get_column('cluster').unique()), coll.get_clusters())
+
+
+if __name__ == '__main__':
+    unittest.main()
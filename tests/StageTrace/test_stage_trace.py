@@ -0,0 +1,55 @@
+import tracemalloc
+import unittest
+from models.Collection import BankColl
+from models.StageTrace import StageTrace
+from tests.helpers import make_bank_df, default_criteria
+
+
+class TestStageTrace(unittest.TestCase):
+    def setUp(self):
+        self.bank_df = make_bank_df()
+
+    def test_stage(self):
+        # tracing started by the trace is kept on, it'd slow down every later test
+        if not tracemalloc.is_tracing():
+            self.addCleanup(tracemalloc.stop)
+        trace = StageTrace(trace_alloc=True)
+        with trace.stage('alloc', 10, lambda: 5):
+            values = list(range(100000))
+        with trace.stage('manual', 5) as entry:
+            entry['rows_out'] = 2
+
+        stages = trace.get_stages()
+        self.assertEqual(['alloc', 'manual'], [entry['stage'] for entry in stages])
+        self.assertEqual((10, 5), (stages[0]['rows_in'], stages[0]['rows_out']))
+        self.assertGreater(stages[0]['bytes'], 100000)
+        self.assertEqual(2, stages[1]['rows_out'])
+        self.assertEqual(trace.get_total_wall_s(), sum(entry['wall_s'] for entry in stages))
+
+    def test_process_by_criteria(self):
+        for view in [False, True]:
+            with self.subTest(view=view):
+                coll = BankColl(self.bank_df, view=view)
+                extra_input = {
+                    'seller_id': [123456, 123456],
+                    'product_id': [int(self.bank_df['product_id'].iloc[0]), 1]
+                }
+                trace = coll.process_by_criteria(default_criteria(
+                    cluster='Fashion', cat_id=[1, 2, 3], price_min=100, price_max=900, size_max=50,
+                    extra_input=extra_input))
+
+                stages = trace.get_stages()
+                self.assertIs(trace, coll.get_trace())
+                self.assertEqual('extra_input', stages[0]['stage'])
+                self.assertEqual(['cat_id', 'cluster', 'price'], sorted(entry['stage'] for entry in stages[1:4]))
+                self.assertEqual(['shuffle', 'concat_extra_input', 'truncate'], [entry['stage'] for entry in stages[4:]])
+                # every filter only sees rows left by the previous one
+                for entry, next_entry in zip(stages[1:3], stages[2:4]):
+                    self.assertEqual(entry['rows_out'], next_entry['rows_in'])
+                self.assertLessEqual(stages[4]['rows_out'], stages[4]['rows_in'])
+                self.assertEqual(50, stages[-1]['rows_out'])
+                self.assertEqual(coll.get_total_size(), stages[-1]['rows_out'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from datetime import date
+import numpy as np
+from config import COLL_MAX_SIZE
+from tests.helpers import make_bank_df, make_cms_df
+import batch
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        make_bank_df(300).to_csv(os.path.join(self.tmp_dir.name, 'bank.csv'), index=False)
+        make_cms_df(200).to_csv(os.path.join(self.tmp_dir.name, 'cms.csv'), index=False)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_manifest(self, jobs: list, f_name: str = 'manifest.json'):
+        manifest_f_path = os.path.join(self.tmp_dir.name, f_name)
+        with open(manifest_f_path, 'w') as manifest_f:
+            json.dump({'jobs': jobs}, manifest_f)
+        return manifest_f_path
+
+    def count_rows(self, f_name: str):
+        with open(os.path.join(self.tmp_dir.name, f_name)) as upload_f:
+            return len(upload_f.readlines()) - 1
+
+    def test_load_manifest(self):
+        toml_f_path = os.path.join(self.tmp_dir.name, 'manifest.toml')
+        with open(toml_f_path, 'w') as toml_f:
+            toml_f.write('[[jobs]]\ncoll_id = "1"\nsource = "bank.csv"\noutput = "out/upload_1.csv"\n'
+                         'end_date = "2999-01-01"\n'
+                         '[jobs.criteria]\ncluster = "Fashion"\nextra_input_file = "pinned.csv"\n')
+        json_f_path = self.write_manifest([{
+            'coll_id': '1',
+            'source': 'bank.csv',
+            'output': 'out/upload_1.csv',
+            'end_date': '2999-01-01',
+            'criteria': {'cluster': 'Fashion', 'extra_input_file': 'pinned.csv'}
+        }])
+
+        for manifest_f_path in [toml_f_path, json_f_path]:
+            with self.subTest(manifest=os.path.basename(manifest_f_path)):
+                job = batch.load_manifest(manifest_f_path)[0]
+                # paths are relative to the manifest
+                self.assertEqual(os.path.join(self.tmp_dir.name, 'bank.csv'), job['source'])
+                self.assertEqual(os.path.join(self.tmp_dir.name, 'out/upload_1.csv'), job['output'])
+                self.assertEqual(os.path.join(self.tmp_dir.name, 'pinned.csv'), job['criteria']['extra_input_file'])
+                self.assertEqual(date(2999, 1, 1), job['end_date'])
+
+        for jobs, error in [([], 'No jobs found in manifest'),
+                            ([{'coll_id': '2', 'end_date': '2000-01-01'}], 'Invalid end_date of job 2')]:
+            with self.subTest(error=error):
+                with self.assertRaisesRegex(ValueError, error):
+                    batch.load_manifest(self.write_manifest(jobs))
+
+    def test_get_job_criteria(self):
+        criteria = batch.get_job_criteria({})
+        self.assertEqual(set(batch.DEF_CRITERIA), set(criteria))
+        self.assertEqual(('', '', None), (criteria['price_min'], criteria['price_max'], criteria['cluster']))
+
+        criteria = batch.get_job_criteria({'criteria': {
+            'size_max': COLL_MAX_SIZE + 1,
+            'price_min': '900',
+            'price_max': 100,
+            'extra_input': '123\t45678901\n124\t45678902'
+        }})
+        self.assertEqual(COLL_MAX_SIZE, criteria['size_max'])
+        # switched price points are swapped
+        self.assertEqual((100.0, 900.0), (criteria['price_min'], criteria['price_max']))
+        np.testing.assert_array_equal([45678901, 45678902], criteria['extra_input']['product_id'])
+
+        with self.assertRaisesRegex(ValueError, 'No seller and product id pairs found in extra_input'):
+            batch.get_job_criteria({'criteria': {'extra_input': 'seller\tproduct'}})
+
+    def test_run_batch(self):
+        make_bank_df(300, seed=2).to_csv(os.path.join(self.tmp_dir.name, 'bank_f.csv'), index=False)
+        manifest_f_path = self.write_manifest([
+            # jobs sharing a source are generated together, the job with invalid criteria fails alone
+            {'coll_id': 'a', 'source': 'bank.csv', 'output': 'upload_a.csv',
+             'criteria': {'sort_first': 'ado', 'size_max': 50}},
+            {'coll_id': 'b', 'source': 'bank.csv', 'output': 'upload_b.csv', 'full_output': 'full_b.csv',
+             'criteria': {'cluster': 'Fashion', 'ratio': {'local': 1, 'offshore': 1}, 'size_max': 20}},
+            {'coll_id': 'c', 'source': 'bank.csv', 'output': 'upload_c.csv', 'criteria': {'size_max': 'abc'}},
+            # a source of a single job is streamed with its filters pushed down
+            {'coll_id': 'd', 'source': 'cms.csv', 'output': 'upload_d.csv',
+             'criteria': {'out_of_stock': True, 'price_min': 500, 'size_max': 30}},
+            {'coll_id': 'f', 'source': 'bank_f.csv', 'output': 'upload_f.csv',
+             'criteria': {'cluster': 'Fashion', 'size_max': 30}},
+            {'coll_id': 'e', 'source': 'missing.csv', 'output': 'upload_e.csv'}
+        ])
+
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            results, totals = batch.run_batch(batch.load_manifest(manifest_f_path),
+                                              cache_dir=os.path.join(self.tmp_dir.name, 'cache'))
+        self.assertEqual([('a', True), ('b', True), ('c', False), ('d', True), ('f', True), ('e', False)], results)
+        self.assertIn('Job c: Failure in collection generation process.', stdout.getvalue())
+        self.assertIn('Job e: Error while selecting/opening source file.', stdout.getvalue())
+
+        self.assertEqual((4, 2), (totals['collections'], totals['failed']))
+        self.assertEqual(50, self.count_rows('upload_a.csv'))
+        self.assertEqual(20, self.count_rows('upload_b.csv'))
+        self.assertEqual(20, self.count_rows('full_b.csv'))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir.name, 'upload_c.csv')))
+        self.assertEqual(totals['rows'], 50 + 20 + self.count_rows('upload_d.csv') + 30)
+        # throughput counts all rows of streamed sources, not only the ones passing their filters
+        self.assertEqual(300 * 2 + 200 + 300, totals['src_rows'])
+
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            batch.print_summary(totals)
+        self.assertIn('Generated 4 collection(s), 2 failed', stdout.getvalue())
+
+    def test_main(self):
+        manifest_f_path = self.write_manifest([
+            {'coll_id': 'a', 'source': 'bank.csv', 'output': 'upload_a.csv', 'end_date': '2999-01-01',
+             'criteria': {'size_max': 10}},
+            {'coll_id': 'b', 'source': 'bank.csv', 'output': 'upload_b.csv',
+             'criteria': {'exclude_used': True, 'size_max': 10}}
+        ])
+        exclusions_dir = os.path.join(self.tmp_dir.name, 'exclusions')
+        history_dir = os.path.join(self.tmp_dir.name, 'history')
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(0, batch.main([manifest_f_path, '--exclusions', exclusions_dir, '--history', history_dir,
+                                            '--cache', os.path.join(self.tmp_dir.name, 'cache'), '--trace']))
+            self.assertEqual(2, batch.main([os.path.join(self.tmp_dir.name, 'missing.json')]))
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp_dir.name, 'upload_a_trace.json')))
+        self.assertEqual(2, len(os.listdir(os.path.join(history_dir, 'collections'))))
+        self.assertTrue(os.listdir(exclusions_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import sys
+import numpy as np
+from models.DummyDataGenerator import DummyDataGenerator
+
+# app modules import each other the way they're run, as scripts from the app directory
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+if APP_DIR not in sys.path:
+    sys.path.append(APP_DIR)
+
+
+# bank source typed the way validate_src loads it
+def make_bank_df(size: int = 2000, seed: int = 1):
+    return DummyDataGenerator('bank', size, seed=seed).df.astype({'seller_id': np.int32, 'rating': np.int8})
+
+
+def make_cms_df(size: int = 2000, seed: int = 1):
+    return DummyDataGenerator('cms', size, seed=seed).df
+
+
+# same shape as App.get_all_criteria, tests override only keys they exercise
+def default_criteria(**overrides):
+    criteria = {
+        'size_max': 100,
+        'size_min': None,
+        'extra_input': '',
+        'cluster': None,
+        'cat_id': None,
+        'price_min': '',
+        'price_max': '',
+        'sort_first': 'ado',
+        'sort_next': '',
+        'ratio': {'local': 3, 'offshore': 2},
+        'interleave': None,
+        'max_per_seller': None,
+        'exclude_used': False,
+        'out_of_stock': False
+    }
+    criteria.update(overrides)
+    return criteria
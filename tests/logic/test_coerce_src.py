@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from tests.helpers import make_bank_df, make_cms_df
+import logic
+
+
+class TestCoerceSrc(unittest.TestCase):
+    def test_schema_dtypes(self):
+        expected_dtypes = {
+            'bank': ['int32', 'int32', 'float64', 'float32', 'float32', 'int32', 'category', 'int32', 'category'],
+            'cms': ['int32', 'int32', 'float64', 'float64', 'float32', 'int32', 'int32', 'bool']
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for src_type, df in [('bank', make_bank_df(300)), ('cms', make_cms_df(300))]:
+                with self.subTest(src_type=src_type):
+                    src_f_path = os.path.join(tmp_dir, f'{src_type}.csv')
+                    df.to_csv(src_f_path, index=False)
+                    report = {}
+                    read_type, typed_df = logic.validate_src(src_f_path, use_cache=False, report=report)
+
+                    self.assertEqual(src_type, read_type)
+                    self.assertEqual(expected_dtypes[src_type], [str(dtype) for dtype in typed_df.dtypes])
+                    self.assertEqual([], report['failed'])
+                    self.assertLess(report['bytes_after'], report['bytes_before'])
+
+    def test_coerce_column(self):
+        int64_max = np.iinfo(np.int64).max
+        for values, kind, dtype, expected in [
+            (['1', '2'], 'int', 'int32', [1, 2]),
+            ([1, 2 ** 31], 'int', 'int64', [1, 2 ** 31]),
+            ([1, int64_max], 'int', 'int64', [1, int64_max]),
+            (['1,299.50', '15', 7], 'price', 'float64', [1299.5, 15.0, 7.0]),
+            ([4.5, 3.25], 'metric', 'float32', [4.5, 3.25]),
+            # whole number metrics are ints
+            ([4, 5], 'metric', 'int32', [4, 5]),
+            (['Local', 'Offshore', 'Local'], 'label', 'category', ['Local', 'Offshore', 'Local']),
+            (['True', 'false', ' 1', '0'], 'flag', 'bool', [True, False, True, False]),
+            ([True, False], 'flag', 'bool', [True, False])
+        ]:
+            with self.subTest(values=values, kind=kind):
+                column = logic.coerce_column(pd.Series(values, name='col'), kind)
+                self.assertEqual(dtype, str(column.dtype))
+                self.assertEqual(expected, column.tolist())
+
+    def test_bad_values(self):
+        df = make_bank_df(20)
+        df = df.astype({'seller_id': float, 'ado': object, 'rating': object, 'category_id': object})
+        # missing values can't be stored in int columns, they stay floats
+        df.loc[df.index[3], 'seller_id'] = np.nan
+        df.loc[df.index[4], 'ado'] = 'n/a'
+        df.loc[df.index[5], 'rating'] = 'five'
+        df.loc[df.index[6], 'category_id'] = '12x'
+
+        typed_df, report = logic.coerce_src(df, 'bank')
+        self.assertEqual(['ado', 'category_id', 'rating'], sorted(report['failed']))
+        self.assertEqual(np.float64, typed_df['seller_id'].dtype)
+        self.assertTrue(np.isnan(typed_df['seller_id'].iloc[3]))
+        # columns that can't be typed are left as read
+        for col in report['failed']:
+            pd.testing.assert_series_equal(df[col], typed_df[col])
+        self.assertEqual(['int32', 'float64', 'float32', 'category'],
+                         [str(typed_df[col].dtype) for col in ['product_id', 'price', 'discount', 'cluster']])
+
+        df = make_cms_df(20)
+        df['Offshore Seller'] = df['Offshore Seller'].astype(object)
+        df.loc[df.index[2], 'Offshore Seller'] = 'maybe'
+        typed_df, report = logic.coerce_src(df, 'cms')
+        self.assertEqual(['Offshore Seller'], report['failed'])
+        self.assertEqual(object, typed_df['Offshore Seller'].dtype)
+
+    def test_untyped_reported(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            df = make_bank_df(50).astype({'rating': object})
+            df.loc[df.index[7], 'rating'] = 'five'
+            src_f_path = os.path.join(tmp_dir, 'bank.csv')
+            df.to_csv(src_f_path, index=False)
+
+            report = {}
+            src_type, typed_df = logic.validate_src(src_f_path, use_cache=False, report=report)
+            self.assertEqual('bank', src_type)
+            self.assertEqual(["Columns left untyped: ['rating']."], report['messages'])
+            self.assertTrue(logic.get_typing_summary(report).startswith('Source typed, memory: '))
+
+
+if __name__ == '__main__':
+    unittest.main()
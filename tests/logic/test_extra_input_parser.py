@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import tests.helpers  # app/ on the module path
+import logic
+
+
+class TestExtraInputParser(unittest.TestCase):
+    def assert_pairs(self, pairs: dict, seller_ids: list, product_ids: list):
+        self.assertEqual(seller_ids, pairs['seller_id'].tolist())
+        self.assertEqual(product_ids, pairs['product_id'].tolist())
+        self.assertEqual((np.int64, np.int64), (pairs['seller_id'].dtype, pairs['product_id'].dtype))
+
+    def test_pairs(self):
+        # longer id is the product id, in either column, fields after the second one are ignored
+        self.assert_pairs(logic.validate_extra_input('123\t45678901\n45678902\t124\n125\t45678903\textra'),
+                          [123, 124, 125], [45678901, 45678902, 45678903])
+
+    def test_skipped_lines(self):
+        extra_input = ('seller_id\tproduct_id\r\n'
+                       '\r\n'
+                       '123\t45678901\r\n'
+                       'see below:\n'
+                       '\n'
+                       '12a\t45678902\n'
+                       '124\t\n'
+                       '\t45678903\n'
+                       '125 45678904\n'
+                       ' 126\t45678905\n'
+                       '127\t45678906\r\n')
+        self.assert_pairs(logic.validate_extra_input(extra_input), [123, 127], [45678901, 45678906])
+
+    def test_equal_lengths(self):
+        # product id can't be told from seller id by length
+        self.assert_pairs(logic.validate_extra_input('1234\t5678\n123\t45678\n0123\t4567'), [123], [45678])
+
+        messages = []
+        self.assertIsNone(logic.validate_extra_input('1234\t5678\n0123\t4567\n', messages=messages))
+        self.assertEqual(1, len(messages))
+        self.assertTrue(messages[0].startswith('None of 2 line(s) has a seller and a product id of different '
+                                               'lengths, separated by tab'))
+
+    def test_int64_range(self):
+        # leading zeros count for telling ids apart, not for the value, so padded ids of any length are read
+        int64_max = np.iinfo(np.int64).max
+        extra_input = ('00000000000000000000001\t123\n'
+                       f'1\t{int64_max}\n'
+                       f'2\t{int64_max + 1}\n'
+                       f'3\t{"9" * 25}\n'
+                       f'4\t0000{int64_max}\n')
+        self.assert_pairs(logic.validate_extra_input(extra_input), [123, 1, 4], [1, int64_max, int64_max])
+
+    def test_not_text(self):
+        messages = []
+        self.assertIsNone(logic.validate_extra_input(None, messages=messages))
+        self.assertEqual(['No extra input text given.'], messages)
+        self.assertIsNone(logic.validate_extra_input(''))
+
+    def test_extra_input_f(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_f_path = os.path.join(tmp_dir, 'pairs.csv')
+            with open(csv_f_path, 'w', newline='') as csv_f:
+                csv_f.write('seller_id,product_id\r\n123,45678901\r\n45678902,124\r\n')
+            self.assert_pairs(logic.validate_extra_input_f(csv_f_path), [123, 124], [45678901, 45678902])
+
+            # tab separated .csv, as saved from a spreadsheet, and any other text file
+            for f_name in ['tabs.csv', 'pairs.txt']:
+                txt_f_path = os.path.join(tmp_dir, f_name)
+                with open(txt_f_path, 'w') as txt_f:
+                    txt_f.write('123\t45678901\n124\t45678902')
+                with self.subTest(f_name=f_name):
+                    self.assert_pairs(logic.validate_extra_input_f(txt_f_path), [123, 124], [45678901, 45678902])
+
+            messages = []
+            self.assertIsNone(logic.validate_extra_input_f(os.path.join(tmp_dir, 'missing.csv'), messages=messages))
+            self.assertTrue(messages[0].startswith('Failed to read extra input file:'))
+
+            messages = []
+            with open(csv_f_path, 'w') as csv_f:
+                csv_f.write('seller_id,product_id\n1234,5678\n')
+            self.assertIsNone(logic.validate_extra_input_f(csv_f_path, messages=messages))
+            self.assertIn("separated by ','", messages[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
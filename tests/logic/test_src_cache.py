@@ -0,0 +1,127 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from tests.helpers import make_bank_df, make_cms_df
+import logic
+
+
+class TestSrcCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp_dir.name, 'cache')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_src(self, df, f_name: str):
+        src_f_path = os.path.join(self.tmp_dir.name, f_name)
+        df.to_csv(src_f_path, index=False)
+        return src_f_path
+
+    def test_round_trip(self):
+        for src_type, df in [('bank', make_bank_df(300)), ('cms', make_cms_df(300))]:
+            with self.subTest(src_type=src_type):
+                src_f_path = self.write_src(df, f'{src_type}.csv')
+                parsed_type, parsed_df = logic.validate_src(src_f_path, use_cache=False)
+                self.assertTrue(logic.store_cached_src(src_f_path, parsed_type, parsed_df, self.cache_dir))
+
+                cached_type, cached_df = logic.load_cached_src(src_f_path, self.cache_dir)
+                self.assertEqual(src_type, cached_type)
+                # same values and dtypes, categorical columns included
+                pd.testing.assert_frame_equal(parsed_df.reset_index(drop=True), cached_df)
+
+    def test_loaded_from_cache(self):
+        src_f_path = self.write_src(make_bank_df(300), 'bank.csv')
+        src_type, parsed_df = logic.validate_src(src_f_path, cache_dir=self.cache_dir)
+        self.assertIsNotNone(logic.load_cached_src(src_f_path, self.cache_dir))
+
+        report = {}
+        src_type, cached_df = logic.validate_src(src_f_path, cache_dir=self.cache_dir, report=report)
+        pd.testing.assert_frame_equal(parsed_df.reset_index(drop=True), cached_df)
+        # cached source is already typed
+        self.assertEqual([], report['messages'])
+        self.assertEqual(report['bytes_before'], report['bytes_after'])
+
+    def test_invalidated(self):
+        src_f_path = self.write_src(make_bank_df(300), 'bank.csv')
+        src_type, df = logic.validate_src(src_f_path, use_cache=False)
+        logic.store_cached_src(src_f_path, src_type, df, self.cache_dir)
+        key = logic.get_src_cache_key(src_f_path)
+        f_stat = os.stat(src_f_path)
+
+        # same size and mtime, other content, as a file rewritten within the same second
+        with open(src_f_path, 'r+b') as src_f:
+            src_f.seek(-3, os.SEEK_END)
+            src_f.write(b'999')
+        os.utime(src_f_path, ns=(f_stat.st_atime_ns, f_stat.st_mtime_ns))
+        self.assertNotEqual(key, logic.get_src_cache_key(src_f_path))
+        self.assertIsNone(logic.load_cached_src(src_f_path, self.cache_dir))
+
+        for change in ['mtime', 'size']:
+            with self.subTest(change=change):
+                src_type, df = logic.validate_src(src_f_path, use_cache=False)
+                logic.store_cached_src(src_f_path, src_type, df, self.cache_dir)
+                self.assertIsNotNone(logic.load_cached_src(src_f_path, self.cache_dir))
+                if change == 'mtime':
+                    os.utime(src_f_path, ns=(f_stat.st_atime_ns, f_stat.st_mtime_ns + 10 ** 9))
+                else:
+                    with open(src_f_path, 'a') as src_f:
+                        src_f.write('\n')
+                self.assertIsNone(logic.load_cached_src(src_f_path, self.cache_dir))
+
+    def test_lru_eviction(self):
+        src_f_paths = [self.write_src(make_bank_df(200, seed), f'bank_{seed}.csv') for seed in range(3)]
+        src_type, df = logic.validate_src(src_f_paths[0], use_cache=False)
+        entry_bytes = sum(arr.nbytes for col in df.columns for arr in logic.get_cache_column_arrays(df[col]).values())
+        # room for 2 sources
+        max_bytes = entry_bytes * 2 + entry_bytes // 2
+
+        for src_f_path in src_f_paths[:2]:
+            src_type, df = logic.validate_src(src_f_path, use_cache=False)
+            self.assertTrue(logic.store_cached_src(src_f_path, src_type, df, self.cache_dir, max_bytes))
+        # first source used last, so second one is evicted for the third
+        self.assertIsNotNone(logic.load_cached_src(src_f_paths[0], self.cache_dir))
+        src_type, df = logic.validate_src(src_f_paths[2], use_cache=False)
+        self.assertTrue(logic.store_cached_src(src_f_paths[2], src_type, df, self.cache_dir, max_bytes))
+
+        self.assertEqual([True, False, True],
+                         [logic.load_cached_src(src_f_path, self.cache_dir) is not None for src_f_path in src_f_paths])
+        index = logic.read_src_cache_index(self.cache_dir)
+        self.assertEqual(2, len(index))
+        entry_keys = [f_name for f_name in os.listdir(self.cache_dir) if f_name != 'index.json']
+        self.assertEqual(sorted(index), sorted(entry_keys))
+
+        # source bigger than the whole cache isn't stored
+        self.assertFalse(logic.store_cached_src(src_f_paths[1], src_type, df, self.cache_dir, entry_bytes // 2))
+
+    def test_corrupt_entry(self):
+        src_f_path = self.write_src(make_bank_df(300), 'bank.csv')
+        src_type, parsed_df = logic.validate_src(src_f_path, cache_dir=self.cache_dir)
+        entry_dir = os.path.join(self.cache_dir, logic.get_src_cache_key(src_f_path))
+
+        for corruption in ['truncated column', 'missing column', 'missing meta']:
+            with self.subTest(corruption=corruption):
+                if corruption == 'truncated column':
+                    with open(os.path.join(entry_dir, '2.npy'), 'r+b') as column_f:
+                        column_f.truncate(100)
+                elif corruption == 'missing column':
+                    os.remove(os.path.join(entry_dir, '6.npy'))
+                else:
+                    os.remove(os.path.join(entry_dir, 'meta.json'))
+
+                messages = []
+                self.assertIsNone(logic.load_cached_src(src_f_path, self.cache_dir, messages))
+                self.assertTrue(messages[0].startswith('Source cache read failed.'))
+
+                # source is parsed from the file instead, and its entry written again
+                report = {}
+                src_type, df = logic.validate_src(src_f_path, cache_dir=self.cache_dir, report=report)
+                self.assertEqual('bank', src_type)
+                pd.testing.assert_frame_equal(parsed_df, df)
+                self.assertTrue(report['messages'][0].startswith('Source cache read failed.'))
+                self.assertIsNotNone(logic.load_cached_src(src_f_path, self.cache_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import random
+import tempfile
+import unittest
+from models.Collection import CmsColl, BankColl
+from tests.helpers import make_bank_df, make_cms_df, default_criteria
+import logic
+
+
+class TestStreamSrc(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_src(self, df, f_name: str):
+        src_f_path = os.path.join(self.tmp_dir.name, f_name)
+        df.to_csv(src_f_path, index=False)
+        return src_f_path
+
+    # product ids and messages of a collection generated from the source streamed with criteria pushed down and
+    # from the whole source loaded
+    @staticmethod
+    def generate(src_f_path: str, criteria: dict, stream: bool):
+        src_type, df = logic.validate_src(src_f_path, criteria=criteria if stream else None, chunk_size=70,
+                                          use_cache=False)
+        coll = (CmsColl if src_type == 'cms' else BankColl)(df)
+        coll.process_by_criteria(criteria)
+        return coll.get_column_values('product_id'), coll.get_messages()
+
+    def test_pushdown_same_as_full_load(self):
+        src_df = make_bank_df(400)
+        src_f_path = self.write_src(src_df, 'bank.csv')
+        clusters = list(src_df['cluster'].unique()) + ['Nope']
+        cats = [str(val) for val in src_df['category_id'].unique()] + ['1', 'abc']
+        product_ids = src_df['product_id'].tolist()
+        rnd = random.Random(3)
+
+        # prices as validate_price_points leaves them. Fixed cases of messages that differed: price band leaving no
+        # rows, categories all outside the band
+        criteria_list = [default_criteria(cluster=clusters[0], price_min=5000.0),
+                         default_criteria(cat_id=cats[:2], price_min=990.0, price_max=991.0)]
+        for _ in range(40):
+            price_min = rnd.choice(['', 100.0, 500.0, 998.0])
+            criteria_list.append(default_criteria(
+                cluster=rnd.choice([None] + clusters),
+                cat_id=rnd.choice([None, rnd.sample(cats, 2), rnd.sample(cats, 4)]),
+                price_min=price_min,
+                price_max=rnd.choice(['', 600.0, 999.0]) if price_min != 998.0 else 999.0,
+                extra_input=rnd.choice(['', {'seller_id': [1], 'product_id': [product_ids[rnd.randrange(400)]]}]),
+                size_max=50))
+
+        for criteria in criteria_list:
+            with self.subTest(criteria={key: criteria[key] for key in ['cluster', 'cat_id', 'price_min', 'price_max']}):
+                self.assertEqual(self.generate(src_f_path, criteria, False), self.generate(src_f_path, criteria, True))
+
+    def test_pushdown_out_of_stock(self):
+        src_df = make_cms_df(300)
+        src_df.loc[src_df.index[::3], 'Stock'] = 0
+        src_f_path = self.write_src(src_df, 'cms.csv')
+
+        for price_min in ['', 500.0, 5000.0]:
+            criteria = default_criteria(out_of_stock=True, price_min=price_min, size_max=40)
+            with self.subTest(price_min=price_min):
+                streamed_type, streamed_df = logic.validate_src(src_f_path, criteria=criteria, chunk_size=70)
+                self.assertEqual(('cms', 200), (streamed_type, len(streamed_df)))
+                self.assertEqual(self.generate(src_f_path, criteria, False), self.generate(src_f_path, criteria, True))
+
+    def test_src_rejected(self):
+        src_f_path = self.write_src(make_bank_df(10).drop(columns=['rating']), 'bank.csv')
+        src_type, df = logic.validate_src(src_f_path, criteria=default_criteria())
+        self.assertIsNone(df)
+        self.assertTrue(src_type.startswith('Invalid source column headers.'))
+
+
+if __name__ == '__main__':
+    unittest.main()